@@ -0,0 +1,267 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cache import AnalysisCache
+from disk_cache import DiskCache, default_cache_dir
+from engine import ANALYSES, ANALYZER_VERSION, AnalysisEngine
+from export import TOKEN_FILE_EXTENSION
+from metrics import RunMetrics
+from preprocessor import Preprocessor
+from validator import DEFAULT_MAX_ERRORS, snippets
+
+# File extensions picked up when a directory is given
+C_EXTENSIONS = ('.c', '.h')
+
+# File extension of each --export-format
+EXPORT_EXTENSIONS = {'jsonl': '.jsonl', 'tokens': TOKEN_FILE_EXTENSION}
+
+# Engine instance owned by each worker process
+_worker_engine = None
+
+
+def collect_files(patterns):
+    """Expand directories and glob patterns into a sorted list of C files"""
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for dirpath, _, filenames in os.walk(pattern):
+                for name in filenames:
+                    if name.endswith(C_EXTENSIONS):
+                        files.add(os.path.join(dirpath, name))
+        else:
+            for path in glob.glob(pattern, recursive=True):
+                if os.path.isfile(path):
+                    files.add(path)
+    return sorted(files)
+
+
+def read_source(path):
+    """Read a source file, replacing undecodable bytes"""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def export_errors(result, code):
+    """Replace the Diagnostics of an analyze_source result by JSON-ready dicts"""
+    result['truncated'] = result['errors'].truncated
+    result['errors'] = [
+        dict(error.as_dict(), code=source_line)
+        for error, source_line in snippets(code, result['errors'])
+    ]
+    return result
+
+
+def export_path(directory, path, extension):
+    """Return where the export of source path goes, mirroring its path under directory"""
+    relative = os.path.relpath(path)
+    if relative.startswith(os.pardir):
+        relative = os.path.splitdrive(os.path.abspath(path))[1].lstrip(os.sep)
+    return os.path.join(directory, relative + extension)
+
+
+def analyze_file(path, analyses=ANALYSES, engine=None, instrument=None, export=None):
+    """Analyze one file and return a JSON-serializable result dict
+
+    export, a (directory, extension) pair, also streams the file's results
+    there with AnalysisEngine.export_report.
+    """
+    engine = engine or AnalysisEngine()
+    # instrument holds RunMetrics options; the result then gains 'metrics'
+    metrics = RunMetrics(path, **instrument) if instrument is not None else None
+    try:
+        if metrics is None:
+            code = read_source(path)
+            result = engine.analyze_source(code, analyses, path=path)
+        else:
+            with metrics:
+                with metrics.phase('read'):
+                    code = read_source(path)
+                result = engine.analyze_source(code, analyses, metrics, path)
+        if export is not None:
+            target = export_path(export[0], path, export[1])
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            engine.export_report(code, target)
+            result['export'] = target
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+    result['path'] = path
+    export_errors(result, code)
+    if metrics is not None:
+        result['metrics'] = metrics.as_dict()
+    return result
+
+
+def make_engine(cache_dir=None, lex_workers=1, max_errors=DEFAULT_MAX_ERRORS, preprocess=None):
+    """Create an engine, backed by the persistent cache in cache_dir if given
+
+    preprocess holds Preprocessor options (include_dirs, defines); the
+    engine then preprocesses every source, sharing header caches across files.
+    """
+    preprocessor = Preprocessor(**preprocess) if preprocess is not None else None
+    cache = None
+    if cache_dir is not None:
+        cache = AnalysisCache(store=DiskCache(cache_dir, ANALYZER_VERSION))
+    return AnalysisEngine(cache=cache, lex_workers=lex_workers, max_errors=max_errors,
+                          preprocessor=preprocessor)
+
+
+def _init_worker(cache_dir, max_errors, preprocess=None):
+    """Create the engine once per worker process"""
+    global _worker_engine
+    _worker_engine = make_engine(cache_dir, max_errors=max_errors, preprocess=preprocess)
+
+
+def _analyze_chunk(paths, analyses, instrument, export):
+    """Analyze a chunk of files inside a worker process"""
+    return [analyze_file(path, analyses, _worker_engine, instrument, export) for path in paths]
+
+
+def analyze_files(paths, analyses=ANALYSES, workers=None, chunksize=8, instrument=None,
+                  lex_workers=1, cache_dir=None, max_errors=DEFAULT_MAX_ERRORS, preprocess=None,
+                  export=None):
+    """Yield per-file results as soon as each chunk of files finishes"""
+    if workers == 1:
+        # Only a serial run is free to lex one large file in parallel
+        engine = make_engine(cache_dir, lex_workers, max_errors, preprocess)
+        for path in paths:
+            yield analyze_file(path, analyses, engine, instrument, export)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache_dir, max_errors, preprocess)) as pool:
+        futures = [
+            pool.submit(_analyze_chunk, paths[i:i + chunksize], analyses, instrument, export)
+            for i in range(0, len(paths), chunksize)
+        ]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def _format_metrics(metrics):
+    """Render exported run metrics as one line"""
+    parts = [f"{phase['name']} {phase['wall_seconds'] * 1000:.1f} ms" for phase in metrics['phases']]
+    parts.extend(f"{amount} {name}" for name, amount in metrics['counters'].items())
+    if metrics['peak_bytes'] is not None:
+        parts.append(f"peak {metrics['peak_bytes'] / (1024 * 1024):.1f} MB")
+    return ", ".join(parts)
+
+
+def format_error(error):
+    """Render one exported diagnostic as one line"""
+    text = f"Line {error['line']}: {error['message']}"
+    if error['repeats']:
+        text += f" (and {error['repeats']} more through line {error['last_line']})"
+    return text
+
+
+def format_result(result):
+    """Render one file result as human-readable text"""
+    if 'error' in result:
+        return f"{result['path']}: analysis failed: {result['error']}"
+    errors = result['errors']
+    if errors:
+        lines = [f"{result['path']}: {len(errors)} syntax error(s)"]
+        if 'metrics' in result:
+            lines.append(f"  metrics: {_format_metrics(result['metrics'])}")
+        for error in errors:
+            lines.append(f"  {format_error(error)}")
+        if result.get('truncated'):
+            lines.append(f"  stopped after {len(errors)} errors")
+        if 'export' in result:
+            lines.append(f"  exported to {result['export']}")
+        return "\n".join(lines)
+
+    lines = [f"{result['path']}: OK"]
+    if 'metrics' in result:
+        lines.append(f"  metrics: {_format_metrics(result['metrics'])}")
+    if 'tokens' in result:
+        lines.append(f"  {len(result['tokens'])} tokens")
+    if 'syntax_tree' in result:
+        lines.append(f"  {len(result['syntax_tree'].splitlines())} syntax tree nodes")
+    if 'grammar' in result:
+        lines.extend(f"  {rule}" for rule in result['grammar'].split("\n"))
+    if 'preprocessor' in result:
+        summary = result['preprocessor']
+        lines.append(f"  preprocessed: {summary['tokens']} tokens, {summary['macros']} macros, "
+                     f"{len(summary['includes'])} header(s) included")
+        lines.extend(f"  missing include {missing}" for missing in summary['missing'])
+        lines.extend(f"  {error}" for error in summary['errors'])
+    if 'export' in result:
+        lines.append(f"  exported to {result['export']}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze C sources without the GUI")
+    parser.add_argument('paths', nargs='+', help="files, directories or glob patterns")
+    parser.add_argument('-a', '--analysis', action='append', choices=ANALYSES,
+                        help="analysis to run (repeatable, default: all)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes (default: CPU count, 1 disables the pool)")
+    parser.add_argument('--chunksize', type=int, default=8,
+                        help="files handed to a worker at a time")
+    parser.add_argument('--lex-workers', type=int, default=1,
+                        help="with -j 1, processes lexing each large file in parallel (0: CPU count)")
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                        help="directory of the persistent result cache")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="do not read or write the persistent cache")
+    parser.add_argument('--max-errors', type=int, default=DEFAULT_MAX_ERRORS,
+                        help="distinct syntax errors reported per file before stopping (0: all)")
+    parser.add_argument('-I', '--include-dir', action='append', default=[],
+                        help="preprocess, searching this directory for #includes (repeatable)")
+    parser.add_argument('-D', '--define', action='append', default=[],
+                        help="preprocess with NAME or NAME=VALUE predefined (repeatable)")
+    parser.add_argument('--preprocess', action='store_true',
+                        help="expand #includes, macros and conditionals (implied by -I and -D)")
+    parser.add_argument('--export', metavar='DIR', default=None,
+                        help="also stream each file's tokens, diagnostics and grammar facts under DIR")
+    parser.add_argument('--export-format', choices=sorted(EXPORT_EXTENSIONS), default='jsonl',
+                        help="JSON lines, or binary token files (default: jsonl)")
+    parser.add_argument('--json', action='store_true',
+                        help="emit one JSON object per file")
+    parser.add_argument('--metrics', action='store_true',
+                        help="record per-phase timings and counters for each file")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="with --metrics, record peak allocations (slower)")
+    parser.add_argument('--profile', action='store_true',
+                        help="with --metrics, capture a cProfile listing per file")
+    args = parser.parse_args(argv)
+
+    paths = collect_files(args.paths)
+    if not paths:
+        print("No C files found.", file=sys.stderr)
+        return 2
+
+    analyses = tuple(args.analysis or ANALYSES)
+    instrument = None
+    if args.metrics or args.trace_memory or args.profile:
+        instrument = {'track_memory': args.trace_memory, 'profile': args.profile}
+    preprocess = None
+    if args.preprocess or args.include_dir or args.define:
+        preprocess = {'include_dirs': args.include_dir, 'defines': args.define}
+    export = None
+    if args.export is not None:
+        export = (args.export, EXPORT_EXTENSIONS[args.export_format])
+    failed = 0
+    results = analyze_files(paths, analyses, args.workers, max(1, args.chunksize), instrument,
+                            args.lex_workers or None, None if args.no_cache else args.cache_dir,
+                            args.max_errors or None, preprocess,
+                            export)
+    for result in results:
+        if result.get('error') or result.get('errors'):
+            failed += 1
+        if args.json:
+            print(json.dumps(result, default=list), flush=True)
+        else:
+            print(format_result(result), flush=True)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+import argparse
+import json
+import math
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+import corpus
+import scanner
+from engine import AnalysisEngine
+
+# Analysis stages timed by the benchmark, as engine method names
+STAGES = {
+    'tokenize': 'tokenize_c_code',
+    'validate': 'validate_syntax',
+    'syntax_tree': 'build_c_syntax_tree',
+    'grammar': 'analyze_c_grammar',
+}
+
+DEFAULT_SIZES = '1K,10K,100K,1M'
+
+# Speedup over reference_tokenize a stage must reach on the same input,
+# timed in the same run; a run below it fails
+TARGETS = {
+    'tokenize': scanner.TARGET_SPEEDUP,
+}
+
+# Smaller inputs mostly time per-call overhead and are not held to TARGETS
+TARGET_MIN_CHARS = 100 * 1024
+
+# Fewest timing rounds a comparison against TARGETS is decided on, whatever
+# --repeat says, so one slow round cannot fail a run
+TARGET_MIN_ROUNDS = 7
+
+# The C operators reference_tokenize knew
+_REFERENCE_OPERATORS = frozenset({
+    '+', '-', '*', '/', '%', '++', '--', '=', '+=', '-=', '*=', '/=', '%=',
+    '==', '!=', '>', '<', '>=', '<=', '&&', '||', '!', '&', '|', '^', '~',
+    '<<', '>>', '->', '.', '?', ':', ';', ',', '(', ')', '[', ']', '{', '}'
+})
+
+# Where --save-baseline writes and --baseline reads stored results
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# Fraction of baseline throughput a stage may lose before the run fails
+DEFAULT_TOLERANCE = 0.25
+
+# Each timing repeats the call until it has run at least this long, so
+# small inputs are not dominated by timer resolution
+MIN_TIMING_SECONDS = 0.05
+
+
+def reference_tokenize(code):
+    """The line-by-line tokenizer the scanner replaced, kept as it was to be
+    the yardstick for TARGETS
+
+    It splits each line with findall and classifies every word in Python,
+    and it skips what it cannot tokenize (block comment bodies, most of a
+    directive), so it does less work than the scanner.
+    """
+    tokens = []
+    for line in code.split('\n'):
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped.startswith('#'):
+            tokens.append(('PREPROCESSOR', stripped))
+            continue
+        if '//' in line:
+            comment_start = line.find('//')
+            if line[:comment_start].strip():
+                _reference_words(line[:comment_start], tokens)
+            tokens.append(('COMMENT', line[comment_start:]))
+            continue
+        if '/*' in line:
+            tokens.append(('COMMENT_START', '/*'))
+            continue
+        if '*/' in line:
+            tokens.append(('COMMENT_END', '*/'))
+            continue
+        _reference_words(line, tokens)
+    return tokens
+
+
+def _reference_words(line, tokens):
+    words = re.findall(r'[a-zA-Z_][a-zA-Z0-9_]*|[0-9]+|"[^"]*"|\'[^\']*\'|[-+*/%=<>!&|^~?:;,.()\[\]{}]|->|\.', line)
+    for word in words:
+        if word in scanner.C_KEYWORDS:
+            tokens.append(('KEYWORD', word))
+        elif word in _REFERENCE_OPERATORS:
+            tokens.append(('OPERATOR', word))
+        elif word.startswith('"') or word.startswith("'"):
+            tokens.append(('STRING', word))
+        elif word.isdigit():
+            tokens.append(('NUMBER', word))
+        elif re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', word):
+            tokens.append(('IDENTIFIER', word))
+        else:
+            tokens.append(('UNKNOWN', word))
+
+
+def time_call(function, code, repeat):
+    """Best per-call wall-clock time of function(code) over repeat rounds"""
+    best = None
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            function(code)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_TIMING_SECONDS:
+                break
+        if best is None or elapsed / calls < best:
+            best = elapsed / calls
+    return best
+
+
+def peak_memory(function, code):
+    """Peak bytes allocated while running function(code) once"""
+    tracemalloc.start()
+    try:
+        function(code)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def stage_function(stage):
+    """Return a function running stage on a fresh engine
+
+    An engine keeps the token buffer of the last text it lexed, so timing
+    repeated calls on one engine would leave the lexing out of every stage
+    but the first.
+    """
+    method = STAGES[stage]
+    return lambda code: getattr(AnalysisEngine(), method)(code)
+
+
+def measure(profiles, sizes, stages, repeat, memory=True, seed=0):
+    """Run every stage over every generated input and return the measurements"""
+    results = []
+    for profile in profiles:
+        for size in sizes:
+            code = corpus.generate_profile(profile, size, seed)
+            for stage in stages:
+                function = stage_function(stage)
+                if stage in TARGETS and len(code) >= TARGET_MIN_CHARS:
+                    # Alternate the rounds so a slow spell of the machine
+                    # weighs on both sides of the comparison, and take the
+                    # median speedup of the rounds rather than one ratio of
+                    # two best times, which a single lucky round decides
+                    rounds = [(time_call(function, code, 1), time_call(reference_tokenize, code, 1))
+                              for _ in range(max(repeat, TARGET_MIN_ROUNDS))]
+                    seconds = min(timing for timing, _ in rounds)
+                    speedup = statistics.median(reference / timing for timing, reference in rounds)
+                else:
+                    seconds = time_call(function, code, repeat)
+                    speedup = None
+                results.append({
+                    'profile': profile,
+                    'size': size,
+                    'chars': len(code),
+                    'stage': stage,
+                    'seconds': seconds,
+                    'mb_per_second': len(code) / (1024 * 1024) / seconds,
+                    'speedup': speedup,
+                    'peak_bytes': peak_memory(function, code) if memory else None,
+                })
+    return results
+
+
+def scaling_exponent(points):
+    """Least-squares slope of log(time) over log(size); 1.0 is linear"""
+    points = [(math.log(chars), math.log(seconds)) for chars, seconds in points]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    spread = sum((x - mean_x) ** 2 for x, _ in points)
+    if not spread:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+
+
+def scaling_curves(results):
+    """Return {(profile, stage): exponent} for every measured curve"""
+    curves = {}
+    for result in results:
+        curves.setdefault((result['profile'], result['stage']), []).append(
+            (result['chars'], result['seconds']))
+    return {key: scaling_exponent(points) for key, points in curves.items()}
+
+
+def _result_key(result):
+    return f"{result['profile']}/{result['stage']}/{result['size']}"
+
+
+def find_regressions(results, baseline, tolerance):
+    """Return messages for stages slower than the baseline by more than tolerance"""
+    regressions = []
+    for result in results:
+        expected = baseline.get(_result_key(result))
+        if expected is None:
+            continue
+        floor = expected * (1 - tolerance)
+        if result['mb_per_second'] < floor:
+            regressions.append(
+                f"{_result_key(result)}: {result['mb_per_second']:.2f} MB/s, "
+                f"baseline {expected:.2f} MB/s")
+    return regressions
+
+
+def find_missed_targets(results, targets=TARGETS):
+    """Return messages for stages below their target speedup over reference_tokenize"""
+    missed = []
+    for result in results:
+        target = targets.get(result['stage'])
+        if target is None or result['speedup'] is None:
+            continue
+        if result['speedup'] < target:
+            missed.append(
+                f"{_result_key(result)}: {result['speedup']:.2f}x the reference tokenizer, "
+                f"target {target:.2f}x")
+    return missed
+
+
+def load_baseline(path):
+    """Read stored throughputs, keyed by profile/stage/size"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    """Store the throughput of every measurement as the new baseline"""
+    baseline = {_result_key(result): result['mb_per_second'] for result in results}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+
+def format_results(results):
+    """Render measurements and scaling curves as a text table"""
+    lines = [f"{'profile':<11} {'stage':<12} {'chars':>10} {'seconds':>9} "
+             f"{'MB/s':>7} {'us/KB':>8} {'peak MB':>8} {'vs ref':>7}"]
+    for result in results:
+        peak = result['peak_bytes']
+        peak = f"{peak / (1024 * 1024):>8.1f}" if peak is not None else f"{'-':>8}"
+        speedup = result['speedup']
+        speedup = f"{speedup:>6.2f}x" if speedup is not None else f"{'-':>7}"
+        lines.append(
+            f"{result['profile']:<11} {result['stage']:<12} {result['chars']:>10} "
+            f"{result['seconds']:>9.4f} {result['mb_per_second']:>7.2f} "
+            f"{result['seconds'] * 1e6 / (result['chars'] / 1024):>8.1f} {peak} {speedup}")
+
+    lines.append("")
+    lines.append("Scaling (slope of log time over log size, 1.0 = linear):")
+    for (profile, stage), exponent in scaling_curves(results).items():
+        if exponent is not None:
+            lines.append(f"  {profile:<11} {stage:<12} {exponent:.2f}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis stages on synthetic C sources")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help="comma-separated input sizes, e.g. 1K,1M,100M")
+    parser.add_argument('-p', '--profile', action='append', choices=sorted(corpus.PROFILES),
+                        help="corpus profile (repeatable, default: all)")
+    parser.add_argument('-s', '--stage', action='append', choices=list(STAGES),
+                        help="stage to time (repeatable, default: all)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help="timing rounds per measurement; the best is kept")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed for the corpus generator")
+    parser.add_argument('--no-memory', action='store_true',
+                        help="skip the tracemalloc peak memory run")
+    parser.add_argument('--baseline', nargs='?', const=DEFAULT_BASELINE,
+                        help="fail if a stage is slower than this stored baseline")
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE,
+                        help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed fractional throughput loss against the baseline")
+    parser.add_argument('--json', action='store_true',
+                        help="emit the measurements as JSON")
+    args = parser.parse_args(argv)
+
+    sizes = [corpus.parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    profiles = args.profile or list(corpus.PROFILES)
+    stages = args.stage or list(STAGES)
+    results = measure(profiles, sizes, stages, max(1, args.repeat),
+                      memory=not args.no_memory, seed=args.seed)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_results(results))
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+        print(f"Baseline saved to {args.save_baseline}", file=sys.stderr)
+
+    status = 0
+    missed = find_missed_targets(results)
+    if missed:
+        print("Below the target throughput:", file=sys.stderr)
+        for message in missed:
+            print(f"  {message}", file=sys.stderr)
+        status = 1
+
+    if args.baseline:
+        regressions = find_regressions(results, load_baseline(args.baseline), args.tolerance)
+        if regressions:
+            print("Regressions against the baseline:", file=sys.stderr)
+            for regression in regressions:
+                print(f"  {regression}", file=sys.stderr)
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1159 @@
+from itertools import compress
+from operator import add
+
+import token_buffer
+from scanner import COMMENT_GROUP
+
+# Statement nesting the parser accepts before giving up on an item, kept
+# well inside Python's recursion limit; the expression parser and else-if
+# chains are iterative and have no such limit
+MAX_NESTING = 128
+
+# Deepest level the text tree indents; deeper nodes are tagged with their depth
+MAX_INDENT = 64
+
+# Keywords that can start a declaration
+TYPE_KEYWORDS = frozenset({
+    'auto', 'char', 'const', 'double', 'enum', 'extern', 'float', 'int', 'long',
+    'register', 'short', 'signed', 'static', 'struct', 'typedef', 'union',
+    'unsigned', 'void', 'volatile'
+})
+
+# Binary operator precedence (higher binds tighter) and right associativity
+BINARY_PRECEDENCE = {
+    ',': 1,
+    '=': 2, '+=': 2, '-=': 2, '*=': 2, '/=': 2, '%=': 2,
+    '<<=': 2, '>>=': 2, '&=': 2, '|=': 2, '^=': 2,
+    '||': 4, '&&': 5, '|': 6, '^': 7, '&': 8,
+    '==': 9, '!=': 9, '<': 10, '>': 10, '<=': 10, '>=': 10,
+    '<<': 11, '>>': 11, '+': 12, '-': 12, '*': 13, '/': 13, '%': 13,
+}
+TERNARY_PRECEDENCE = 3
+PREFIX_PRECEDENCE = 14
+RIGHT_ASSOCIATIVE = frozenset({2, TERNARY_PRECEDENCE, PREFIX_PRECEDENCE})
+PREFIX_OPERATORS = frozenset({'+', '-', '!', '~', '*', '&', '++', '--', 'sizeof'})
+
+
+def join_type(type_text, name):
+    """Combine a type and a declared name, e.g. ('char *', 's') -> 'char *s'"""
+    if not name:
+        return type_text
+    return type_text + ('' if type_text.endswith('*') else ' ') + name
+
+
+class ParseError(Exception):
+    """Raised when the parser cannot continue with the current item"""
+
+    def __init__(self, message, position):
+        super().__init__(message)
+        self.position = position
+
+
+class Node:
+    """Base AST node; subclasses list their child attributes in fields"""
+    __slots__ = ('start', 'end')
+    fields = ()
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+    def children(self):
+        """Yield the child nodes in source order"""
+        for name in self.fields:
+            value = getattr(self, name)
+            if isinstance(value, Node):
+                yield value
+            elif isinstance(value, list):
+                yield from value
+
+    def label(self):
+        """Short description used by the tree views"""
+        return type(self).__name__
+
+
+class TranslationUnit(Node):
+    __slots__ = ('items',)
+    fields = ('items',)
+
+    def __init__(self, start, end, items):
+        super().__init__(start, end)
+        self.items = items
+
+    def label(self):
+        return "Program"
+
+
+class Directive(Node):
+    __slots__ = ('text',)
+
+    def __init__(self, start, end, text):
+        super().__init__(start, end)
+        self.text = text
+
+    def label(self):
+        return f"Preprocessor: {self.text.splitlines()[0]}"
+
+
+class Record(Node):
+    """struct/union/enum body; members are Declarations or Enumerators"""
+    __slots__ = ('keyword', 'name', 'members')
+    fields = ('members',)
+
+    def __init__(self, start, end, keyword, name, members):
+        super().__init__(start, end)
+        self.keyword = keyword
+        self.name = name
+        self.members = members
+
+    def label(self):
+        return f"{self.keyword.capitalize()}: {self.name or '<anonymous>'}"
+
+
+class Enumerator(Node):
+    __slots__ = ('name', 'value')
+    fields = ('value',)
+
+    def __init__(self, start, end, name, value):
+        super().__init__(start, end)
+        self.name = name
+        self.value = value
+
+    def label(self):
+        return f"Enumerator: {self.name}"
+
+
+class Declaration(Node):
+    __slots__ = ('type', 'record', 'declarators')
+    fields = ('record', 'declarators')
+
+    def __init__(self, start, end, type, record, declarators):
+        super().__init__(start, end)
+        self.type = type
+        self.record = record
+        self.declarators = declarators
+
+    def label(self):
+        return f"Declaration: {self.type}"
+
+
+class Declarator(Node):
+    __slots__ = ('name', 'type', 'params', 'init')
+    fields = ('params', 'init')
+
+    def __init__(self, start, end, name, type, params, init):
+        super().__init__(start, end)
+        self.name = name
+        self.type = type
+        # Parameter list for function declarators, otherwise None
+        self.params = params
+        self.init = init
+
+    def label(self):
+        return f"Declarator: {join_type(self.type, self.name)}"
+
+
+class Param(Node):
+    __slots__ = ('type', 'name')
+
+    def __init__(self, start, end, type, name):
+        super().__init__(start, end)
+        self.type = type
+        self.name = name
+
+    def label(self):
+        return f"Param: {join_type(self.type, self.name)}"
+
+
+class FunctionDef(Node):
+    __slots__ = ('type', 'name', 'params', 'body')
+    fields = ('params', 'body')
+
+    def __init__(self, start, end, type, name, params, body):
+        super().__init__(start, end)
+        self.type = type
+        self.name = name
+        self.params = params
+        self.body = body
+
+    def label(self):
+        params = ", ".join(join_type(p.type, p.name) for p in self.params)
+        return f"Function: {self.type} {self.name}({params})"
+
+
+class InitList(Node):
+    __slots__ = ('items',)
+    fields = ('items',)
+
+    def __init__(self, start, end, items):
+        super().__init__(start, end)
+        self.items = items
+
+    def label(self):
+        return "Initializer List"
+
+
+class Compound(Node):
+    __slots__ = ('items',)
+    fields = ('items',)
+
+    def __init__(self, start, end, items):
+        super().__init__(start, end)
+        self.items = items
+
+    def label(self):
+        return "Block"
+
+
+class If(Node):
+    __slots__ = ('cond', 'then', 'otherwise')
+    fields = ('cond', 'then', 'otherwise')
+
+    def __init__(self, start, end, cond, then, otherwise):
+        super().__init__(start, end)
+        self.cond = cond
+        self.then = then
+        self.otherwise = otherwise
+
+    def label(self):
+        return "Control: if"
+
+
+class While(Node):
+    __slots__ = ('cond', 'body')
+    fields = ('cond', 'body')
+
+    def __init__(self, start, end, cond, body):
+        super().__init__(start, end)
+        self.cond = cond
+        self.body = body
+
+    def label(self):
+        return "Control: while"
+
+
+class DoWhile(Node):
+    __slots__ = ('body', 'cond')
+    fields = ('body', 'cond')
+
+    def __init__(self, start, end, body, cond):
+        super().__init__(start, end)
+        self.body = body
+        self.cond = cond
+
+    def label(self):
+        return "Control: do-while"
+
+
+class For(Node):
+    __slots__ = ('init', 'cond', 'step', 'body')
+    fields = ('init', 'cond', 'step', 'body')
+
+    def __init__(self, start, end, init, cond, step, body):
+        super().__init__(start, end)
+        self.init = init
+        self.cond = cond
+        self.step = step
+        self.body = body
+
+    def label(self):
+        return "Control: for"
+
+
+class Switch(Node):
+    __slots__ = ('cond', 'body')
+    fields = ('cond', 'body')
+
+    def __init__(self, start, end, cond, body):
+        super().__init__(start, end)
+        self.cond = cond
+        self.body = body
+
+    def label(self):
+        return "Control: switch"
+
+
+class Case(Node):
+    """case/default label; value is None for default"""
+    __slots__ = ('value',)
+    fields = ('value',)
+
+    def __init__(self, start, end, value):
+        super().__init__(start, end)
+        self.value = value
+
+    def label(self):
+        return "Case" if self.value is not None else "Default"
+
+
+class Label(Node):
+    __slots__ = ('name',)
+
+    def __init__(self, start, end, name):
+        super().__init__(start, end)
+        self.name = name
+
+    def label(self):
+        return f"Label: {self.name}"
+
+
+class Jump(Node):
+    """return, break, continue or goto; value is the returned expression or goto label"""
+    __slots__ = ('keyword', 'value')
+    fields = ('value',)
+
+    def __init__(self, start, end, keyword, value):
+        super().__init__(start, end)
+        self.keyword = keyword
+        self.value = value
+
+    def label(self):
+        if self.keyword == 'goto':
+            return f"Statement: goto {self.value}"
+        return f"Statement: {self.keyword}"
+
+
+class ExprStatement(Node):
+    """Expression statement; expr is None for an empty statement"""
+    __slots__ = ('expr',)
+    fields = ('expr',)
+
+    def __init__(self, start, end, expr):
+        super().__init__(start, end)
+        self.expr = expr
+
+    def label(self):
+        return "Statement" if self.expr is not None else "Empty Statement"
+
+
+class Invalid(Node):
+    """Source range the parser skipped after an error"""
+    __slots__ = ('message',)
+
+    def __init__(self, start, end, message):
+        super().__init__(start, end)
+        self.message = message
+
+    def label(self):
+        return f"Error: {self.message}"
+
+
+class Identifier(Node):
+    __slots__ = ('name',)
+
+    def __init__(self, start, end, name):
+        super().__init__(start, end)
+        self.name = name
+
+    def label(self):
+        return f"Identifier: {self.name}"
+
+
+class Literal(Node):
+    __slots__ = ('kind', 'value')
+
+    def __init__(self, start, end, kind, value):
+        super().__init__(start, end)
+        self.kind = kind
+        self.value = value
+
+    def label(self):
+        return f"{self.kind.capitalize()}: {self.value}"
+
+
+class Unary(Node):
+    """Prefix or postfix operator applied to one operand"""
+    __slots__ = ('op', 'operand', 'postfix')
+    fields = ('operand',)
+
+    def __init__(self, start, end, op, operand, postfix=False):
+        super().__init__(start, end)
+        self.op = op
+        self.operand = operand
+        self.postfix = postfix
+
+    def label(self):
+        return f"{'Postfix' if self.postfix else 'Unary'}: {self.op}"
+
+
+class Cast(Node):
+    __slots__ = ('type', 'operand')
+    fields = ('operand',)
+
+    def __init__(self, start, end, type, operand):
+        super().__init__(start, end)
+        self.type = type
+        self.operand = operand
+
+    def label(self):
+        return f"Cast: ({self.type})"
+
+
+class CompoundLiteral(Node):
+    __slots__ = ('type', 'init')
+    fields = ('init',)
+
+    def __init__(self, start, end, type, init):
+        super().__init__(start, end)
+        self.type = type
+        self.init = init
+
+    def label(self):
+        return f"Compound Literal: ({self.type})"
+
+
+class Binary(Node):
+    __slots__ = ('op', 'left', 'right')
+    fields = ('left', 'right')
+
+    def __init__(self, start, end, op, left, right):
+        super().__init__(start, end)
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def label(self):
+        if BINARY_PRECEDENCE[self.op] == 2:
+            return f"Assignment: {self.op}"
+        return f"Binary: {self.op}"
+
+
+class Conditional(Node):
+    __slots__ = ('cond', 'then', 'otherwise')
+    fields = ('cond', 'then', 'otherwise')
+
+    def __init__(self, start, end, cond, then, otherwise):
+        super().__init__(start, end)
+        self.cond = cond
+        self.then = then
+        self.otherwise = otherwise
+
+    def label(self):
+        return "Conditional: ?:"
+
+
+class Call(Node):
+    __slots__ = ('func', 'args')
+    fields = ('func', 'args')
+
+    def __init__(self, start, end, func, args):
+        super().__init__(start, end)
+        self.func = func
+        self.args = args
+
+    def label(self):
+        if isinstance(self.func, Identifier):
+            return f"Call: {self.func.name}"
+        return "Call"
+
+
+class Index(Node):
+    __slots__ = ('base', 'index')
+    fields = ('base', 'index')
+
+    def __init__(self, start, end, base, index):
+        super().__init__(start, end)
+        self.base = base
+        self.index = index
+
+    def label(self):
+        return "Index: []"
+
+
+class Member(Node):
+    __slots__ = ('op', 'base', 'name')
+    fields = ('base',)
+
+    def __init__(self, start, end, op, base, name):
+        super().__init__(start, end)
+        self.op = op
+        self.base = base
+        self.name = name
+
+    def label(self):
+        return f"Member: {self.op}{self.name}"
+
+
+class Parser:
+    """Recursive-descent parser for statements with an iterative
+    precedence-climbing expression parser, linear in the number of tokens"""
+
+    def __init__(self, code, tokens=None):
+        self.code = code
+        if tokens is None:
+            tokens = token_buffer.lex(code)
+        # (kind, value, start, end) for every token except comments, built
+        # from the TokenBuffer columns in whole-column passes
+        kinds = tokens.kinds
+        starts = tokens.starts
+        ends = list(map(add, starts, tokens.lengths))
+        values = map(tokens.source.__getitem__, map(slice, starts, ends))
+        self.tokens = list(compress(
+            zip(map(token_buffer.KIND_NAMES.__getitem__, kinds), values, starts, ends),
+            map(COMMENT_GROUP.__ne__, kinds)))
+        self.pos = 0
+        self.errors = []
+        self._depth = 0
+        # Ordinary identifiers declared in each open scope, innermost last,
+        # mapped to whether they name a typedef
+        self._scopes = [{}]
+        self._eof = ('EOF', '', len(code), len(code))
+
+    # Token helpers
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else self._eof
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def at(self, value):
+        token = self.peek()
+        return token[1] == value and token[0] in ('OPERATOR', 'KEYWORD')
+
+    def expect(self, value):
+        token = self.peek()
+        if token[1] != value or token[0] not in ('OPERATOR', 'KEYWORD'):
+            found = token[1] or 'end of input'
+            raise ParseError(f"Expected '{value}' but found '{found}'", token[2])
+        self.pos += 1
+        return token
+
+    def _end(self):
+        """End offset of the last consumed token"""
+        return self.tokens[self.pos - 1][3] if self.pos else 0
+
+    # Top level
+
+    def parse(self):
+        """Parse the whole input into a TranslationUnit"""
+        items = []
+        while self.peek()[0] != 'EOF':
+            items.append(self._recovering(self.parse_external))
+        return TranslationUnit(0, len(self.code), items)
+
+    def _recovering(self, parse_item):
+        """Parse one item, skipping past it as an Invalid node on error"""
+        start_pos = self.pos
+        depth = self._depth
+        scopes = len(self._scopes)
+        try:
+            return parse_item()
+        except ParseError as e:
+            self._depth = depth
+            del self._scopes[scopes:]
+            self.errors.append(e)
+            start = self.tokens[start_pos][2] if start_pos < len(self.tokens) else len(self.code)
+            self._skip_item(start_pos)
+            return Invalid(start, max(start, self._end()), str(e))
+
+    def _skip_item(self, start_pos):
+        """Skip from the start of a failed item past its ';' or balanced block,
+        leaving a closing brace that belongs to the enclosing block"""
+        self.pos = start_pos
+        depth = 0
+        while self.peek()[0] != 'EOF':
+            kind, value, _, _ = self.peek()
+            if kind == 'OPERATOR' and value == '}' and depth == 0:
+                break
+            self.pos += 1
+            if kind != 'OPERATOR':
+                continue
+            if value == '{':
+                depth += 1
+            elif value == '}':
+                depth -= 1
+                if depth == 0:
+                    return
+            elif value == ';' and depth == 0:
+                return
+        if self.pos == start_pos:
+            self.pos += 1
+
+    def parse_external(self):
+        token = self.peek()
+        if token[0] == 'PREPROCESSOR':
+            self.pos += 1
+            return Directive(token[2], token[3], token[1].strip())
+        if self.at(';'):
+            self.pos += 1
+            return ExprStatement(token[2], token[3], None)
+        return self.parse_declaration(allow_function=True)
+
+    # Declarations
+
+    def _declare(self, name, is_typedef):
+        """Record name in the innermost scope as a typedef or an ordinary name"""
+        if name:
+            self._scopes[-1][name] = is_typedef
+
+    def _is_typedef(self, name):
+        """True if the visible declaration of name is a typedef, False if it
+        is an ordinary name, None if name was never declared (it may come
+        from a header that is not parsed)"""
+        for scope in reversed(self._scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def starts_declaration(self):
+        kind, value, _, _ = self.peek()
+        if kind == 'KEYWORD':
+            return value in TYPE_KEYWORDS
+        if kind != 'IDENTIFIER':
+            return False
+        following = self.peek(1)
+        is_typedef = self._is_typedef(value)
+        if is_typedef is not None:
+            return is_typedef and following[1] != ':'
+        # An undeclared typedef name: `name x`, `name *x;` or `name *x =`
+        if following[0] == 'IDENTIFIER':
+            return True
+        if following[1] == '*':
+            index = 2
+            while self.peek(index)[1] == '*':
+                index += 1
+            return (self.peek(index)[0] == 'IDENTIFIER'
+                    and self.peek(index + 1)[1] in (';', '=', ',', '[', ')'))
+        return False
+
+    def parse_specifiers(self):
+        """Parse declaration specifiers into (type text, Record or None)"""
+        parts = []
+        record = None
+        seen_type_name = False
+        while True:
+            kind, value, start, _ = self.peek()
+            if kind == 'KEYWORD' and value in ('struct', 'union', 'enum'):
+                self.pos += 1
+                name = None
+                if self.peek()[0] == 'IDENTIFIER':
+                    name = self.next()[1]
+                if self.at('{'):
+                    record = self.parse_record_body(value, name, start)
+                parts.append(f"{value} {name}" if name else value)
+                seen_type_name = True
+            elif kind == 'KEYWORD' and value in TYPE_KEYWORDS:
+                self.pos += 1
+                parts.append(value)
+                if value not in ('auto', 'const', 'extern', 'register', 'static', 'typedef', 'volatile'):
+                    seen_type_name = True
+            elif kind == 'IDENTIFIER' and not seen_type_name and self._names_type(value):
+                self.pos += 1
+                parts.append(value)
+                seen_type_name = True
+            else:
+                break
+        if not parts:
+            token = self.peek()
+            raise ParseError(f"Expected a type but found '{token[1] or 'end of input'}'", token[2])
+        return " ".join(parts), record
+
+    def _names_type(self, name):
+        """Whether the identifier name at the current token is used as a type"""
+        is_typedef = self._is_typedef(name)
+        if is_typedef is not None:
+            return is_typedef
+        # Undeclared: a typedef name unless it is followed by what follows a
+        # declared name
+        return self.peek(1)[1] not in ('(', '[', ';', '=', ',')
+
+    def parse_record_body(self, keyword, name, start):
+        self.expect('{')
+        members = []
+        self._enter()
+        if keyword != 'enum':
+            # Member names do not hide typedef names outside the body
+            self._scopes.append({})
+        while not self.at('}'):
+            if self.peek()[0] == 'EOF':
+                raise ParseError(f"Unclosed {keyword} body", start)
+            if keyword == 'enum':
+                member_start = self.peek()[2]
+                member_name = self.next()[1]
+                value = None
+                if self.at('='):
+                    self.pos += 1
+                    value = self.parse_expression(allow_comma=False)
+                members.append(Enumerator(member_start, self._end(), member_name, value))
+                self._declare(member_name, False)
+                if not self.at('}'):
+                    self.expect(',')
+            else:
+                members.append(self._recovering(self.parse_declaration))
+        self.expect('}')
+        if keyword != 'enum':
+            self._scopes.pop()
+        self._leave()
+        return Record(start, self._end(), keyword, name, members)
+
+    def parse_declaration(self, allow_function=False):
+        start = self.peek()[2]
+        base_type, record = self.parse_specifiers()
+        is_typedef = 'typedef' in base_type.split()
+        declarators = []
+        if not self.at(';'):
+            while True:
+                declarator = self.parse_declarator(base_type)
+                self._declare(declarator.name, is_typedef)
+                if allow_function and not declarators and declarator.params is not None and self.at('{'):
+                    body = self.parse_compound([param.name for param in declarator.params])
+                    return FunctionDef(start, self._end(), declarator.type, declarator.name,
+                                       declarator.params, body)
+                if self.at(':'):
+                    # Bit-field width
+                    self.pos += 1
+                    width = self.parse_expression(allow_comma=False)
+                    declarator.type += f" : {self._source_of(width)}"
+                    declarator.end = self._end()
+                if self.at('='):
+                    self.pos += 1
+                    declarator.init = self.parse_initializer()
+                    declarator.end = self._end()
+                declarators.append(declarator)
+                if not self.at(','):
+                    break
+                self.pos += 1
+        self.expect(';')
+        return Declaration(start, self._end(), base_type, record, declarators)
+
+    def parse_declarator(self, base_type):
+        start = self.peek()[2]
+        type_text = base_type
+        while self.at('*') or self.at('const') or self.at('volatile'):
+            token = self.next()
+            type_text += " *" if token[1] == '*' else f" {token[1]}"
+        name = None
+        params = None
+        if self.at('(') and self.peek(1)[1] == '*':
+            # Function pointer: (*name)(params)
+            self.pos += 2
+            if self.peek()[0] == 'IDENTIFIER':
+                name = self.next()[1]
+            self.expect(')')
+            type_text += " (*)"
+        elif self.peek()[0] == 'IDENTIFIER':
+            name = self.next()[1]
+        while True:
+            if self.at('['):
+                self.pos += 1
+                size = "" if self.at(']') else self._source_of(self.parse_expression())
+                self.expect(']')
+                type_text += f"[{size}]"
+            elif self.at('('):
+                params = self.parse_params()
+            else:
+                break
+        return Declarator(start, self._end(), name, type_text, params, None)
+
+    def parse_params(self):
+        self.expect('(')
+        params = []
+        while not self.at(')'):
+            token = self.peek()
+            if self.at('...'):
+                self.pos += 1
+                params.append(Param(token[2], token[3], '...', None))
+            else:
+                base_type, _ = self.parse_specifiers()
+                declarator = self.parse_declarator(base_type)
+                params.append(Param(token[2], self._end(), declarator.type, declarator.name))
+            if not self.at(')'):
+                self.expect(',')
+        self.expect(')')
+        # (void) declares no parameters
+        if len(params) == 1 and params[0].type == 'void' and params[0].name is None:
+            params = []
+        return params
+
+    def parse_initializer(self):
+        if not self.at('{'):
+            return self.parse_expression(allow_comma=False)
+        start = self.next()[2]
+        self._enter()
+        items = []
+        while not self.at('}'):
+            if self.at('.') or self.at('['):
+                # Designators are kept as part of the following value
+                while not self.at('='):
+                    if self.peek()[0] == 'EOF':
+                        raise ParseError("Unclosed initializer list", start)
+                    self.pos += 1
+                self.pos += 1
+            items.append(self.parse_initializer())
+            if not self.at('}'):
+                self.expect(',')
+        self.expect('}')
+        self._leave()
+        return InitList(start, self._end(), items)
+
+    # Statements
+
+    def _enter(self):
+        self._depth += 1
+        if self._depth > MAX_NESTING:
+            raise ParseError(f"Nesting deeper than {MAX_NESTING} levels", self.peek()[2])
+
+    def _leave(self):
+        self._depth -= 1
+
+    def parse_compound(self, params=()):
+        """Parse a block; params are the names a function body starts with"""
+        start = self.expect('{')[2]
+        self._enter()
+        self._scopes.append(dict.fromkeys(filter(None, params), False))
+        items = []
+        while not self.at('}'):
+            if self.peek()[0] == 'EOF':
+                raise ParseError("Unclosed brace '{'", start)
+            items.append(self._recovering(self.parse_block_item))
+        self.expect('}')
+        self._scopes.pop()
+        self._leave()
+        return Compound(start, self._end(), items)
+
+    def parse_block_item(self):
+        if self.peek()[0] == 'PREPROCESSOR':
+            token = self.next()
+            return Directive(token[2], token[3], token[1].strip())
+        if self.starts_declaration():
+            return self.parse_declaration()
+        return self.parse_statement()
+
+    def parse_statement(self):
+        kind, value, start, end = self.peek()
+        if kind == 'OPERATOR':
+            if value == '{':
+                return self.parse_compound()
+            if value == ';':
+                self.pos += 1
+                return ExprStatement(start, end, None)
+        elif kind == 'KEYWORD':
+            method = getattr(self, f"_parse_{value}", None)
+            if method is not None:
+                self.pos += 1
+                self._enter()
+                node = method(start)
+                self._leave()
+                return node
+        elif kind == 'IDENTIFIER' and self.peek(1)[1] == ':':
+            self.pos += 2
+            return Label(start, self._end(), value)
+
+        expr = self.parse_expression()
+        self.expect(';')
+        return ExprStatement(start, self._end(), expr)
+
+    def _parenthesized(self):
+        self.expect('(')
+        expr = self.parse_expression()
+        self.expect(')')
+        return expr
+
+    def _parse_if(self, start):
+        cond = self._parenthesized()
+        chain = [If(start, start, cond, self.parse_statement(), None)]
+        # else-if chains are built in a loop so long chains do not nest calls
+        while self.at('else'):
+            self.pos += 1
+            if not self.at('if'):
+                chain[-1].otherwise = self.parse_statement()
+                break
+            else_start = self.next()[2]
+            cond = self._parenthesized()
+            branch = If(else_start, else_start, cond, self.parse_statement(), None)
+            chain[-1].otherwise = branch
+            chain.append(branch)
+        end = self._end()
+        for node in chain:
+            node.end = end
+        return chain[0]
+
+    def _parse_while(self, start):
+        cond = self._parenthesized()
+        body = self.parse_statement()
+        return While(start, self._end(), cond, body)
+
+    def _parse_do(self, start):
+        body = self.parse_statement()
+        self.expect('while')
+        cond = self._parenthesized()
+        self.expect(';')
+        return DoWhile(start, self._end(), body, cond)
+
+    def _parse_for(self, start):
+        self.expect('(')
+        if self.starts_declaration():
+            init = self.parse_declaration()
+        else:
+            init = None if self.at(';') else self.parse_expression()
+            self.expect(';')
+        cond = None if self.at(';') else self.parse_expression()
+        self.expect(';')
+        step = None if self.at(')') else self.parse_expression()
+        self.expect(')')
+        body = self.parse_statement()
+        return For(start, self._end(), init, cond, step, body)
+
+    def _parse_switch(self, start):
+        cond = self._parenthesized()
+        body = self.parse_statement()
+        return Switch(start, self._end(), cond, body)
+
+    def _parse_case(self, start):
+        value = self.parse_expression(allow_comma=False)
+        self.expect(':')
+        return Case(start, self._end(), value)
+
+    def _parse_default(self, start):
+        self.expect(':')
+        return Case(start, self._end(), None)
+
+    def _parse_return(self, start):
+        value = None if self.at(';') else self.parse_expression()
+        self.expect(';')
+        return Jump(start, self._end(), 'return', value)
+
+    def _parse_break(self, start):
+        self.expect(';')
+        return Jump(start, self._end(), 'break', None)
+
+    def _parse_continue(self, start):
+        self.expect(';')
+        return Jump(start, self._end(), 'continue', None)
+
+    def _parse_goto(self, start):
+        label = self.next()[1]
+        self.expect(';')
+        return Jump(start, self._end(), 'goto', label)
+
+    # Expressions
+
+    def _source_of(self, node):
+        return self.code[node.start:node.end]
+
+    def _parse_type_name(self):
+        """Parse the type inside a cast or sizeof, up to the closing ')'"""
+        base_type, _ = self.parse_specifiers()
+        while self.at('*'):
+            self.pos += 1
+            base_type += " *"
+        while self.at('['):
+            self.pos += 1
+            size = "" if self.at(']') else self._source_of(self.parse_expression())
+            self.expect(']')
+            base_type += f"[{size}]"
+        return base_type
+
+    def _is_type_start(self, offset):
+        kind, value, _, _ = self.peek(offset)
+        if kind == 'IDENTIFIER':
+            return self._is_typedef(value) is True
+        return kind == 'KEYWORD' and value in TYPE_KEYWORDS
+
+    def parse_expression(self, allow_comma=True):
+        """Parse an expression with explicit operand and operator stacks.
+
+        Parentheses, calls and subscripts push markers instead of recursing,
+        so nesting depth is limited only by memory.
+        """
+        operands = []
+        # Entries are (precedence, op, start) for operators and
+        # (None, marker, start, operand count) for open brackets
+        operators = []
+        # Markers of the currently open brackets, innermost last
+        brackets = []
+        expect_operand = True
+
+        def reduce_top():
+            precedence, op, op_start = operators.pop()
+            if op == '?:':
+                otherwise = operands.pop()
+                then = operands.pop()
+                cond = operands.pop()
+                operands.append(Conditional(cond.start, otherwise.end, cond, then, otherwise))
+            elif op == '?':
+                token = self.peek()
+                raise ParseError("Expected ':' in conditional expression", token[2])
+            elif precedence == PREFIX_PRECEDENCE:
+                operand = operands.pop()
+                if isinstance(op, tuple):
+                    operands.append(Cast(op_start, operand.end, op[1], operand))
+                else:
+                    operands.append(Unary(op_start, operand.end, op, operand))
+            else:
+                right = operands.pop()
+                left = operands.pop()
+                operands.append(Binary(left.start, right.end, op, left, right))
+
+        def reduce_while(precedence, right_associative):
+            while operators and operators[-1][0] is not None:
+                top = operators[-1][0]
+                if top > precedence or (top == precedence and not right_associative):
+                    reduce_top()
+                else:
+                    break
+
+        def reduce_to_marker():
+            while operators and operators[-1][0] is not None:
+                reduce_top()
+
+        while True:
+            kind, value, start, end = self.peek()
+            if expect_operand:
+                if kind in ('IDENTIFIER', 'NUMBER', 'STRING'):
+                    self.pos += 1
+                    if kind == 'IDENTIFIER':
+                        operands.append(Identifier(start, end, value))
+                    else:
+                        operands.append(Literal(start, end, kind, value))
+                    expect_operand = False
+                elif value in PREFIX_OPERATORS and kind in ('OPERATOR', 'KEYWORD'):
+                    self.pos += 1
+                    if value == 'sizeof' and self.at('(') and self._is_type_start(1):
+                        self.pos += 1
+                        type_name = self._parse_type_name()
+                        self.expect(')')
+                        operands.append(Unary(start, self._end(), 'sizeof',
+                                              Identifier(start, self._end(), type_name)))
+                        expect_operand = False
+                    else:
+                        operators.append((PREFIX_PRECEDENCE, value, start))
+                elif value == '(' and kind == 'OPERATOR':
+                    self.pos += 1
+                    if self._is_type_start(0):
+                        type_name = self._parse_type_name()
+                        self.expect(')')
+                        if self.at('{'):
+                            init = self.parse_initializer()
+                            operands.append(CompoundLiteral(start, init.end, type_name, init))
+                            expect_operand = False
+                        else:
+                            operators.append((PREFIX_PRECEDENCE, ('cast', type_name), start))
+                    else:
+                        operators.append((None, '(', start, len(operands)))
+                        brackets.append('(')
+                else:
+                    raise ParseError(f"Expected an expression but found '{value or 'end of input'}'", start)
+                continue
+
+            if kind != 'OPERATOR':
+                break
+            if value in ('++', '--'):
+                self.pos += 1
+                operand = operands.pop()
+                operands.append(Unary(operand.start, end, value, operand, postfix=True))
+            elif value in ('.', '->'):
+                self.pos += 1
+                name = self.next()
+                if name[0] != 'IDENTIFIER':
+                    raise ParseError(f"Expected a member name after '{value}'", name[2])
+                operand = operands.pop()
+                operands.append(Member(operand.start, name[3], value, operand, name[1]))
+            elif value == '[':
+                self.pos += 1
+                operators.append((None, '[', start, len(operands)))
+                brackets.append('[')
+                expect_operand = True
+            elif value == '(':
+                self.pos += 1
+                if self.at(')'):
+                    self.pos += 1
+                    func = operands.pop()
+                    operands.append(Call(func.start, self._end(), func, []))
+                else:
+                    operators.append((None, 'call', start, len(operands)))
+                    brackets.append('call')
+                    expect_operand = True
+            elif value in (')', ']'):
+                reduce_to_marker()
+                if not brackets:
+                    break
+                self.pos += 1
+                _, marker, _, base_count = operators.pop()
+                brackets.pop()
+                if value == ')' and marker == 'call':
+                    args = operands[base_count:]
+                    del operands[base_count:]
+                    func = operands.pop()
+                    operands.append(Call(func.start, end, func, args))
+                elif value == ']' and marker == '[':
+                    index = operands.pop()
+                    base = operands.pop()
+                    operands.append(Index(base.start, end, base, index))
+                elif not (value == ')' and marker == '('):
+                    raise ParseError(f"Mismatched '{value}'", start)
+            elif value == ',' and brackets and brackets[-1] == 'call':
+                # Argument separator inside a call
+                reduce_to_marker()
+                self.pos += 1
+                expect_operand = True
+            elif value == '?':
+                reduce_while(TERNARY_PRECEDENCE, True)
+                self.pos += 1
+                operators.append((TERNARY_PRECEDENCE, '?', start))
+                expect_operand = True
+            elif value == ':':
+                while operators and operators[-1][0] is not None and operators[-1][1] != '?':
+                    reduce_top()
+                if not operators or operators[-1][1] != '?':
+                    break
+                self.pos += 1
+                operators[-1] = (TERNARY_PRECEDENCE, '?:', operators[-1][2])
+                expect_operand = True
+            elif value in BINARY_PRECEDENCE:
+                precedence = BINARY_PRECEDENCE[value]
+                if value == ',' and not allow_comma and not brackets:
+                    break
+                reduce_while(precedence, precedence in RIGHT_ASSOCIATIVE)
+                self.pos += 1
+                operators.append((precedence, value, start))
+                expect_operand = True
+            else:
+                break
+
+        reduce_to_marker()
+        if operators:
+            raise ParseError(f"Unclosed '{operators[-1][1]}'", operators[-1][2])
+        return operands[-1]
+
+
+def parse(code, tokens=None):
+    """Parse C code and return (TranslationUnit, list of ParseErrors)
+
+    tokens is the TokenBuffer of code, when the caller has already lexed it.
+    """
+    parser = Parser(code, tokens)
+    tree = parser.parse()
+    return tree, parser.errors
+
+
+def iter_tree(node, depth=0):
+    """Yield (depth, node) for node and its descendants in pre-order, without recursion"""
+    stack = [(depth, node)]
+    while stack:
+        depth, node = stack.pop()
+        yield depth, node
+        children = list(node.children())
+        for child in reversed(children):
+            if child is not None:
+                stack.append((depth + 1, child))
+
+
+def _tree_prefix(depth):
+    """Indentation for a node at depth, capped so deep trees stay linear in size"""
+    if depth <= MAX_INDENT:
+        return '  ' * (depth - 1) + '└── '
+    return '  ' * (MAX_INDENT - 1) + f'└── [{depth}] '
+
+
+def format_tree(tree):
+    """Render an AST as the indented text tree shown in the syntax tab"""
+    return "\n".join(
+        _tree_prefix(depth) + node.label()
+        for depth, node in iter_tree(tree)
+        if depth > 0
+    )
@@ -0,0 +1,124 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+# Default memory budget for cached results
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def content_key(code):
+    """Return a stable digest identifying the source text"""
+    return hashlib.blake2b(code.encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest()
+
+
+def estimate_size(value):
+    """Roughly estimate the memory held by an analysis result"""
+    size = 0
+    seen = set()
+    # Walk iteratively; syntax trees can be far deeper than the recursion limit
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple)):
+            stack.extend(item)
+        elif hasattr(item, '__slots__'):
+            for cls in type(item).__mro__:
+                for name in getattr(cls, '__slots__', ()):
+                    if hasattr(item, name):
+                        stack.append(getattr(item, name))
+    return size
+
+
+class AnalysisCache:
+    """LRU cache of analysis results keyed by a hash of the source text"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, store=None):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # Optional persistent second tier (a DiskCache) consulted on misses
+        self.store = store
+        self.store_hits = 0
+        # digest -> {artifact name: (value, estimated size)}, oldest first
+        self._entries = OrderedDict()
+        # The last text hashed, so one report does not hash it repeatedly
+        self._last_code = None
+        self._last_key = None
+        # Analyses may run on worker threads while the GUI uses the cache
+        self._lock = threading.Lock()
+
+    def key(self, code):
+        """Return the cache key for code, reusing the last digest if possible"""
+        with self._lock:
+            if code is self._last_code:
+                return self._last_key
+        key = content_key(code)
+        with self._lock:
+            self._last_code = code
+            self._last_key = key
+        return key
+
+    def get_or_compute(self, code, artifact, compute):
+        """Return the cached artifact for code, computing and storing it on a miss"""
+        key = self.key(code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if artifact in entry:
+                    self.hits += 1
+                    return entry[artifact][0]
+            self.misses += 1
+
+        if self.store is not None:
+            found, value = self.store.get(key, artifact)
+            if found:
+                with self._lock:
+                    self.store_hits += 1
+                self.put(key, artifact, value)
+                return value
+
+        value = compute(code)
+        self.put(key, artifact, value)
+        if self.store is not None:
+            self.store.put(key, artifact, value)
+        return value
+
+    def put(self, key, artifact, value):
+        """Store one artifact under key and evict old entries over budget"""
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            self._entries.move_to_end(key)
+            if artifact in entry:
+                self.current_bytes -= entry[artifact][1]
+            entry[artifact] = (value, size)
+            self.current_bytes += size
+
+            # Evict least recently used texts, never the one just stored
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= sum(size for _, size in evicted.values())
+
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+            self._last_code = None
+            self._last_key = None
+
+    def __len__(self):
+        return len(self._entries)
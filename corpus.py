@@ -0,0 +1,162 @@
+import random
+
+# Generator settings for each benchmark profile; every profile stresses
+# one axis and keeps the others at their typical values
+PROFILES = {
+    'typical': {},
+    'nested': {'depth': 48},
+    'comments': {'comment_density': 0.7},
+    'strings': {'string_density': 0.7},
+    'long_lines': {'line_length': 4000, 'comment_density': 0.0},
+}
+
+# Defaults for the generator axes
+DEFAULT_DEPTH = 3
+DEFAULT_COMMENT_DENSITY = 0.1
+DEFAULT_STRING_DENSITY = 0.1
+DEFAULT_LINE_LENGTH = 80
+
+_WORDS = ('alpha', 'beta', 'gamma', 'delta', 'value', 'count', 'index', 'total',
+          'buffer', 'result', 'node', 'state', 'limit', 'offset', 'flag')
+
+_OPERATORS = ('+', '-', '*', '&', '|', '^')
+
+
+def parse_size(text):
+    """Parse a size such as 512, 64K, 10M or 1G into characters"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+class _Writer:
+    """Accumulates generated lines, packing statements up to the line length"""
+
+    def __init__(self, line_length):
+        self.line_length = line_length
+        self.parts = []
+        self.size = 0
+        self._line = None
+
+    def _flush(self):
+        if self._line is not None:
+            self.parts.append(self._line + "\n")
+            self.size += len(self._line) + 1
+            self._line = None
+
+    def line(self, indent, text):
+        """Write text on a line of its own"""
+        self._flush()
+        line = "    " * indent + text
+        self.parts.append(line + "\n")
+        self.size += len(line) + 1
+
+    def statement(self, indent, text):
+        """Write a statement, sharing the current line while it fits"""
+        if self._line is not None and len(self._line) + 1 + len(text) <= self.line_length:
+            self._line += " " + text
+        else:
+            self._flush()
+            self._line = "    " * indent + text
+
+    def text(self):
+        self._flush()
+        return "".join(self.parts)
+
+
+class _Generator:
+    """Deterministic writer of one synthetic C program"""
+
+    def __init__(self, depth, comment_density, string_density, line_length, seed):
+        self.depth = depth
+        self.comment_density = comment_density
+        self.string_density = string_density
+        self.rng = random.Random(seed)
+        self.out = _Writer(line_length)
+
+    def words(self, count):
+        return " ".join(self.rng.choice(_WORDS) for _ in range(count))
+
+    def expression(self, names):
+        rng = self.rng
+        terms = [rng.choice(names) if rng.random() < 0.6 else str(rng.randrange(1000))
+                 for _ in range(rng.randint(1, 4))]
+        parts = [terms[0]]
+        for term in terms[1:]:
+            parts.append(rng.choice(_OPERATORS))
+            parts.append(term)
+        return " ".join(parts)
+
+    def comment(self, indent):
+        if self.rng.random() < 0.5:
+            self.out.line(indent, f"// {self.words(self.rng.randint(3, 10))}")
+        else:
+            self.out.line(indent, "/* " + self.words(self.rng.randint(3, 8)))
+            self.out.line(indent, "   " + self.words(self.rng.randint(3, 8)) + " */")
+
+    def simple_statement(self, indent, names):
+        rng = self.rng
+        if rng.random() < self.string_density:
+            text = self.words(rng.randint(2, 8)).replace(' ', rng.choice((' ', '\\t', ' \\"')))
+            self.out.statement(indent, f'printf("{text} %d\\n", {rng.choice(names)});')
+        elif rng.random() < 0.3:
+            name = f"v{len(names)}"
+            self.out.statement(indent, f"int {name} = {self.expression(names)};")
+            names.append(name)
+        else:
+            self.out.statement(indent, f"{rng.choice(names)} = {self.expression(names)};")
+
+    def block(self, indent, names, depth):
+        rng = self.rng
+        names = list(names)
+        # Long-line profiles need enough statements to fill their lines
+        count = rng.randint(2, 5) + max(0, self.out.line_length // 20 - 4)
+        # Each block holds one nested block, so every function reaches
+        # the configured depth without the program growing exponentially
+        nested = rng.randrange(count) if depth < self.depth else -1
+        for position in range(count):
+            if rng.random() < self.comment_density:
+                self.comment(indent)
+            if position == nested:
+                kind = rng.randrange(3)
+                if kind == 0:
+                    self.out.line(indent, f"if ({rng.choice(names)} > {rng.randrange(100)}) {{")
+                elif kind == 1:
+                    self.out.line(indent, f"while ({rng.choice(names)} < {rng.randrange(100)}) {{")
+                else:
+                    self.out.line(indent, f"for (int i{depth} = 0; i{depth} < {rng.randrange(1, 50)}; i{depth}++) {{")
+                self.block(indent + 1, names, depth + 1)
+                self.out.line(indent, "}")
+            else:
+                self.simple_statement(indent, names)
+
+    def function(self, index):
+        self.out.line(0, f"int function_{index}(int a, int b) {{")
+        self.block(1, ['a', 'b'], 0)
+        self.out.line(1, "return a;")
+        self.out.line(0, "}")
+        self.out.line(0, "")
+
+
+def generate(size, depth=DEFAULT_DEPTH, comment_density=DEFAULT_COMMENT_DENSITY,
+             string_density=DEFAULT_STRING_DENSITY, line_length=DEFAULT_LINE_LENGTH, seed=0):
+    """Return a deterministic, syntactically valid C program of at least size characters"""
+    generator = _Generator(depth, comment_density, string_density, line_length, seed)
+    out = generator.out
+    out.line(0, "#include <stdio.h>")
+    out.line(0, "")
+    index = 0
+    while out.size < size:
+        generator.function(index)
+        index += 1
+    out.line(0, "int main() {")
+    out.line(1, "return function_0(1, 2);")
+    out.line(0, "}")
+    return out.text()
+
+
+def generate_profile(profile, size, seed=0):
+    """Return the program for a named profile in PROFILES"""
+    return generate(size, seed=seed, **PROFILES[profile])
@@ -0,0 +1,460 @@
+import argparse
+import asyncio
+import errno
+import json
+import os
+import signal
+import socket
+import stat
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from batch import export_errors, format_result, make_engine, read_source
+from cache import content_key
+from disk_cache import default_cache_dir
+from engine import ANALYSES
+from validator import DEFAULT_MAX_ERRORS
+
+# Protocol: newline-delimited JSON over a Unix socket or localhost TCP.
+# Requests are {"id": ..., "code": "..." or "path": "...", "analyses": [...]}
+# or {"id": ..., "op": "stats"}; each is answered, possibly out of order,
+# by {"id": ..., "result": {...}} or {"id": ..., "error": "..."}. Only the
+# Unix socket, which is private to its user, takes "path" requests: a TCP
+# port can be reached by other users, who must not read files through it.
+
+# Largest request line accepted, source text included
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+# Jobs queued across all clients before readers stop taking requests
+DEFAULT_MAX_PENDING = 256
+
+# Requests one connection may have in flight
+DEFAULT_CONNECTION_LIMIT = 64
+
+# Jobs handed to a worker in one round trip
+DEFAULT_BATCH_SIZE = 16
+
+# Memory budget of the finished-response cache
+DEFAULT_RESPONSE_CACHE_BYTES = 64 * 1024 * 1024
+
+# Analyzed once per worker at startup so imports and patterns are warm
+_WARMUP_SOURCE = "#include <stdio.h>\nint main() {\n    return 0;\n}\n"
+
+# Engine owned by each worker process (or the daemon itself with one worker)
+_worker_engine = None
+
+
+def default_socket_path():
+    """Return the per-user socket path of the daemon"""
+    directory = os.environ.get('XDG_RUNTIME_DIR') or default_cache_dir()
+    return os.path.join(directory, 'c-analyzer.sock')
+
+
+def _socket_in_use(path):
+    """Return whether a server is accepting connections on the Unix socket path"""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        # Nothing listens: a stale socket left by a daemon that did not shut down
+        return False
+    finally:
+        probe.close()
+    return True
+
+
+def _init_worker(cache_dir, max_errors):
+    """Create the warm engine of one worker"""
+    global _worker_engine
+    _worker_engine = make_engine(cache_dir, max_errors=max_errors)
+
+
+def _analyze_batch(jobs):
+    """Run (code, path, analyses) jobs on the worker engine; return (ok, JSON text) pairs"""
+    replies = []
+    for code, path, analyses in jobs:
+        try:
+            if code is None:
+                code = read_source(path)
+            result = export_errors(_worker_engine.analyze_source(code, analyses), code)
+            if path is not None:
+                result['path'] = path
+            replies.append((True, json.dumps(result, default=list)))
+        except Exception as e:
+            replies.append((False, str(e)))
+    return replies
+
+
+class _ResponseCache:
+    """LRU cache of finished result JSON by source digest and analyses"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        text = self._entries.get(key)
+        if text is not None:
+            self._entries.move_to_end(key)
+        return text
+
+    def put(self, key, text):
+        if len(text) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.current_bytes -= len(previous)
+        self._entries[key] = text
+        self.current_bytes += len(text)
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+
+
+class AnalysisServer:
+    """asyncio server answering analysis requests from a pool of warm engines
+
+    Requests queue in a bounded queue and wait while it is full; a
+    connection with connection_limit requests outstanding stops reading
+    until some are answered. A free worker takes every queued job
+    up to batch_size in one round trip, identical sources in flight share
+    one analysis, and finished results are served from memory.
+    """
+
+    def __init__(self, workers=None, cache_dir=None, max_errors=DEFAULT_MAX_ERRORS,
+                 max_pending=DEFAULT_MAX_PENDING, batch_size=DEFAULT_BATCH_SIZE,
+                 connection_limit=DEFAULT_CONNECTION_LIMIT,
+                 response_cache_bytes=DEFAULT_RESPONSE_CACHE_BYTES):
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.max_errors = max_errors
+        self.batch_size = batch_size
+        self.connection_limit = connection_limit
+        self._max_pending = max_pending
+        self._queue = None
+        self._slots = None
+        self._pool = None
+        self._server = None
+        self._dispatcher = None
+        # Path and (device, inode) of the Unix socket this server created
+        self._socket_path = None
+        self._socket_id = None
+        self._accepts_paths = True
+        # Job key -> future of the analysis in flight
+        self._in_flight = {}
+        self._responses = _ResponseCache(response_cache_bytes)
+        self.stats = {'requests': 0, 'batches': 0, 'cache_hits': 0, 'shared': 0, 'errors': 0}
+
+    async def start(self, path=None, host=None, port=None):
+        """Warm the workers and start listening on a Unix socket or TCP port
+
+        Raises OSError if the socket path is taken by something other than
+        a socket (EEXIST) or another daemon is listening on it (EADDRINUSE);
+        a socket nothing listens on is replaced.
+        """
+        if port is None and os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise OSError(errno.EEXIST, f"{path} exists and is not a socket")
+            if _socket_in_use(path):
+                raise OSError(errno.EADDRINUSE, f"A daemon is already listening on {path}")
+            os.unlink(path)
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self._max_pending)
+        self._slots = asyncio.Semaphore(self.workers)
+        if self.workers == 1:
+            # No process hop: the daemon's own engine runs on one thread
+            _init_worker(self.cache_dir, self.max_errors)
+            self._pool = ThreadPoolExecutor(1)
+        else:
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                             initargs=(self.cache_dir, self.max_errors))
+        warmup = [(_WARMUP_SOURCE, None, ANALYSES)]
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _analyze_batch, warmup)
+                               for _ in range(self.workers)))
+
+        if port is not None:
+            self._accepts_paths = False
+            self._server = await asyncio.start_server(
+                self._handle_client, host or '127.0.0.1', port, limit=MAX_REQUEST_BYTES)
+        else:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            self._server = await asyncio.start_unix_server(
+                self._handle_client, path, limit=MAX_REQUEST_BYTES)
+            os.chmod(path, 0o600)
+            info = os.stat(path)
+            self._socket_path = path
+            self._socket_id = (info.st_dev, info.st_ino)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """Stop accepting requests, remove the socket and shut the workers down
+
+        The socket file is removed only if it is still the one this server
+        created, not one a newer daemon has put in its place.
+        """
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._socket_path is not None:
+            try:
+                info = os.stat(self._socket_path)
+                if (info.st_dev, info.st_ino) == self._socket_id:
+                    os.unlink(self._socket_path)
+            except FileNotFoundError:
+                pass
+            self._socket_path = None
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+
+    async def _handle_client(self, reader, writer):
+        """Read request lines from one connection and answer each as it finishes"""
+        write_lock = asyncio.Lock()
+        in_flight = asyncio.Semaphore(self.connection_limit)
+        tasks = set()
+
+        async def answer(request):
+            try:
+                response = await self._respond(request)
+            finally:
+                in_flight.release()
+            async with write_lock:
+                writer.write(response)
+                await writer.drain()
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_REQUEST_BYTES; the stream cannot be resynchronized
+                    writer.write(b'{"id": null, "error": "request too large"}\n')
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await in_flight.acquire()
+                task = asyncio.create_task(answer(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, line):
+        """Return the response line for one request line"""
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+            request_id = request.get('id')
+            self.stats['requests'] += 1
+            if request.get('op', 'analyze') == 'stats':
+                body = json.dumps(self.snapshot())
+            else:
+                body = await self._analyze(request)
+            return f'{{"id": {json.dumps(request_id)}, "result": {body}}}\n'.encode()
+        except Exception as e:
+            self.stats['errors'] += 1
+            return (json.dumps({'id': request_id, 'error': str(e)}) + "\n").encode()
+
+    async def _analyze(self, request):
+        """Return the result JSON of an analyze request, sharing and caching by content"""
+        analyses = tuple(request.get('analyses') or ANALYSES)
+        unknown = set(analyses) - set(ANALYSES)
+        if unknown:
+            raise ValueError(f"unknown analyses: {', '.join(sorted(unknown))}")
+        code, path = request.get('code'), request.get('path')
+        if (code is None) == (path is None):
+            raise ValueError("a request needs exactly one of code and path")
+        if code is None:
+            if not self._accepts_paths:
+                raise ValueError("path requests are only accepted on the Unix socket; send the source as code")
+            # Files may change between requests, so they are not shared or cached
+            return await self._submit(None, (None, path, analyses))
+
+        key = (content_key(code), analyses)
+        cached = self._responses.get(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.stats['shared'] += 1
+            return await asyncio.shield(future)
+        return await self._submit(key, (code, None, analyses))
+
+    async def _submit(self, key, job):
+        """Queue a job, waiting while the queue is full, and return its result JSON"""
+        future = asyncio.get_running_loop().create_future()
+        if key is not None:
+            self._in_flight[key] = future
+        try:
+            await self._queue.put((job, future))
+            text = await asyncio.shield(future)
+        finally:
+            if key is not None:
+                self._in_flight.pop(key, None)
+        if key is not None:
+            self._responses.put(key, text)
+        return text
+
+    async def _dispatch(self):
+        """Hand queued jobs to free workers, batching whatever has piled up"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            self.stats['batches'] += 1
+            replies = loop.run_in_executor(self._pool, _analyze_batch, [job for job, _ in batch])
+            asyncio.create_task(self._deliver(batch, replies))
+
+    async def _deliver(self, batch, replies):
+        """Resolve the futures of one batch once its worker answers"""
+        try:
+            replies = await replies
+        except Exception as e:
+            replies = [(False, f"worker failed: {e}")] * len(batch)
+        finally:
+            self._slots.release()
+        for (_, future), (ok, text) in zip(batch, replies):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(text)
+            else:
+                future.set_exception(RuntimeError(text))
+
+    def snapshot(self):
+        """Return the counters and queue state as a JSON-serializable dict"""
+        return dict(self.stats, pending=self._queue.qsize(), in_flight=len(self._in_flight),
+                    workers=self.workers, cached_bytes=self._responses.current_bytes)
+
+
+def query(requests, path=None, host=None, port=None):
+    """Send request dicts to a running daemon and return the responses in request order"""
+    if port is not None:
+        connection = socket.create_connection((host or '127.0.0.1', port))
+    else:
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(path or default_socket_path())
+    with connection:
+        requests = [dict(request, id=index) for index, request in enumerate(requests)]
+        connection.sendall(b''.join(json.dumps(request).encode() + b'\n' for request in requests))
+        connection.shutdown(socket.SHUT_WR)
+        responses = [None] * len(requests)
+        with connection.makefile('rb') as stream:
+            for line in stream:
+                response = json.loads(line)
+                if isinstance(response.get('id'), int) and 0 <= response['id'] < len(responses):
+                    responses[response['id']] = response
+        return responses
+
+
+async def _serve(args):
+    server = AnalysisServer(args.workers, None if args.no_cache else args.cache_dir,
+                            args.max_errors or None, args.max_pending, max(1, args.batch_size))
+    await server.start(args.socket, args.host, args.port)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    where = f"{args.host}:{args.port}" if args.port is not None else args.socket
+    print(f"Serving on {where} with {server.workers} worker(s)", file=sys.stderr, flush=True)
+    serving = asyncio.create_task(server.serve_forever())
+    await stop.wait()
+    serving.cancel()
+    await server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve or query the local C analysis daemon")
+    parser.add_argument('--socket', default=default_socket_path(),
+                        help="Unix socket path of the daemon")
+    parser.add_argument('--port', type=int, default=None,
+                        help="use localhost TCP on this port instead of the socket")
+    parser.add_argument('--host', default='127.0.0.1', help="TCP address with --port")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="run the daemon")
+    serve.add_argument('-j', '--workers', type=int, default=None,
+                       help="worker processes (default: CPU count, 1 runs in-process)")
+    serve.add_argument('--cache-dir', default=default_cache_dir(),
+                       help="directory of the persistent result cache")
+    serve.add_argument('--no-cache', action='store_true',
+                       help="do not read or write the persistent cache")
+    serve.add_argument('--max-errors', type=int, default=DEFAULT_MAX_ERRORS,
+                       help="distinct syntax errors reported per source (0: all)")
+    serve.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                       help="queued jobs before clients are made to wait")
+    serve.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                       help="jobs sent to a worker in one round trip")
+
+    analyze = commands.add_parser('analyze', help="analyze files through a running daemon")
+    analyze.add_argument('paths', nargs='+', help="C files to analyze")
+    analyze.add_argument('-a', '--analysis', action='append', choices=ANALYSES,
+                         help="analysis to run (repeatable, default: all)")
+    analyze.add_argument('--json', action='store_true', help="emit one JSON object per file")
+
+    commands.add_parser('stats', help="print the daemon's counters")
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(_serve(args))
+        except OSError as e:
+            print(f"Cannot start the daemon: {e}", file=sys.stderr)
+            return 2
+        return 0
+
+    if args.command == 'analyze':
+        analyses = args.analysis or list(ANALYSES)
+        if args.port is None:
+            requests = [{'path': os.path.abspath(path), 'analyses': analyses} for path in args.paths]
+        else:
+            # A TCP daemon does not read files, so the sources are sent as code
+            try:
+                requests = [{'code': read_source(path), 'analyses': analyses} for path in args.paths]
+            except OSError as e:
+                print(f"Cannot read {e.filename}: {e.strerror}", file=sys.stderr)
+                return 2
+
+    try:
+        if args.command == 'stats':
+            response = query([{'op': 'stats'}], args.socket, args.host, args.port)[0]
+            print(json.dumps(response.get('result', response), indent=2))
+            return 0
+        responses = query(requests, args.socket, args.host, args.port)
+    except OSError as e:
+        print(f"Cannot reach the daemon: {e}", file=sys.stderr)
+        return 2
+
+    failed = 0
+    for path, response in zip(args.paths, responses):
+        if response is None or 'error' in response:
+            result = {'path': path, 'error': response['error'] if response else "no response"}
+        else:
+            result = response['result']
+            result.setdefault('path', path)
+        if result.get('error') or result.get('errors'):
+            failed += 1
+        print(json.dumps(result) if args.json else format_result(result), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
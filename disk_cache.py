@@ -0,0 +1,154 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+# Default size budget for the stored results
+DEFAULT_DISK_BYTES = 512 * 1024 * 1024
+
+# Artifacts worth keeping across runs; trees are cheap to rebuild relative
+# to their pickled size and may nest deeper than pickle can recurse
+PERSISTED_ARTIFACTS = frozenset({'tokens', 'diagnostics', 'grammar', 'grammar_facts', 'file_summary'})
+
+# Rows dropped per eviction round
+_EVICT_BATCH = 64
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT NOT NULL,
+    artifact TEXT NOT NULL,
+    version TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (key, artifact)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, bytes) VALUES (0, 0);
+'''
+
+
+def default_cache_dir():
+    """Return the per-user directory for the persistent cache"""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'c-analyzer')
+
+
+class DiskCache:
+    """SQLite store of analysis results keyed by content hash and analyzer version
+
+    Safe to share between threads and worker processes: every thread gets
+    its own connection and the database runs in WAL mode, so readers do
+    not block the single writer.
+    """
+
+    def __init__(self, directory, version, max_bytes=DEFAULT_DISK_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, 'analysis.sqlite3')
+        self.version = str(version)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        with self._connection() as db:
+            db.executescript(_SCHEMA)
+        # Results of other analyzer versions can never be read again
+        with self._connection() as db:
+            removed = db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM entries WHERE version != ?',
+                (self.version,)).fetchone()[0]
+            if removed:
+                db.execute('DELETE FROM entries WHERE version != ?', (self.version,))
+                db.execute('UPDATE totals SET bytes = bytes - ? WHERE id = 0', (removed,))
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use"""
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    def get(self, key, artifact):
+        """Return (True, value) for a stored artifact, or (False, None)"""
+        if artifact not in PERSISTED_ARTIFACTS:
+            return False, None
+        db = self._connection()
+        row = db.execute(
+            'SELECT value FROM entries WHERE key = ? AND artifact = ? AND version = ?',
+            (key, artifact, self.version)).fetchone()
+        if row is None:
+            return False, None
+        try:
+            value = pickle.loads(row[0])
+        except Exception:
+            # A row written by an incompatible build; treat it as a miss
+            return False, None
+        with db:
+            db.execute('UPDATE entries SET accessed = ? WHERE key = ? AND artifact = ?',
+                       (time.time(), key, artifact))
+        return True, value
+
+    def put(self, key, artifact, value):
+        """Store an artifact and evict the least recently used ones over budget"""
+        if artifact not in PERSISTED_ARTIFACTS:
+            return
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        db = self._connection()
+        with db:
+            # Take the write lock up front so the size bookkeeping is atomic
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute('SELECT size FROM entries WHERE key = ? AND artifact = ?',
+                             (key, artifact)).fetchone()
+            db.execute(
+                'INSERT OR REPLACE INTO entries (key, artifact, version, value, size, accessed) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, artifact, self.version, blob, len(blob), time.time()))
+            db.execute('UPDATE totals SET bytes = bytes + ? WHERE id = 0',
+                       (len(blob) - (row[0] if row else 0),))
+            self._evict(db)
+
+    def _evict(self, db):
+        """Drop the least recently used rows until the store fits its budget"""
+        total = db.execute('SELECT bytes FROM totals WHERE id = 0').fetchone()[0]
+        while total > self.max_bytes:
+            rows = db.execute(
+                'SELECT key, artifact, size FROM entries ORDER BY accessed LIMIT ?',
+                (_EVICT_BATCH,)).fetchall()
+            if not rows:
+                break
+            for key, artifact, size in rows:
+                if total <= self.max_bytes:
+                    break
+                db.execute('DELETE FROM entries WHERE key = ? AND artifact = ?', (key, artifact))
+                total -= size
+            db.execute('UPDATE totals SET bytes = ? WHERE id = 0', (total,))
+
+    @property
+    def total_bytes(self):
+        """Size of the stored results"""
+        return self._connection().execute('SELECT bytes FROM totals WHERE id = 0').fetchone()[0]
+
+    def clear(self):
+        """Drop every stored result"""
+        db = self._connection()
+        with db:
+            db.execute('DELETE FROM entries')
+            db.execute('UPDATE totals SET bytes = 0 WHERE id = 0')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def close(self):
+        """Close this thread's connection"""
+        db = getattr(self._local, 'db', None)
+        if db is not None:
+            db.close()
+            self._local.db = None
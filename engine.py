@@ -0,0 +1,308 @@
+from contextlib import nullcontext
+
+import c_parser
+import export
+import grammar
+import symbols
+import token_buffer
+import tree_model
+import validator
+
+# Analyses the engine can run, in the order the GUI offers them
+ANALYSES = ('lexical', 'syntax', 'grammar')
+
+# Identifies the analyzer's output format in persistent caches; bump it
+# whenever an analysis changes what it returns
+ANALYZER_VERSION = '5'
+
+
+class ReportLines:
+    """Lines of a report whose body rows are formatted only when read"""
+    
+    def __init__(self, header, rows=(), format_row=str):
+        self.header = list(header)
+        self.rows = rows
+        self.format_row = format_row
+    
+    def __len__(self):
+        return len(self.header) + len(self.rows)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index < len(self.header):
+            return self.header[index]
+        return self.format_row(self.rows[index - len(self.header)])
+    
+    def __iter__(self):
+        yield from self.header
+        for row in self.rows:
+            yield self.format_row(row)
+    
+    def __str__(self):
+        return "\n".join(self)
+
+
+def _format_token(token):
+    """Format one (type, value) token as a lexical report line
+
+    Comments, strings and directives can span lines; their line breaks are
+    shown as \\n so that every token stays on one row of the report.
+    """
+    return f"{token[0]}: {token[1]}".replace('\n', '\\n')
+
+
+class AnalysisEngine:
+    """Headless C analysis engine shared by the GUI and the batch CLI"""
+    
+    def __init__(self, cache=None, lexer=None, lex_workers=1, max_errors=validator.DEFAULT_MAX_ERRORS,
+                 preprocessor=None):
+        # Optional AnalysisCache memoizing results per source text
+        self.cache = cache
+        # Optional IncrementalLexer kept in step with an editor buffer
+        self.lexer = lexer
+        # Processes lexing one large source in parallel (None: CPU count)
+        self.lex_workers = lex_workers
+        # Distinct syntax errors collected before validation stops (None: all)
+        self.max_errors = max_errors
+        # Optional Preprocessor resolving includes and macros for analyze_source
+        self.preprocessor = preprocessor
+        # (code, TokenBuffer) of the last text lexed without a cache
+        self._last_tokens = None
+    
+    def _cached(self, artifact, code, compute):
+        """Return compute(code), going through the result cache if there is one"""
+        if self.cache is None:
+            return compute(code)
+        return self.cache.get_or_compute(code, artifact, compute)
+    
+    def diagnostics(self, code):
+        """Return the (possibly cached) syntax errors for code"""
+        # Only results under the default cutoff are worth persisting
+        artifact = 'diagnostics'
+        if self.max_errors != validator.DEFAULT_MAX_ERRORS:
+            artifact = f'diagnostics/{self.max_errors}'
+        return self._cached(artifact, code, self.validate_syntax)
+    
+    def token_buffer(self, code):
+        """Return the (possibly cached) TokenBuffer for code"""
+        if self.lexer is not None:
+            # The editor's lexer may already have patched its tokens for
+            # this text; it checks and shares them under its lock, as the
+            # editor keeps updating it while this runs on a worker thread
+            tokens = self.lexer.tokens_for(code)
+            if tokens is not None:
+                return tokens
+        if self.cache is not None:
+            return self._cached('tokens', code, self.tokenize_c_code)
+        # Still lex a text only once for all the analyses run on it
+        last = self._last_tokens
+        if last is not None and last[0] is code:
+            return last[1]
+        tokens = self.tokenize_c_code(code)
+        self._last_tokens = (code, tokens)
+        return tokens
+    
+    def tokens(self, code):
+        """Return the (possibly cached) token stream for code"""
+        return self.token_buffer(code)
+    
+    def ast(self, code):
+        """Return the (possibly cached) AST for code"""
+        return self._cached('ast', code, self.parse_c_code)[0]
+    
+    def syntax_tree(self, code):
+        """Return the (possibly cached) syntax tree for code"""
+        return self._cached('syntax_tree', code, self.build_c_syntax_tree)
+    
+    def syntax_model(self, code):
+        """Return the (possibly cached) SyntaxTreeModel for code"""
+        return self._cached(
+            'syntax_model', code,
+            lambda code: tree_model.SyntaxTreeModel(code, self.ast(code)))
+    
+    def grammar_facts(self, code):
+        """Return the (possibly cached) GrammarFacts for code"""
+        return self._cached(
+            'grammar_facts', code,
+            lambda code: grammar.collect_facts(code, self.token_buffer(code)))
+    
+    def symbols(self, code):
+        """Return the (possibly cached) SymbolIndex for code"""
+        return self._cached(
+            'symbols', code,
+            lambda code: symbols.index_symbols(code, self.token_buffer(code)))
+    
+    def preprocess(self, code, path=None):
+        """Return code preprocessed as a Preprocessed token stream"""
+        # Not in the result cache: the outcome depends on headers on disk,
+        # which the preprocessor tracks by mtime itself
+        return self.preprocessor.run(code, path, self.token_buffer(code))
+    
+    def file_summary(self, code):
+        """Return the (possibly cached) FileSummary a project index merges for code"""
+        return self._cached('file_summary', code, lambda code: symbols.summarize(self.symbols(code)))
+    
+    def grammar(self, code):
+        """Return the (possibly cached) grammar report for code"""
+        return self._cached('grammar', code, self.analyze_c_grammar)
+    
+    @staticmethod
+    def _progress(progress, message):
+        """Report a phase change to an optional progress callback"""
+        if progress is not None:
+            progress(message)
+    
+    @staticmethod
+    def _phase(metrics, name):
+        """Time a block as a phase of an optional RunMetrics"""
+        if metrics is None:
+            return nullcontext()
+        return metrics.phase(name)
+    
+    def _check(self, code, progress, metrics):
+        """Validate code as the first phase of a report and count its size"""
+        self._progress(progress, "Checking syntax")
+        with self._phase(metrics, 'validate'):
+            syntax_errors = self.diagnostics(code)
+        if metrics is not None:
+            metrics.count('lines', code.count('\n') + 1)
+            metrics.count('diagnostics', len(syntax_errors))
+        return syntax_errors
+    
+    def lexical_report(self, code, progress=None, metrics=None):
+        """Perform lexical analysis and return the report lines"""
+        syntax_errors = self._check(code, progress, metrics)
+        if syntax_errors:
+            return ReportLines([
+                "Cannot perform lexical analysis due to syntax errors.",
+                "Please fix the syntax errors first."
+            ])
+        
+        self._progress(progress, "Tokenizing")
+        with self._phase(metrics, 'tokenize'):
+            tokens = self.tokens(code)
+        if metrics is not None:
+            metrics.count('tokens', len(tokens))
+        # Token lines are formatted lazily as the output view shows them
+        return ReportLines(["=== Lexical Analysis ==="], tokens, _format_token)
+    
+    def syntax_report(self, code, progress=None, metrics=None):
+        """Perform syntax analysis and return the error lines or a SyntaxTreeModel"""
+        # Check syntax and get detailed errors
+        syntax_errors = self._check(code, progress, metrics)
+        if syntax_errors:
+            with self._phase(metrics, 'assemble'):
+                lines = ["=== Syntax Analysis ===", "", "Syntax Errors Found:"]
+                for error, source_line in validator.snippets(code, syntax_errors):
+                    lines.append("")
+                    lines.append(str(error))
+                    lines.append(f"Code: {source_line}")
+                    lines.append(f"      {' ' * error.position}^")
+                if syntax_errors.truncated:
+                    lines.append("")
+                    lines.append(f"Stopped after {len(syntax_errors)} errors; fix these first.")
+            return ReportLines(lines)
+        
+        self._progress(progress, "Building syntax tree")
+        with self._phase(metrics, 'syntax_tree'):
+            model = self.syntax_model(code)
+        if metrics is not None:
+            metrics.count('tree_nodes', len(model))
+        # The tree view shows the model level by level as nodes are expanded
+        return model
+    
+    def grammar_report(self, code, progress=None, metrics=None):
+        """Perform grammar analysis and return the report lines"""
+        syntax_errors = self._check(code, progress, metrics)
+        if syntax_errors:
+            return ReportLines([
+                "Cannot perform grammar analysis due to syntax errors.",
+                "Please fix the syntax errors first."
+            ])
+        
+        self._progress(progress, "Checking grammar rules")
+        with self._phase(metrics, 'grammar'):
+            facts = self.grammar_facts(code)
+        with self._phase(metrics, 'symbols'):
+            index = self.symbols(code)
+        with self._phase(metrics, 'assemble'):
+            rules = facts.rules() + index.rules()
+        return ReportLines(["=== Grammar Analysis ==="], rules)
+    
+    def analyze_source(self, code, analyses=ANALYSES, metrics=None, path=None):
+        """Run the requested analyses on code and return structured results
+
+        path, if given, is where code was read from; quoted #includes are
+        resolved relative to it when the engine has a preprocessor.
+        """
+        result = {'errors': self._check(code, None, metrics)}
+        # Like the GUI, the deeper analyses only run on syntactically valid code
+        if result['errors']:
+            return result
+        if 'lexical' in analyses:
+            with self._phase(metrics, 'tokenize'):
+                result['tokens'] = self.tokens(code)
+            if metrics is not None:
+                metrics.count('tokens', len(result['tokens']))
+        if 'syntax' in analyses:
+            with self._phase(metrics, 'syntax_tree'):
+                result['syntax_tree'] = self.syntax_tree(code)
+        if 'grammar' in analyses:
+            with self._phase(metrics, 'grammar'):
+                result['grammar'] = self.grammar(code)
+                result['grammar_facts'] = self.grammar_facts(code).as_dict()
+                result['symbols'] = self.symbols(code).as_dict()
+        if self.preprocessor is not None:
+            with self._phase(metrics, 'preprocess'):
+                preprocessed = self.preprocess(code, path)
+            if metrics is not None:
+                metrics.count('expanded_tokens', len(preprocessed.tokens))
+            result['preprocessor'] = preprocessed.as_dict()
+        return result
+    
+    def export_report(self, code, path, progress=None, metrics=None):
+        """Stream code's results to path and return a one-line report
+
+        A path ending in export.TOKEN_FILE_EXTENSION gets the binary token
+        file; any other gets JSON lines of the diagnostics, grammar facts
+        and tokens.
+        """
+        self._progress(progress, "Tokenizing")
+        with self._phase(metrics, 'tokenize'):
+            tokens = self.token_buffer(code)
+        self._progress(progress, f"Writing {path}")
+        with self._phase(metrics, 'export'):
+            if path.endswith(export.TOKEN_FILE_EXTENSION):
+                count = export.write_token_file(path, tokens)
+                summary = f"Wrote {count} tokens to {path}"
+            else:
+                count = export.write_jsonl(path, export.jsonl_lines(code, self))
+                summary = f"Wrote {count} records to {path}"
+        if metrics is not None:
+            metrics.count('tokens', len(tokens))
+        return ReportLines(["=== Export ===", "", summary])
+    
+    def validate_syntax(self, code):
+        """Validate basic C syntax and return detailed errors"""
+        return validator.validate(code, self.token_buffer(code), self.max_errors)
+    
+    def tokenize_c_code(self, code):
+        """Tokenize C code into a TokenBuffer of meaningful components"""
+        if self.lex_workers != 1:
+            return token_buffer.lex_parallel(code, self.lex_workers)
+        return token_buffer.lex(code)
+    
+    def build_c_syntax_tree(self, code):
+        """Build a syntax tree for C code"""
+        return c_parser.format_tree(self.ast(code))
+    
+    def parse_c_code(self, code):
+        """Parse C code into an AST, returning (TranslationUnit, parse errors)"""
+        return c_parser.parse(code, self.token_buffer(code))
+    
+    def analyze_c_grammar(self, code):
+        """Analyze C code grammar and structure"""
+        return "\n".join(self.grammar_facts(code).rules() + self.symbols(code).rules())
@@ -0,0 +1,215 @@
+import json
+import mmap
+import struct
+import sys
+from array import array
+from itertools import islice
+
+from token_buffer import KIND_NAMES
+from validator import snippets
+
+# Binary token file layout, all little-endian:
+#   header   magic, version, token count, string count, records offset,
+#            string table offset
+#   records  one fixed-width record per token: kind code, line, column
+#            and the index of its text in the string table
+#   strings  string count + 1 uint32 byte offsets, then the UTF-8 text
+#            of every distinct token value back to back
+TOKEN_FILE_MAGIC = b'CTOK'
+TOKEN_FILE_VERSION = 1
+TOKEN_FILE_EXTENSION = '.ctok'
+_HEADER = struct.Struct('<4sIQQQQ')
+_RECORD = struct.Struct('<B3xIII')
+
+# Records or lines buffered before each write
+_WRITE_BATCH = 65536
+
+_encode_string = json.encoder.encode_basestring
+
+
+class TokenFileWriter:
+    """Streams token records to a binary token file
+
+    Records go to disk in batches as tokens are added; only the table of
+    distinct token values is kept until close() appends it.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._file.write(bytes(_HEADER.size))
+        self._records = bytearray()
+        # Token value -> index in the string table
+        self._strings = {}
+        self.count = 0
+
+    def add(self, kind, value, line, column):
+        """Append one token; kind is a TokenBuffer kind code"""
+        index = self._strings.get(value)
+        if index is None:
+            index = self._strings[value] = len(self._strings)
+        self._records += _RECORD.pack(kind, line, column, index)
+        self.count += 1
+        if self.count % _WRITE_BATCH == 0:
+            self._file.write(self._records)
+            self._records.clear()
+
+    def extend(self, kinds, lines, columns, values):
+        """Append tokens given as parallel columns and an iterable of their texts"""
+        get = self._strings.get
+        strings = self._strings
+        indices = array('I')
+        for value in values:
+            index = get(value)
+            if index is None:
+                index = strings[value] = len(strings)
+            indices.append(index)
+        if sys.byteorder == 'little':
+            # Each record is four uint32 words here (the kind's padding is
+            # zero), so whole columns are copied in with strided slices
+            records = bytearray(len(indices) * _RECORD.size)
+            words = memoryview(records).cast('I')
+            words[0::4] = array('I', kinds)
+            words[1::4] = array('I', lines)
+            words[2::4] = array('I', columns)
+            words[3::4] = indices
+            words.release()
+        else:
+            records = b''.join(map(_RECORD.pack, kinds, lines, columns, indices))
+        self._file.write(self._records)
+        self._records.clear()
+        self._file.write(records)
+        self.count += len(indices)
+
+    def close(self):
+        """Write the string table and the header and close the file"""
+        if self._file.closed:
+            return
+        self._file.write(self._records)
+        self._records.clear()
+        strings_offset = self._file.tell()
+        encoded = [value.encode('utf-8', 'surrogatepass') for value in self._strings]
+        offsets = [0]
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        self._file.write(struct.pack(f'<{len(offsets)}I', *offsets))
+        self._file.writelines(encoded)
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(TOKEN_FILE_MAGIC, TOKEN_FILE_VERSION, self.count,
+                                      len(encoded), _HEADER.size, strings_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TokenFile:
+    """Memory-mapped binary token file, read like a TokenBuffer
+
+    Records are unpacked on access and token values are decoded from the
+    string table the first time they are read.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count, string_count, self._records, strings = \
+            _HEADER.unpack_from(self._map)
+        if magic != TOKEN_FILE_MAGIC or version != TOKEN_FILE_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {TOKEN_FILE_VERSION} token file")
+        self._offsets = memoryview(self._map)[strings:strings + 4 * (string_count + 1)].cast('I')
+        self._text_start = strings + 4 * (string_count + 1)
+        self._values = {}
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        kind, _, _, string = self._record(index)
+        return KIND_NAMES[kind], self._string(string)
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def _record(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("token index out of range")
+        return _RECORD.unpack_from(self._map, self._records + index * _RECORD.size)
+
+    def _string(self, string):
+        value = self._values.get(string)
+        if value is None:
+            start = self._text_start + self._offsets[string]
+            end = self._text_start + self._offsets[string + 1]
+            value = self._values[string] = self._map[start:end].decode('utf-8', 'surrogatepass')
+        return value
+
+    def kind(self, index):
+        """Return the kind name of token index"""
+        return KIND_NAMES[self._record(index)[0]]
+
+    def value(self, index):
+        """Return the text of token index"""
+        return self._string(self._record(index)[3])
+
+    def position(self, index):
+        """Return the (line, column) of token index"""
+        return self._record(index)[1:3]
+
+    def close(self):
+        self._offsets.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_token_file(path, tokens):
+    """Write a TokenBuffer to a binary token file and return the token count"""
+    value = tokens.value
+    with TokenFileWriter(path) as writer:
+        for start in range(0, len(tokens), _WRITE_BATCH):
+            end = min(start + _WRITE_BATCH, len(tokens))
+            writer.extend(tokens.kinds[start:end], tokens.lines[start:end],
+                          tokens.columns[start:end], map(value, range(start, end)))
+    return writer.count
+
+
+def jsonl_lines(code, engine):
+    """Yield JSON lines for code's diagnostics, grammar facts and tokens, in that order"""
+    for error, source_line in snippets(code, engine.diagnostics(code)):
+        yield json.dumps(dict({'type': 'diagnostic'}, **error.as_dict(), code=source_line)) + "\n"
+    yield json.dumps(dict({'type': 'grammar_facts'}, **engine.grammar_facts(code).as_dict())) + "\n"
+    # Tokens dominate the output, so their lines are formatted directly
+    tokens = engine.token_buffer(code)
+    kinds = tokens.kinds
+    lines = tokens.lines
+    columns = tokens.columns
+    for index in range(len(tokens)):
+        yield (f'{{"type": "token", "kind": "{KIND_NAMES[kinds[index]]}", '
+               f'"value": {_encode_string(tokens.value(index))}, '
+               f'"line": {lines[index]}, "column": {columns[index]}}}\n')
+
+
+def write_jsonl(path, lines):
+    """Write JSON lines to path in batches and return how many were written"""
+    count = 0
+    lines = iter(lines)
+    with open(path, 'w', encoding='utf-8') as f:
+        while True:
+            batch = list(islice(lines, _WRITE_BATCH))
+            if not batch:
+                return count
+            f.writelines(batch)
+            count += len(batch)
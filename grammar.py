@@ -0,0 +1,180 @@
+import scanner
+import token_buffer
+from c_parser import TYPE_KEYWORDS
+from scanner import COMMENT_GROUP, IDENTIFIER_GROUP, OPERATOR_GROUP, PREPROCESSOR_GROUP, STRING_GROUP
+from token_buffer import KEYWORD_KIND
+
+# Statements the report counts; each must be followed by a '(' condition
+CONTROL_STATEMENTS = ('if', 'for', 'while')
+
+# Keywords that never name a function's return type
+_NON_TYPE_KEYWORDS = scanner.C_KEYWORDS - TYPE_KEYWORDS
+
+# Indentation unit the report expects
+INDENT_WIDTH = 4
+
+
+class GrammarFacts:
+    """Structural facts about a C source, rendered into the grammar report"""
+
+    def __init__(self):
+        self.has_main = False
+        # Header names of #include <...> and #include "..." directives
+        self.includes = []
+        # Signatures of functions declared or defined at file scope
+        self.functions = []
+        # Control statement keyword -> number of occurrences
+        self.control = dict.fromkeys(CONTROL_STATEMENTS, 0)
+        self.open_braces = 0
+        self.close_braces = 0
+        # Declarations of the form `type name = ...`
+        self.initialized_declarations = 0
+        self.semicolons = 0
+        # 1-based lines whose indentation is not a multiple of INDENT_WIDTH
+        self.misindented_lines = []
+
+    def as_dict(self):
+        """Return the facts as a JSON-serializable dict"""
+        return {
+            'has_main': self.has_main,
+            'includes': list(self.includes),
+            'functions': list(self.functions),
+            'control': dict(self.control),
+            'open_braces': self.open_braces,
+            'close_braces': self.close_braces,
+            'initialized_declarations': self.initialized_declarations,
+            'semicolons': self.semicolons,
+            'misindented_lines': list(self.misindented_lines),
+        }
+
+    def rules(self):
+        """Render the facts as grammar report lines"""
+        rules = []
+        if self.has_main:
+            rules.append("✓ Main function found")
+        else:
+            rules.append("✗ Main function not found")
+
+        if self.includes:
+            rules.append("✓ Header files included")
+
+        if self.functions:
+            rules.append(f"✓ Found {len(self.functions)} function(s):")
+            for signature in self.functions:
+                rules.append(f"  - {signature}")
+
+        if self.control['if']:
+            rules.append("✓ If statements present")
+        if self.control['for']:
+            rules.append("✓ For loops present")
+        if self.control['while']:
+            rules.append("✓ While loops present")
+
+        if self.open_braces == self.close_braces:
+            rules.append("✓ Balanced braces")
+        else:
+            rules.append(f"✗ Unbalanced braces: {self.open_braces} opening, "
+                         f"{self.close_braces} closing")
+
+        if self.initialized_declarations:
+            rules.append("✓ Variable declarations found")
+
+        if self.semicolons:
+            rules.append(f"✓ Found {self.semicolons} statements")
+
+        if not self.misindented_lines:
+            rules.append(f"✓ Proper indentation ({INDENT_WIDTH} spaces)")
+        else:
+            rules.append("✗ Inconsistent indentation")
+        return rules
+
+    def __str__(self):
+        return "\n".join(self.rules())
+
+
+def _include_name(directive):
+    """Return the header named by an #include directive, or None"""
+    body = directive[1:].lstrip()
+    if not body.startswith('include'):
+        return None
+    body = body[len('include'):].strip()
+    if len(body) >= 2 and body[0] in '<"':
+        end = body.find('>' if body[0] == '<' else '"', 1)
+        if end != -1:
+            return body[1:end]
+    return None
+
+
+def collect_facts(code, tokens=None):
+    """Collect every grammar fact about code in one pass over its tokens"""
+    if tokens is None:
+        tokens = token_buffer.lex(code)
+    facts = GrammarFacts()
+    control = facts.control
+    keywords = scanner.C_KEYWORDS
+    brace_depth = 0
+    paren_depth = 0
+    # The two identifiers or keywords before the current token as
+    # (value, start), reset by anything else so only adjacent words pair up
+    previous = before_previous = None
+    # Start offset of a file-scope function signature whose ')' is pending
+    signature_start = None
+    # Line on which the previous token ended
+    last_line = 0
+
+    columns = zip(tokens.kinds, tokens.starts, tokens.lengths, tokens.lines, tokens.columns)
+    for group, start, length, line, column in columns:
+        end = start + length
+        if line != last_line:
+            # The token opens its line
+            if column % INDENT_WIDTH:
+                facts.misindented_lines.append(line)
+        last_line = line
+        if group == COMMENT_GROUP or group == PREPROCESSOR_GROUP or group == STRING_GROUP:
+            last_line += code.count('\n', start, end)
+
+        if group == IDENTIFIER_GROUP or group == KEYWORD_KIND:
+            before_previous = previous
+            previous = (code[start:end], start)
+            continue
+        if group == OPERATOR_GROUP:
+            value = code[start:end]
+            if value == '(':
+                if previous is not None:
+                    word = previous[0]
+                    if word in control:
+                        control[word] += 1
+                    elif word not in keywords:
+                        if word == 'main' and before_previous is not None and before_previous[0] == 'int':
+                            facts.has_main = True
+                        if (brace_depth == 0 and paren_depth == 0 and before_previous is not None
+                                and before_previous[0] not in _NON_TYPE_KEYWORDS):
+                            signature_start = before_previous[1]
+                paren_depth += 1
+            elif value == ')':
+                paren_depth = max(0, paren_depth - 1)
+                if paren_depth == 0 and signature_start is not None:
+                    facts.functions.append(' '.join(code[signature_start:end].split()))
+                    signature_start = None
+            elif value == '{':
+                facts.open_braces += 1
+                brace_depth += 1
+            elif value == '}':
+                facts.close_braces += 1
+                brace_depth = max(0, brace_depth - 1)
+            elif value == ';':
+                facts.semicolons += 1
+            elif (value == '=' and previous is not None and before_previous is not None
+                  and previous[0] not in keywords
+                  and (before_previous[0] in TYPE_KEYWORDS or before_previous[0] not in keywords)):
+                facts.initialized_declarations += 1
+        elif group == PREPROCESSOR_GROUP:
+            header = _include_name(code[start:end].strip())
+            if header is not None:
+                facts.includes.append(header)
+        elif group == COMMENT_GROUP:
+            # Comments do not separate the words around them
+            continue
+        previous = before_previous = None
+
+    return facts
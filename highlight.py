@@ -0,0 +1,107 @@
+# Lines highlighted above and below the visible rows so small scrolls
+# show colored text straight away
+HIGHLIGHT_MARGIN = 50
+
+# Text tag options per token type; other types are left plain
+TOKEN_STYLES = {
+    'KEYWORD': {'foreground': '#0033b3'},
+    'COMMENT': {'foreground': '#8c8c8c'},
+    'STRING': {'foreground': '#067d17'},
+    'NUMBER': {'foreground': '#1750eb'},
+    'PREPROCESSOR': {'foreground': '#9e880d'},
+}
+
+# Marks text whose tags are out of date; Tk moves it along with edits,
+# so lines edited while scrolled out of view are re-tagged once shown
+STALE_TAG = 'stale'
+
+
+def _line_number(index):
+    return int(index.split('.')[0])
+
+
+class SyntaxHighlighter:
+    """Colors the tokens of a Text widget from an IncrementalLexer
+
+    Only stale lines within the visible rows plus a margin are re-tagged,
+    in one tag_add call per token type, from an idle callback.
+    """
+
+    def __init__(self, text, lexer, margin=HIGHLIGHT_MARGIN):
+        self.text = text
+        self.lexer = lexer
+        self.margin = margin
+        self._pending = None
+        for kind, style in TOKEN_STYLES.items():
+            text.tag_configure(kind, **style)
+        # A selection must stay readable over colored tokens
+        text.tag_raise('sel')
+        # Scrolling shows lines that may still be stale
+        self._yscrollcommand = str(text.cget('yscrollcommand'))
+        text.configure(yscrollcommand=self._on_yscroll)
+
+    def _on_yscroll(self, first, last):
+        if self._yscrollcommand:
+            self.text.tk.eval(f"{self._yscrollcommand} {first} {last}")
+        self.schedule()
+
+    def invalidate(self, first_line, last_line):
+        """Mark lines first_line to last_line (1-based) for re-highlighting"""
+        self.text.tag_add(STALE_TAG, f"{first_line}.0", f"{last_line + 1}.0")
+        self.schedule()
+
+    def schedule(self):
+        """Highlight the visible stale lines once Tk is idle"""
+        if self._pending is None:
+            self._pending = self.text.after_idle(self._highlight_visible)
+
+    def cancel(self):
+        """Drop a scheduled pass, e.g. while the lexer lags behind an edit"""
+        if self._pending is not None:
+            self.text.after_cancel(self._pending)
+            self._pending = None
+
+    def _highlight_visible(self):
+        """Re-tag the stale lines within the visible rows and the margin"""
+        self._pending = None
+        text = self.text
+        first = max(1, _line_number(text.index('@0,0')) - self.margin)
+        last = _line_number(text.index(f'@0,{text.winfo_height()}')) + self.margin
+        start, end = f'{first}.0', text.index(f'{last + 1}.0')
+        while True:
+            stale = text.tag_nextrange(STALE_TAG, start, end)
+            if not stale:
+                break
+            region_start = text.index(f'{stale[0]} linestart')
+            region_end = stale[1] if text.compare(stale[1], '<', end) else end
+            self.highlight(region_start, region_end)
+            start = region_end
+
+    def highlight(self, start, end):
+        """Re-tag the tokens between a line start index and end"""
+        text = self.text
+        source = self.lexer.text
+        line = _line_number(start)
+        offset = (text.count('1.0', start, 'chars') or (0,))[0]
+        end_offset = offset + (text.count(start, end, 'chars') or (0,))[0]
+
+        # Token offsets only grow, so line and column are tracked as we go
+        ranges = {kind: [] for kind in TOKEN_STYLES}
+        pos = line_start = offset
+        for kind, token_start, token_end in self.lexer.tokens_between(offset, end_offset):
+            indices = ranges.get(kind)
+            if indices is None:
+                continue
+            for at in (max(token_start, offset), min(token_end, end_offset)):
+                newlines = source.count('\n', pos, at)
+                if newlines:
+                    line += newlines
+                    line_start = source.rfind('\n', pos, at) + 1
+                pos = at
+                indices.append(f'{line}.{at - line_start}')
+
+        for kind, indices in ranges.items():
+            text.tag_remove(kind, start, end)
+            if indices:
+                text.tag_add(kind, *indices)
+        text.tag_remove(STALE_TAG, start, end)
@@ -0,0 +1,314 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import repeat
+from operator import add
+
+import scanner
+from token_buffer import KIND_CODES, KIND_NAMES, TokenBuffer
+
+
+def common_prefix_length(a, b):
+    """Length of the common prefix of two strings, compared in large slices"""
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[low:mid] == b[low:mid]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def common_suffix_length(a, b, limit):
+    """Length of the common suffix of two strings, at most limit"""
+    low, high = 0, limit
+    while low < high:
+        mid = (low + high + 1) // 2
+        if a[len(a) - mid:len(a) - low] == b[len(b) - mid:len(b) - low]:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+class IncrementalLexer:
+    """Token stream of an editor buffer that is patched in place on edits
+
+    The editor thread calls update() and tokens_between(); an analysis
+    thread may take the tokens with tokens_for() at the same time, as the
+    three hold one lock.
+    """
+
+    def __init__(self, text=""):
+        self.text = ""
+        # TokenBuffer columns of text. Entries from _pending_index on are
+        # stored without the pending _pending_delta offset and
+        # _pending_lines line shift, so repeated edits in one place do not
+        # shift the whole tail; columns never need shifting, as a token
+        # past the edit is only reused when its line is past the edit too
+        self._buffer = TokenBuffer("")
+        self._pending_index = None
+        self._pending_delta = 0
+        self._pending_lines = 0
+        # Whether token_buffer() handed out the columns, which must then be
+        # copied before the next edit changes them
+        self._shared = False
+        # Held while the columns or the pending shift are read or changed
+        self._lock = threading.RLock()
+        # 1-based (first, last) line range re-lexed by the last update
+        self.last_dirty_lines = None
+        # Number of tokens re-scanned by the last update
+        self.last_rescanned = 0
+        if text:
+            self.update(text)
+
+    def token_buffer(self, source=None):
+        """Return the tokens of self.text as a TokenBuffer over source
+
+        source defaults to self.text and may be any text the tokens line up
+        with. The columns are shared, not copied; the next update copies
+        them before patching, so the returned buffer stays valid.
+        """
+        with self._lock:
+            return self._share(source)
+
+    def tokens_for(self, code):
+        """Return the TokenBuffer of code if it is the lexed text, else None
+
+        matches() and token_buffer() in one step, so an update() on another
+        thread cannot slip in between and hand out tokens of newer text.
+        """
+        with self._lock:
+            if not self.matches(code):
+                return None
+            return self._share(code)
+
+    def _share(self, source):
+        """token_buffer() with the lock held"""
+        self._flush()
+        self._shared = True
+        buffer = self._buffer
+        tokens = TokenBuffer(self.text if source is None else source)
+        tokens.kinds = buffer.kinds
+        tokens.starts = buffer.starts
+        tokens.lengths = buffer.lengths
+        tokens.lines = buffer.lines
+        tokens.columns = buffer.columns
+        return tokens
+
+    def matches(self, code):
+        """Check whether the tokens of code are the lexed ones: code must be
+        the buffer less trailing whitespace that no token reaches into"""
+        with self._lock:
+            text = self.text
+            if not text.startswith(code) or text[len(code):].strip(scanner.WHITESPACE):
+                return False
+            count = len(self._buffer)
+            return not count or self._span(count - 1)[1] <= len(code)
+
+    def _flush(self):
+        """Apply the pending offset and line shift to the stored columns"""
+        index = self._pending_index
+        if index is None:
+            return
+        buffer = self._buffer
+        if self._pending_delta:
+            buffer.starts[index:] = array('q', map(add, buffer.starts[index:], repeat(self._pending_delta)))
+        if self._pending_lines:
+            buffer.lines[index:] = array('I', map(add, buffer.lines[index:], repeat(self._pending_lines)))
+        self._pending_index = None
+        self._pending_delta = 0
+        self._pending_lines = 0
+
+    def _start(self, index):
+        """Return the current start offset of the token at index"""
+        start = self._buffer.starts[index]
+        if self._pending_index is not None and index >= self._pending_index:
+            return start + self._pending_delta
+        return start
+
+    def _span(self, index):
+        """Return the current (start, end) of the token at index"""
+        start = self._start(index)
+        return start, start + self._buffer.lengths[index]
+
+    def _line(self, index):
+        """Return the current line of the token at index"""
+        line = self._buffer.lines[index]
+        if self._pending_index is not None and index >= self._pending_index:
+            return line + self._pending_lines
+        return line
+
+    def tokens_between(self, start, end):
+        """Return (type, start, end) of the tokens overlapping text[start:end]"""
+        with self._lock:
+            return self._tokens_between(start, end)
+
+    def _tokens_between(self, start, end):
+        count = len(self._buffer)
+        pending, delta = self._pending_index, self._pending_delta
+        if pending is None:
+            pending, delta = count, 0
+        # Stored starts are sorted on either side of the pending shift
+        starts = self._buffer.starts
+        index = bisect_right(starts, start, 0, pending)
+        if index == pending:
+            index = bisect_right(starts, start - delta, pending, count)
+        # The token before the first one starting past start may reach it
+        if index and self._span(index - 1)[1] > start:
+            index -= 1
+        kinds = self._buffer.kinds
+        found = []
+        while index < count:
+            token_start, token_end = self._span(index)
+            if token_start >= end:
+                break
+            found.append((KIND_NAMES[kinds[index]], token_start, token_end))
+            index += 1
+        return found
+
+    def _reaching(self, pos, limit):
+        """Index of the first token below limit that ends at or after pos"""
+        index = bisect_left(self._buffer.starts, pos, 0, limit)
+        if index and self._span(index - 1)[1] >= pos:
+            index -= 1
+        return index
+
+    def _safe_restart(self, text, pos):
+        """Find the nearest line start at or before pos outside any token"""
+        restart = text.rfind('\n', 0, pos) + 1
+        count = len(self._buffer)
+        # Stored starts are only sorted below the pending shift, so an edit
+        # on a later line than the shifted tokens has to apply it first
+        pending = self._pending_index
+        if pending is not None and pending < count and restart > self._start(pending):
+            self._flush()
+            pending = None
+        limit = count if pending is None else pending
+
+        index = self._reaching(restart, limit)
+        # A token straddling the line start means the line opens inside a
+        # comment, string or continued directive; back up to its line
+        while index < count and self._start(index) < restart:
+            restart = text.rfind('\n', 0, self._start(index)) + 1
+            index = self._reaching(restart, limit)
+        return restart, index
+
+    def update(self, new_text):
+        """Re-lex only the region of new_text that differs from the last text"""
+        with self._lock:
+            self._update(new_text)
+
+    def _update(self, new_text):
+        old_text = self.text
+        if new_text == old_text:
+            self.last_dirty_lines = None
+            self.last_rescanned = 0
+            return
+
+        prefix = common_prefix_length(old_text, new_text)
+        suffix = common_suffix_length(
+            old_text, new_text, min(len(old_text), len(new_text)) - prefix)
+        delta = len(new_text) - len(old_text)
+        changed_end = len(new_text) - suffix
+
+        restart, first = self._safe_restart(old_text, prefix)
+        if first:
+            line = self._line(first - 1) + old_text.count('\n', self._start(first - 1), restart)
+        else:
+            line = old_text.count('\n', 0, restart) + 1
+        first_line = line
+        line_start = counted = restart
+
+        # Scan the new text until a token lines up with an old one again
+        kinds = array('B')
+        starts = array('q')
+        lengths = array('I')
+        lines = array('I')
+        columns = array('I')
+        old_kinds = self._buffer.kinds
+        count = len(old_kinds)
+        resync = count
+        index = first
+        for kind, start, end in scanner.scan(new_text, restart):
+            newlines = new_text.count('\n', counted, start)
+            if newlines:
+                line += newlines
+                line_start = new_text.rfind('\n', counted, start) + 1
+            counted = start
+            code = KIND_CODES[kind]
+            # Past the edit's last line the text before a token on its line
+            # is unchanged, so an old token there kept its column too
+            if line_start > changed_end:
+                old_end = end - delta
+                while index < count and self._span(index)[1] < old_end:
+                    index += 1
+                if (index < count and self._span(index) == (start - delta, old_end)
+                        and old_kinds[index] == code):
+                    resync = index
+                    break
+            kinds.append(code)
+            starts.append(start)
+            lengths.append(end - start)
+            lines.append(line)
+            columns.append(start - line_start)
+
+        line_delta = line - self._line(resync) if resync < count else 0
+        self._splice(first, resync, (kinds, starts, lengths, lines, columns), delta, line_delta)
+
+        self.text = new_text
+        self._buffer.source = new_text
+        # Re-lexed tokens past the edit (an opened comment, say) changed too
+        dirty_end = max(changed_end, restart, starts[-1] + lengths[-1] if starts else 0)
+        self.last_dirty_lines = (first_line, first_line + new_text.count('\n', restart, dirty_end))
+        self.last_rescanned = len(kinds)
+
+    def _splice(self, first, resync, new_columns, delta, line_delta):
+        """Replace tokens[first:resync] and defer shifting the tail by delta
+        characters and line_delta lines"""
+        buffer = self._buffer
+        if self._shared:
+            # A buffer handed out earlier keeps the columns it was given
+            shared = buffer
+            buffer = self._buffer = TokenBuffer(shared.source)
+            buffer.kinds = shared.kinds[:]
+            buffer.starts = shared.starts[:]
+            buffer.lengths = shared.lengths[:]
+            buffer.lines = shared.lines[:]
+            buffer.columns = shared.columns[:]
+            self._shared = False
+        pending = self._pending_index
+        kinds, starts, lengths, lines, columns = new_columns
+        # Where the tail still to be shifted by delta and line_delta starts
+        shifted = first + len(kinds)
+        if pending is not None and resync < pending:
+            # Tokens between the resync point and the pending shift are
+            # stored as-is, so this edit's shift is applied to them now; the
+            # stored columns are unsigned and cannot hold an offset relative
+            # to the later, larger pending shift
+            if delta:
+                buffer.starts[resync:pending] = array(
+                    'q', map(add, buffer.starts[resync:pending], repeat(delta)))
+            if line_delta:
+                buffer.lines[resync:pending] = array(
+                    'I', map(add, buffer.lines[resync:pending], repeat(line_delta)))
+            shifted = pending + len(kinds) - (resync - first)
+
+        buffer.kinds[first:resync] = kinds
+        buffer.starts[first:resync] = starts
+        buffer.lengths[first:resync] = lengths
+        buffer.lines[first:resync] = lines
+        buffer.columns[first:resync] = columns
+
+        if pending is not None:
+            delta += self._pending_delta
+            line_delta += self._pending_lines
+        if delta or line_delta:
+            self._pending_index = shifted
+            self._pending_delta = delta
+            self._pending_lines = line_delta
+        else:
+            self._pending_index = None
+            self._pending_delta = 0
+            self._pending_lines = 0
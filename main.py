@@ -1,11 +1,31 @@
+import sys
 import tkinter as tk
-from tkinter import ttk, font, messagebox, scrolledtext
-import re
-from collections import defaultdict
+from functools import partial
+from tkinter import ttk, filedialog, font, messagebox, scrolledtext
+
+from cache import AnalysisCache
+from engine import AnalysisEngine
+from export import TOKEN_FILE_EXTENSION
+from highlight import SyntaxHighlighter
+from incremental import IncrementalLexer
+from metrics import RunMetrics
+from output_view import VirtualOutputView
+from tree_model import SyntaxTreeModel
+from tree_view import LazyTreeView
+from worker import AnalysisRunner
+
+# How often the GUI checks the worker for progress (about 60 fps)
+POLL_INTERVAL_MS = 16
 
 class LexicalAnalyzerApp:
     def __init__(self, root):
         self.root = root
+        self.lexer = IncrementalLexer()
+        self.engine = AnalysisEngine(cache=AnalysisCache(), lexer=self.lexer)
+        self._relex_pending = None
+        self.runner = AnalysisRunner()
+        self._running = None
+        self._poll_pending = None
         self.root.configure(bg='#f0f2f5')  # Light gray background
         self.root.title("C Code Analyzer")
         self.root.geometry("1200x800")  # Slightly larger window
@@ -67,6 +87,8 @@ class LexicalAnalyzerApp:
             **text_style
         )
         self.input_text.pack(fill=tk.BOTH, expand=True)
+        self.input_text.bind('<<Modified>>', self._on_input_modified)
+        self.highlighter = SyntaxHighlighter(self.input_text, self.lexer)
         
         # Right side - Output section
         right_frame = ttk.Frame(parallel_frame)
@@ -80,11 +102,17 @@ class LexicalAnalyzerApp:
         )
         output_label.pack(anchor=tk.W, pady=(0, 5))
         
-        self.output_text = scrolledtext.ScrolledText(
+        # Results can run to millions of lines, so only the visible part is rendered
+        self.output_view = VirtualOutputView(
             right_frame,
             **text_style
         )
-        self.output_text.pack(fill=tk.BOTH, expand=True)
+        self.output_view.pack(fill=tk.BOTH, expand=True)
+        
+        # Syntax trees are browsed node by node instead; packed in place of
+        # the output view while one is shown
+        self.tree_view = LazyTreeView(right_frame, font=text_font)
+        self._showing_tree = False
         
         # Buttons frame with styling
         button_frame = ttk.Frame(self.main_frame)
@@ -129,6 +157,38 @@ class LexicalAnalyzerApp:
             **button_style
         )
         self.grammar_button.pack(side=tk.LEFT, padx=5)
+        
+        self.export_button = ttk.Button(
+            button_frame,
+            text="Export...",
+            command=self.export_results,
+            **button_style
+        )
+        self.export_button.pack(side=tk.LEFT, padx=5)
+        
+        # Optional, slower instrumentation of the next runs
+        self.track_memory = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="Track memory",
+            variable=self.track_memory
+        ).pack(side=tk.LEFT, padx=(20, 5))
+        
+        self.profile_runs = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            button_frame,
+            text="Profile",
+            variable=self.profile_runs
+        ).pack(side=tk.LEFT, padx=5)
+        
+        # Status line for background analysis progress and run metrics
+        self.status_label = ttk.Label(
+            self.main_frame,
+            text="Ready",
+            font=label_font,
+            background='#f0f2f5'
+        )
+        self.status_label.pack(anchor=tk.W)
     
     def center_window(self):
         """Center the window on the screen"""
@@ -139,472 +199,131 @@ class LexicalAnalyzerApp:
         y = (self.root.winfo_screenheight() // 2) - (height // 2)
         self.root.geometry(f'+{x}+{y}')
     
+    def _on_input_modified(self, event=None):
+        """Schedule re-lexing of the edited lines once Tk is idle"""
+        if not self.input_text.edit_modified():
+            return
+        self.input_text.edit_modified(False)
+        # Results for the old text are stale now
+        if self._running is not None:
+            self.runner.cancel()
+            self._finish_run("Analysis cancelled: input changed")
+        # The lexer is behind the text until the re-lex has run
+        self.highlighter.cancel()
+        if self._relex_pending is None:
+            self._relex_pending = self.root.after_idle(self._relex_input)
+    
+    def _relex_input(self):
+        """Patch the persisted token list with the latest edits and re-highlight them"""
+        self._relex_pending = None
+        self.lexer.update(self.input_text.get("1.0", tk.END))
+        if self.lexer.last_dirty_lines is not None:
+            self.highlighter.invalidate(*self.lexer.last_dirty_lines)
+    
     def analyze_lexical(self):
         """Perform lexical analysis"""
-        input_text = self.input_text.get("1.0", tk.END).strip()
-        if not input_text:
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", "Please enter some C code.")
-            return
-        
-        # First check syntax
-        syntax_errors = self.validate_syntax(input_text)
-        if syntax_errors:
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", "Cannot perform lexical analysis due to syntax errors.\nPlease fix the syntax errors first.")
-            return
-        
-        try:
-            tokens = self.tokenize_c_code(input_text)
-            result = "=== Lexical Analysis ===\n"
-            result += "\n".join(f"{token_type}: {token_value}" for token_type, token_value in tokens)
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", result)
-        except Exception as e:
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", f"Error in lexical analysis: {str(e)}")
+        self._run_analysis(self.engine.lexical_report, "lexical", self.lexical_button)
     
     def analyze_syntax(self):
         """Perform syntax analysis"""
-        input_text = self.input_text.get("1.0", tk.END).strip()
-        if not input_text:
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", "Please enter some C code.")
-            return
-        
-        # Check syntax and get detailed errors
-        syntax_errors = self.validate_syntax(input_text)
-        if syntax_errors:
-            result = "=== Syntax Analysis ===\n\n"
-            result += "Syntax Errors Found:\n"
-            for error in syntax_errors:
-                result += f"\nLine {error['line']}: {error['message']}\n"
-                result += f"Code: {error['code']}\n"
-                result += f"      {' ' * error['position']}^\n"
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", result)
-            return
-        
-        try:
-            syntax_tree = self.build_c_syntax_tree(input_text)
-            result = "=== Syntax Analysis ===\n"
-            result += "No syntax errors found.\n\n"
-            result += "Syntax Tree:\n"
-            result += syntax_tree
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", result)
-        except Exception as e:
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", f"Error in syntax analysis: {str(e)}")
+        self._run_analysis(self.engine.syntax_report, "syntax", self.syntax_button)
     
     def analyze_grammar(self):
         """Perform grammar analysis"""
-        input_text = self.input_text.get("1.0", tk.END).strip()
+        self._run_analysis(self.engine.grammar_report, "grammar", self.grammar_button)
+    
+    def export_results(self):
+        """Write the input's tokens, diagnostics and grammar facts to a file"""
+        path = filedialog.asksaveasfilename(
+            parent=self.root,
+            title="Export Analysis",
+            defaultextension='.jsonl',
+            filetypes=[
+                ("JSON lines", '*.jsonl'),
+                ("Binary token file", f'*{TOKEN_FILE_EXTENSION}')
+            ]
+        )
+        if path:
+            self._run_analysis(partial(self.engine.export_report, path=path), "export", self.export_button)
+    
+    def _run_analysis(self, report, name, button):
+        """Start one engine report on the input in the background"""
+        input_text = self.input_text.get("1.0", tk.END).rstrip()
         if not input_text:
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", "Please enter some C code.")
-            return
-        
-        # First check syntax
-        syntax_errors = self.validate_syntax(input_text)
-        if syntax_errors:
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", "Cannot perform grammar analysis due to syntax errors.\nPlease fix the syntax errors first.")
+            self._show_output("Please enter some C code.")
             return
         
-        try:
-            grammar_rules = self.analyze_c_grammar(input_text)
-            result = "=== Grammar Analysis ===\n"
-            result += grammar_rules
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", result)
-        except Exception as e:
-            self.output_text.delete("1.0", tk.END)
-            self.output_text.insert("1.0", f"Error in grammar analysis: {str(e)}")
+        # A new request supersedes whatever is still running
+        if self._running is not None:
+            self._running[1].state(['!disabled'])
+        metrics = RunMetrics(
+            name,
+            track_memory=self.track_memory.get(),
+            profile=self.profile_runs.get()
+        )
+        self._running = (name, button, metrics)
+        button.state(['disabled'])
+        self.status_label.config(text=f"Running {name} analysis...")
+        self.runner.start(self._measure, report, input_text, metrics)
+        if self._poll_pending is None:
+            self._poll_pending = self.root.after(POLL_INTERVAL_MS, self._poll_runner)
     
-    def validate_syntax(self, code):
-        """Validate basic C syntax and return detailed errors"""
-        errors = []
-        lines = code.split('\n')
-        
-        # Check for main function
-        has_main = False
-        for i, line in enumerate(lines, 1):
-            if re.search(r'^\s*int\s+main\s*\([^)]*\)\s*\{?', line):
-                has_main = True
-                break
-        if not has_main:
-            errors.append({
-                'line': 1,
-                'position': 0,
-                'message': "Missing main function",
-                'code': "Program must contain a main function"
-            })
-        
-        # Track state
-        brace_stack = []
-        paren_stack = []
-        in_comment = False
-        in_string = False
-        string_char = None
-        in_preprocessor = False
-        in_switch_case = False
-        
-        for i, line in enumerate(lines, 1):
-            j = 0
-            while j < len(line):
-                char = line[j]
-                
-                # Handle preprocessor directives
-                if j == 0 and line.strip().startswith('#'):
-                    in_preprocessor = True
-                    break
-                
-                # Skip checking in preprocessor lines
-                if in_preprocessor:
-                    break
-                
-                # Handle comments
-                if not in_string:
-                    if char == '/' and j + 1 < len(line):
-                        if line[j + 1] == '/':
-                            break  # Skip rest of line for single-line comments
-                        elif line[j + 1] == '*':
-                            in_comment = True
-                            j += 1
-                    elif char == '*' and j + 1 < len(line) and line[j + 1] == '/':
-                        if not in_comment:
-                            errors.append({
-                                'line': i,
-                                'position': j,
-                                'message': "Unexpected comment end '*/'",
-                                'code': line
-                            })
-                        in_comment = False
-                        j += 1
-                
-                # Handle strings
-                if not in_comment:
-                    if char in ['"', "'"]:
-                        if not in_string:
-                            in_string = True
-                            string_char = char
-                        elif char == string_char and line[j-1] != '\\':  # Handle escaped quotes
-                            in_string = False
-                
-                # Only check braces and parentheses when not in comments or strings
-                if not in_comment and not in_string:
-                    if char == '{':
-                        brace_stack.append((i, j))
-                    elif char == '}':
-                        if not brace_stack:
-                            errors.append({
-                                'line': i,
-                                'position': j,
-                                'message': "Unexpected closing brace '}'",
-                                'code': line
-                            })
-                        else:
-                            brace_stack.pop()
-                    elif char == '(':
-                        paren_stack.append((i, j))
-                    elif char == ')':
-                        if not paren_stack:
-                            errors.append({
-                                'line': i,
-                                'position': j,
-                                'message': "Unexpected closing parenthesis ')'",
-                                'code': line
-                            })
-                        else:
-                            paren_stack.pop()
-                
-                j += 1
-            
-            # Reset preprocessor state for next line
-            in_preprocessor = False
-        
-        # Report unclosed braces and parentheses
-        for line, pos in brace_stack:
-            errors.append({
-                'line': line,
-                'position': pos,
-                'message': "Unclosed brace '{'",
-                'code': lines[line-1]
-            })
-        
-        for line, pos in paren_stack:
-            errors.append({
-                'line': line,
-                'position': pos,
-                'message': "Unclosed parenthesis '('",
-                'code': lines[line-1]
-            })
-        
-        # Check for unclosed comments
-        if in_comment:
-            errors.append({
-                'line': len(lines),
-                'position': len(lines[-1]),
-                'message': "Unclosed comment '/*'",
-                'code': lines[-1]
-            })
-        
-        # Check for unclosed strings
-        if in_string:
-            errors.append({
-                'line': len(lines),
-                'position': len(lines[-1]),
-                'message': f"Unclosed string (started with {string_char})",
-                'code': lines[-1]
-            })
-        
-        # Check for basic C syntax patterns
-        for i, line in enumerate(lines, 1):
-            line = line.strip()
-            
-            # Skip empty lines, comments, and preprocessor directives
-            if not line or line.startswith('//') or line.startswith('/*') or line.startswith('#'):
-                continue
-            
-            # Check for switch-case statements
-            if line.startswith('switch') or line.startswith('case') or line.startswith('default'):
-                in_switch_case = True
-                continue
-            
-            # Check for missing semicolons in statements
-            if line and not line.endswith(';') and not line.endswith('{') and not line.endswith('}'):
-                # Skip lines that are part of control structures or function declarations
-                if not any(keyword in line for keyword in ['if', 'for', 'while', 'do', 'switch']):
-                    # Skip function declarations and definitions
-                    if not re.match(r'^\s*\w+\s+\w+\s*\([^)]*\)\s*\{?$', line):
-                        # Check for statements that should end with semicolon
-                        if (line.startswith('printf') or 
-                            line.startswith('scanf') or 
-                            line.startswith('return') or 
-                            re.match(r'^\s*\w+\s*=', line) or 
-                            re.match(r'^\s*(int|char|float|double|void)\s+\w+', line)):
-                            errors.append({
-                                'line': i,
-                                'position': len(line),
-                                'message': "Missing semicolon ';'",
-                                'code': line
-                            })
-            
-            # Check for proper if/for/while syntax
-            for keyword in ['if', 'for', 'while']:
-                if keyword in line:
-                    # Check for balanced parentheses
-                    open_count = line.count('(')
-                    close_count = line.count(')')
-                    if open_count != close_count:
-                        errors.append({
-                            'line': i,
-                            'position': line.find(keyword) + len(keyword),
-                            'message': f"Unbalanced parentheses in {keyword} statement",
-                            'code': line
-                        })
-                    # Check for proper parentheses placement
-                    elif not re.match(rf'^\s*{keyword}\s*\([^)]*\)', line):
-                        # Skip if it's a printf or scanf statement
-                        if not (line.startswith('printf') or line.startswith('scanf')):
-                            errors.append({
-                                'line': i,
-                                'position': line.find(keyword) + len(keyword),
-                                'message': f"Invalid {keyword} statement syntax",
-                                'code': line
-                            })
-            
-            # Check for proper variable declarations
-            if re.match(r'^\s*(int|char|float|double|void)\s+\w+', line):
-                if '=' in line and ';' not in line and not line.endswith('{'):
-                    errors.append({
-                        'line': i,
-                        'position': len(line),
-                        'message': "Missing semicolon in variable declaration",
-                        'code': line
-                    })
-        
-        return errors
+    @staticmethod
+    def _measure(report, code, metrics, progress=None):
+        """Run report on the worker thread under metrics"""
+        with metrics:
+            return report(code, progress=progress, metrics=metrics)
     
-    def tokenize_c_code(self, code):
-        """Tokenize C code into meaningful components"""
-        tokens = []
-        lines = code.split('\n')
-        
-        # C keywords
-        c_keywords = {
-            'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do',
-            'double', 'else', 'enum', 'extern', 'float', 'for', 'goto', 'if',
-            'int', 'long', 'register', 'return', 'short', 'signed', 'sizeof', 'static',
-            'struct', 'switch', 'typedef', 'union', 'unsigned', 'void', 'volatile', 'while'
-        }
-        
-        # C operators
-        c_operators = {
-            '+', '-', '*', '/', '%', '++', '--', '=', '+=', '-=', '*=', '/=', '%=',
-            '==', '!=', '>', '<', '>=', '<=', '&&', '||', '!', '&', '|', '^', '~',
-            '<<', '>>', '->', '.', '?', ':', ';', ',', '(', ')', '[', ']', '{', '}'
-        }
-        
-        for line in lines:
-            # Skip empty lines
-            if not line.strip():
-                continue
-            
-            # Handle preprocessor directives
-            if line.strip().startswith('#'):
-                tokens.append(('PREPROCESSOR', line.strip()))
-                continue
-            
-            # Handle comments
-            if '//' in line:
-                comment_start = line.find('//')
-                code_part = line[:comment_start]
-                comment_part = line[comment_start:]
-                if code_part.strip():
-                    self._tokenize_line(code_part, tokens, c_keywords, c_operators)
-                tokens.append(('COMMENT', comment_part))
-                continue
-            
-            # Handle multi-line comments
-            if '/*' in line:
-                tokens.append(('COMMENT_START', '/*'))
-                continue
-            if '*/' in line:
-                tokens.append(('COMMENT_END', '*/'))
-                continue
-            
-            # Tokenize the line
-            self._tokenize_line(line, tokens, c_keywords, c_operators)
-        
-        return tokens
-    
-    def _tokenize_line(self, line, tokens, c_keywords, c_operators):
-        """Helper function to tokenize a single line of C code"""
-        # Split the line into words
-        words = re.findall(r'[a-zA-Z_][a-zA-Z0-9_]*|[0-9]+|"[^"]*"|\'[^\']*\'|[-+*/%=<>!&|^~?:;,.()\[\]{}]|->|\.', line)
-        
-        for word in words:
-            if word in c_keywords:
-                tokens.append(('KEYWORD', word))
-            elif word in c_operators:
-                tokens.append(('OPERATOR', word))
-            elif word.startswith('"') or word.startswith("'"):
-                tokens.append(('STRING', word))
-            elif word.isdigit():
-                tokens.append(('NUMBER', word))
-            elif re.match(r'^[a-zA-Z_][a-zA-Z0-9_]*$', word):
-                tokens.append(('IDENTIFIER', word))
+    def _poll_runner(self):
+        """Pick up progress and results posted by the worker thread"""
+        self._poll_pending = None
+        if self._running is None:
+            return
+        name, _, metrics = self._running
+        for kind, payload in self.runner.poll():
+            if kind == 'progress':
+                self.status_label.config(text=f"{name.capitalize()} analysis: {payload}...")
+            elif kind == 'done':
+                with metrics.phase('render'):
+                    if isinstance(payload, SyntaxTreeModel):
+                        self._show_tree(payload)
+                    else:
+                        self._show_lines(payload)
+                if metrics.profile_text:
+                    print(f"Profile of {name} analysis:\n{metrics.profile_text}", file=sys.stderr)
+                self._finish_run(metrics.summary())
             else:
-                tokens.append(('UNKNOWN', word))
+                self._show_output(f"Error in {name} analysis: {str(payload)}")
+                self._finish_run("Ready")
+        if self._running is not None:
+            self._poll_pending = self.root.after(POLL_INTERVAL_MS, self._poll_runner)
     
-    def build_c_syntax_tree(self, code):
-        """Build a syntax tree for C code"""
-        tree = []
-        current_level = 0
-        in_function = False
-        in_block = False
-        
-        for line in code.split('\n'):
-            if not line.strip():
-                continue
-            
-            # Skip comments
-            if line.strip().startswith('//') or '/*' in line or '*/' in line:
-                continue
-            
-            # Calculate indentation level
-            indent = len(line) - len(line.lstrip())
-            level = indent // 4  # Assuming 4 spaces per indentation level
-            
-            # Handle function definitions
-            if re.match(r'^\s*\w+\s+\w+\s*\([^)]*\)\s*\{?$', line):
-                in_function = True
-                tree.append('  ' * level + '└── Function: ' + line.strip())
-                continue
-            
-            # Handle control structures
-            if re.match(r'^\s*(if|for|while|do|switch)\s*\(', line):
-                tree.append('  ' * level + '└── Control: ' + line.strip())
-                in_block = True
-                continue
-            
-            # Handle blocks
-            if '{' in line:
-                tree.append('  ' * level + '└── Block Start')
-                in_block = True
-                continue
-            if '}' in line:
-                tree.append('  ' * level + '└── Block End')
-                in_block = False
-                continue
-            
-            # Handle statements
-            if ';' in line:
-                tree.append('  ' * level + '└── Statement: ' + line.strip())
-                continue
-            
-            # Handle other lines
-            tree.append('  ' * level + '└── ' + line.strip())
-        
-        return '\n'.join(tree)
+    def _finish_run(self, status):
+        """Re-enable the button of the finished run and update the status line"""
+        self._running[1].state(['!disabled'])
+        self._running = None
+        self.status_label.config(text=status)
     
-    def analyze_c_grammar(self, code):
-        """Analyze C code grammar and structure"""
-        rules = []
-        
-        # Check for main function
-        if re.search(r'int\s+main\s*\([^)]*\)', code):
-            rules.append("✓ Main function found")
-        else:
-            rules.append("✗ Main function not found")
-        
-        # Check for proper header inclusion
-        if re.search(r'#include\s+<[^>]+>', code):
-            rules.append("✓ Header files included")
-        
-        # Check for function definitions
-        functions = re.findall(r'\w+\s+\w+\s*\([^)]*\)', code)
-        if functions:
-            rules.append(f"✓ Found {len(functions)} function(s):")
-            for func in functions:
-                rules.append(f"  - {func}")
-        
-        # Check for control structures
-        if re.search(r'if\s*\([^)]*\)', code):
-            rules.append("✓ If statements present")
-        if re.search(r'for\s*\([^)]*\)', code):
-            rules.append("✓ For loops present")
-        if re.search(r'while\s*\([^)]*\)', code):
-            rules.append("✓ While loops present")
-        
-        # Check for proper block structure
-        open_braces = code.count('{')
-        close_braces = code.count('}')
-        if open_braces == close_braces:
-            rules.append("✓ Balanced braces")
-        else:
-            rules.append(f"✗ Unbalanced braces: {open_braces} opening, {close_braces} closing")
-        
-        # Check for variable declarations
-        if re.search(r'\w+\s+\w+\s*=', code):
-            rules.append("✓ Variable declarations found")
-        
-        # Check for proper semicolon usage
-        statements = code.count(';')
-        if statements > 0:
-            rules.append(f"✓ Found {statements} statements")
-        
-        # Check for proper indentation
-        lines = code.split('\n')
-        indent_levels = [len(line) - len(line.lstrip()) for line in lines if line.strip()]
-        if all(level % 4 == 0 for level in indent_levels):
-            rules.append("✓ Proper indentation (4 spaces)")
-        else:
-            rules.append("✗ Inconsistent indentation")
-        
-        return "\n".join(rules)
+    def _show_output(self, text):
+        """Replace the contents of the output pane with a message"""
+        self._show_lines(text.split("\n"))
+    
+    def _show_lines(self, lines):
+        """Show report lines in the output pane, swapping out a tree view"""
+        if self._showing_tree:
+            self.tree_view.pack_forget()
+            self.tree_view.clear()
+            self.output_view.pack(fill=tk.BOTH, expand=True)
+            self._showing_tree = False
+        self.output_view.set_lines(lines)
+    
+    def _show_tree(self, model):
+        """Show a syntax tree in the expandable tree view"""
+        if not self._showing_tree:
+            self.output_view.pack_forget()
+            self.tree_view.pack(fill=tk.BOTH, expand=True)
+            self._showing_tree = True
+        self.tree_view.set_model(model)
 
 
 # Run the application
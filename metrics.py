@@ -0,0 +1,107 @@
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Functions listed in a captured profile, by cumulative time
+PROFILE_LIMIT = 25
+
+
+class RunMetrics:
+    """Per-phase timings, counters and optional memory and profile data of one run"""
+
+    def __init__(self, name="", track_memory=False, profile=False):
+        self.name = name
+        self.track_memory = track_memory
+        self.profile = profile
+        # (phase name, wall seconds, CPU seconds) in the order phases ran
+        self.phases = []
+        # Counter name -> amount, e.g. tokens, lines, diagnostics
+        self.counters = {}
+        self.wall = None
+        self.cpu = None
+        # Peak traced allocation in bytes, if track_memory was set
+        self.peak_bytes = None
+        # pstats listing of the run, if profile was set
+        self.profile_text = None
+        self._started = None
+        self._tracing = False
+        self._profiler = None
+
+    def start(self):
+        """Start the run timers and the optional memory and profile capture"""
+        if self.track_memory and not tracemalloc.is_tracing():
+            # Another run may already be tracing; only the owner stops it
+            tracemalloc.start()
+            self._tracing = True
+        if self.profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._started = (time.perf_counter(), time.thread_time())
+
+    def stop(self):
+        """Stop the run and collect its totals"""
+        if self._started is None:
+            return
+        wall, cpu = self._started
+        self._started = None
+        self.wall = time.perf_counter() - wall
+        self.cpu = time.thread_time() - cpu
+        if self._profiler is not None:
+            self._profiler.disable()
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LIMIT)
+            self.profile_text = stream.getvalue()
+            self._profiler = None
+        if self._tracing:
+            self.peak_bytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self._tracing = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block as one phase of the run"""
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - wall, time.thread_time() - cpu))
+
+    def count(self, name, amount=1):
+        """Add amount to a counter"""
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def as_dict(self):
+        """Return the metrics as a JSON-serializable dict"""
+        return {
+            'name': self.name,
+            'wall_seconds': self.wall,
+            'cpu_seconds': self.cpu,
+            'phases': [
+                {'name': name, 'wall_seconds': wall, 'cpu_seconds': cpu}
+                for name, wall, cpu in self.phases
+            ],
+            'counters': dict(self.counters),
+            'peak_bytes': self.peak_bytes,
+            'profile': self.profile_text,
+        }
+
+    def summary(self):
+        """One-line summary for a status bar or log"""
+        parts = [", ".join(f"{name} {wall * 1000:.0f} ms" for name, wall, _ in self.phases)]
+        if self.wall is not None:
+            parts.append(f"total {self.wall * 1000:.0f} ms wall / {self.cpu * 1000:.0f} ms CPU")
+        if self.counters:
+            parts.append(", ".join(f"{amount} {name}" for name, amount in self.counters.items()))
+        if self.peak_bytes is not None:
+            parts.append(f"peak {self.peak_bytes / (1024 * 1024):.1f} MB")
+        return " | ".join(part for part in parts if part)
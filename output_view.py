@@ -0,0 +1,91 @@
+import tkinter as tk
+from tkinter import font, ttk
+
+# Extra lines rendered beyond the visible rows so small scrolls stay smooth
+RENDER_MARGIN = 20
+
+
+class VirtualOutputView:
+    """Read-only result pane that renders only the visible window of its lines"""
+
+    def __init__(self, parent, **text_options):
+        self.frame = ttk.Frame(parent)
+        # Each result line must be exactly one text row for the paging maths
+        text_options['wrap'] = tk.NONE
+        self.text = tk.Text(self.frame, **text_options)
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.text.config(state=tk.DISABLED)
+
+        # Any sequence of strings: a list or a lazily formatted ReportLines
+        self.lines = []
+        self.top = 0
+        self._line_height = font.Font(font=self.text.cget('font')).metrics('linespace')
+
+        self.text.bind('<Configure>', lambda event: self._render())
+        self.text.bind('<MouseWheel>', self._on_mousewheel)
+        self.text.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.text.bind('<Button-5>', lambda event: self.scroll(3))
+        self.text.bind('<Prior>', lambda event: self.scroll(-self.visible_rows()))
+        self.text.bind('<Next>', lambda event: self.scroll(self.visible_rows()))
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    def pack_forget(self):
+        self.frame.pack_forget()
+
+    def set_lines(self, lines):
+        """Show a new result, keeping it as structured lines"""
+        self.lines = lines
+        self.top = 0
+        self._render()
+
+    def set_text(self, text):
+        """Show a short plain-text message"""
+        self.set_lines(text.split("\n"))
+
+    def visible_rows(self):
+        """Number of result lines that fit in the pane"""
+        return max(1, self.text.winfo_height() // self._line_height)
+
+    def scroll(self, rows):
+        """Move the window by rows lines, clamped to the result"""
+        self.scroll_to(self.top + rows)
+        return 'break'
+
+    def scroll_to(self, line):
+        """Make line the first visible result line"""
+        last_top = max(0, len(self.lines) - self.visible_rows())
+        top = min(max(0, line), last_top)
+        if top != self.top:
+            self.top = top
+            self._render()
+
+    def _render(self):
+        """Replace the text contents with the lines around the current window"""
+        rows = self.visible_rows()
+        window = self.lines[self.top:self.top + rows + RENDER_MARGIN]
+        self.text.config(state=tk.NORMAL)
+        self.text.delete("1.0", tk.END)
+        self.text.insert("1.0", "\n".join(window))
+        self.text.config(state=tk.DISABLED)
+
+        total = len(self.lines)
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _on_scrollbar(self, action, *args):
+        if action == tk.MOVETO:
+            self.scroll_to(int(float(args[0]) * len(self.lines)))
+        elif action == tk.SCROLL:
+            amount, unit = int(args[0]), args[1]
+            if unit == tk.PAGES:
+                amount *= self.visible_rows()
+            self.scroll(amount)
+
+    def _on_mousewheel(self, event):
+        return self.scroll(-3 if event.delta > 0 else 3)
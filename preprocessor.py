@@ -0,0 +1,850 @@
+import os
+import re
+import threading
+from collections import deque
+
+import scanner
+import token_buffer
+from scanner import COMMENT_GROUP, PREPROCESSOR_GROUP
+from token_buffer import KIND_NAMES
+
+# Nested #includes followed before a chain is reported as runaway recursion
+MAX_INCLUDE_DEPTH = 200
+
+# Memoized expansions kept per header, one per distinct macro context
+MAX_VARIANTS = 8
+
+# Token kinds that can name a macro
+_NAME_KINDS = frozenset({'IDENTIFIER', 'KEYWORD'})
+
+_CONDITIONALS = frozenset({'if', 'ifdef', 'ifndef', 'elif', 'else', 'endif'})
+
+# Directives accepted and ignored
+_IGNORED = frozenset({'line', 'ident', 'sccs', 'warning'})
+
+_NO_HIDE = frozenset()
+
+_DIRECTIVE_PATTERN = re.compile(r'#\s*([A-Za-z_]\w*)?')
+_CONTINUATION_PATTERN = re.compile(r'\\\r?\n')
+_DEFINE_PATTERN = re.compile(r'\s*([A-Za-z_]\w*)(\()?')
+_INTEGER_SUFFIX = re.compile(r'[uUlL]+$')
+
+# #if operators by binding strength; ?: binds loosest and is parsed apart
+_BINARY_PRECEDENCE = {
+    '||': 1, '&&': 2, '|': 3, '^': 4, '&': 5, '==': 6, '!=': 6,
+    '<': 7, '>': 7, '<=': 7, '>=': 7, '<<': 8, '>>': 8,
+    '+': 9, '-': 9, '*': 10, '/': 10, '%': 10,
+}
+
+
+class Macro:
+    """One #define: params is None for object-like macros"""
+    __slots__ = ('name', 'params', 'variadic', 'body')
+
+    def __init__(self, name, params, variadic, body):
+        self.name = name
+        # Parameter names; a variadic macro's last one collects the extra arguments
+        self.params = params
+        self.variadic = variadic
+        # Replacement list as (kind, value) tokens
+        self.body = body
+
+    def __eq__(self, other):
+        if not isinstance(other, Macro):
+            return NotImplemented
+        return (self.name == other.name and self.params == other.params
+                and self.variadic == other.variadic and self.body == other.body)
+
+    def __repr__(self):
+        return f"Macro({self.name!r})"
+
+
+class SourceFile:
+    """A lexed source split into directives and runs of text tokens
+
+    Items are (name, argument tokens, raw argument text, line) for
+    directives and (None, tokens, None, line) for text; comments are dropped.
+    """
+    __slots__ = ('path', 'mtime', 'size', 'items', 'guard')
+
+    def __init__(self, tokens, path=None, mtime=None, size=None):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.items = _split_items(tokens)
+        # Macro of an include guard wrapping the whole file, if any
+        self.guard = _find_guard(self.items)
+
+
+class Preprocessed:
+    """The token stream of one translation unit after preprocessing"""
+    __slots__ = ('tokens', 'macros', 'includes', 'missing', 'errors')
+
+    def __init__(self, tokens, macros, includes, missing, errors):
+        # (kind, value) tokens with directives removed and macros expanded
+        self.tokens = tokens
+        # Name -> Macro defined at the end of the unit
+        self.macros = macros
+        # Paths of the headers read, in include order
+        self.includes = includes
+        # (header as written, including path, line) of unresolved #includes
+        self.missing = missing
+        # "path:line: message" strings
+        self.errors = errors
+
+    def as_dict(self):
+        """Return a JSON-serializable summary"""
+        return {
+            'tokens': len(self.tokens),
+            'macros': len(self.macros),
+            'includes': list(self.includes),
+            'missing': [f"{header} ({path}:{line})" for header, path, line in self.missing],
+            'errors': list(self.errors),
+        }
+
+
+class _Recording:
+    """What one header's expansion read and did, collected while it runs"""
+    __slots__ = ('deps', 'effects', 'files', 'output_start', 'errors_start',
+                 'includes_start', 'missing_start')
+
+    def __init__(self, expansion):
+        # Macro name -> its definition (or None) when the header first read it
+        self.deps = {}
+        # Macro name -> definition (or None if undefined) the header left behind
+        self.effects = {}
+        # Path -> mtime of every header included from this one
+        self.files = {}
+        self.output_start = len(expansion.output)
+        self.errors_start = len(expansion.errors)
+        self.includes_start = len(expansion.includes)
+        self.missing_start = len(expansion.missing)
+
+
+class _Variant:
+    """A memoized expansion of a header, valid while its deps are unchanged"""
+    __slots__ = ('deps', 'effects', 'files', 'tokens', 'errors', 'includes', 'missing')
+
+    def __init__(self, recording, expansion):
+        self.deps = recording.deps
+        self.effects = tuple(recording.effects.items())
+        self.files = recording.files
+        self.tokens = expansion.output[recording.output_start:]
+        self.errors = expansion.errors[recording.errors_start:]
+        self.includes = expansion.includes[recording.includes_start:]
+        self.missing = expansion.missing[recording.missing_start:]
+
+    def matches(self, macros):
+        for name, macro in self.deps.items():
+            if macros.get(name) != macro:
+                return False
+        for path, mtime in self.files.items():
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+
+class Preprocessor:
+    """Expands #include, #define and conditionals with caches shared across units
+
+    Headers are read from disk once and lexed once per path and mtime.
+    Each header's expansion is memoized together with the macros it read;
+    a later #include in the same context replays the memoized tokens and
+    macro effects instead of expanding the header again. Include guards
+    and #pragma once skip a header that was already included.
+    """
+
+    def __init__(self, include_dirs=(), defines=None):
+        self.include_dirs = [os.path.abspath(directory) for directory in include_dirs]
+        # Macros every unit starts with, from NAME or NAME=VALUE definitions
+        self.predefined = {}
+        for definition in defines or ():
+            name, equals, value = definition.partition('=')
+            macro = _parse_define(f"{name} {value if equals else '1'}")
+            if macro is not None:
+                self.predefined[macro.name] = macro
+        # Path -> SourceFile of every header read
+        self._files = {}
+        # Path -> [_Variant], most recent last
+        self._variants = {}
+        self.stats = {'units': 0, 'lexed': 0, 'file_hits': 0, 'replayed': 0, 'skipped': 0}
+        self._lock = threading.Lock()
+
+    def run(self, code, path=None, tokens=None):
+        """Preprocess one translation unit and return a Preprocessed"""
+        if tokens is None:
+            tokens = token_buffer.lex(code)
+        source = SourceFile(tokens, path)
+        with self._lock:
+            self.stats['units'] += 1
+            expansion = _Expansion(self, path)
+            expansion.run_file(source, path or '<input>')
+            return Preprocessed(expansion.output, expansion.defined(), expansion.includes,
+                                expansion.missing, expansion.errors)
+
+    def source_file(self, path, stat):
+        """Return the SourceFile of a header, lexing it only if it changed"""
+        source = self._files.get(path)
+        if source is not None and source.mtime == stat.st_mtime_ns and source.size == stat.st_size:
+            self.stats['file_hits'] += 1
+            return source
+        with open(path, encoding='utf-8', errors='replace') as f:
+            code = f.read()
+        self.stats['lexed'] += 1
+        source = SourceFile(token_buffer.lex(code), path, stat.st_mtime_ns, stat.st_size)
+        self._files[path] = source
+        # Expansions of the previous contents are stale
+        self._variants.pop(path, None)
+        return source
+
+    def remember(self, path, variant):
+        variants = self._variants.setdefault(path, [])
+        variants.append(variant)
+        if len(variants) > MAX_VARIANTS:
+            del variants[0]
+
+    def variants(self, path):
+        return self._variants.get(path, ())
+
+
+class _Expansion:
+    """State of preprocessing one translation unit"""
+
+    def __init__(self, preprocessor, path):
+        self.preprocessor = preprocessor
+        self.macros = dict(preprocessor.predefined)
+        self.output = []
+        self.includes = []
+        self.missing = []
+        self.errors = []
+        # _Recording of every header being expanded, outermost first
+        self.recordings = []
+        self.depth = 0
+        # Location reported with errors
+        self.path = path or '<input>'
+        self.line = 0
+
+    def defined(self):
+        """Return the macros in effect, without #pragma once markers"""
+        return {name: macro for name, macro in self.macros.items() if not name.startswith('#')}
+
+    def error(self, message):
+        self.errors.append(f"{self.path}:{self.line}: {message}")
+
+    def lookup(self, name):
+        """Return the macro called name, noting the read for enclosing headers"""
+        macro = self.macros.get(name)
+        for recording in reversed(self.recordings):
+            if name in recording.effects:
+                # Set by this header (and so by every enclosing one)
+                break
+            recording.deps.setdefault(name, macro)
+        return macro
+
+    def assign(self, name, macro):
+        """Define name as macro, or undefine it when macro is None"""
+        if macro is None:
+            self.macros.pop(name, None)
+        else:
+            self.macros[name] = macro
+        for recording in self.recordings:
+            recording.effects[name] = macro
+
+    # Files and directives
+
+    def run_file(self, source, path):
+        """Expand the items of one file into the output"""
+        outer_path, outer_line = self.path, self.line
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path)) if source.path else os.getcwd()
+        # [active, some branch taken, #else seen] per open conditional
+        conditionals = []
+        for name, tokens, text, line in source.items:
+            self.line = line
+            active = not conditionals or conditionals[-1][0]
+            if name is None:
+                if active:
+                    self.expand_text(tokens)
+            elif name in _CONDITIONALS:
+                self.conditional(name, tokens, active, conditionals)
+            elif not active:
+                continue
+            elif name == 'define':
+                macro = _parse_define(text, tokens)
+                if macro is None:
+                    self.error("invalid #define")
+                else:
+                    self.assign(macro.name, macro)
+            elif name == 'undef':
+                if tokens and tokens[0][0] in _NAME_KINDS:
+                    self.assign(tokens[0][1], None)
+                else:
+                    self.error("invalid #undef")
+            elif name == 'include':
+                self.include(tokens, text, directory)
+            elif name == 'pragma':
+                if tokens and tokens[0][1] == 'once':
+                    self.assign(_once_key(path), Macro(_once_key(path), None, False, ()))
+            elif name == 'error':
+                self.error(f"#error {text.strip()}")
+            elif name not in _IGNORED:
+                self.error(f"unknown directive #{name}")
+        if conditionals:
+            self.error("unterminated conditional directive")
+        self.path, self.line = outer_path, outer_line
+
+    def conditional(self, name, tokens, active, conditionals):
+        if name in ('if', 'ifdef', 'ifndef'):
+            if not active:
+                # Counted as taken, so no branch of it ever becomes active
+                conditionals.append([False, True, False])
+                return
+            if name == 'if':
+                value = self.evaluate(tokens)
+            elif tokens and tokens[0][0] in _NAME_KINDS:
+                value = (self.lookup(tokens[0][1]) is not None) == (name == 'ifdef')
+            else:
+                self.error(f"#{name} without a macro name")
+                value = False
+            conditionals.append([value, value, False])
+            return
+        if not conditionals:
+            self.error(f"#{name} without #if")
+            return
+        branch = conditionals[-1]
+        if name == 'endif':
+            conditionals.pop()
+        elif branch[2]:
+            self.error(f"#{name} after #else")
+        elif name == 'else':
+            branch[0] = not branch[1]
+            branch[1] = branch[2] = True
+        elif branch[1]:
+            branch[0] = False
+        else:
+            branch[0] = branch[1] = self.evaluate(tokens)
+
+    def include(self, tokens, text, directory):
+        """Resolve an #include and expand the header it names"""
+        text = text.strip()
+        if not text.startswith(('"', '<')):
+            # #include MACRO: the expansion must spell "header" or <header>
+            text = ''.join(value for _, value, _ in self.expand(_hidden(tokens)))
+        if text.startswith('"') and '"' in text[1:]:
+            header = text[1:text.index('"', 1)]
+            directories = [directory] + self.preprocessor.include_dirs
+        elif text.startswith('<') and '>' in text:
+            header = text[1:text.index('>')]
+            directories = self.preprocessor.include_dirs
+        else:
+            self.error("#include expects \"FILE\" or <FILE>")
+            return
+        for base in directories:
+            path = os.path.normpath(os.path.join(base, header))
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self.include_file(path, stat)
+            return
+        self.missing.append((text[:len(header) + 2], self.path, self.line))
+
+    def include_file(self, path, stat):
+        preprocessor = self.preprocessor
+        for recording in self.recordings:
+            recording.files[path] = stat.st_mtime_ns
+        source = preprocessor.source_file(path, stat)
+        if (source.guard is not None and self.lookup(source.guard) is not None
+                or self.lookup(_once_key(path)) is not None):
+            preprocessor.stats['skipped'] += 1
+            return
+        if self.depth >= MAX_INCLUDE_DEPTH:
+            self.error(f"#include nested more than {MAX_INCLUDE_DEPTH} levels")
+            return
+        self.includes.append(path)
+
+        for variant in reversed(preprocessor.variants(path)):
+            if variant.matches(self.macros):
+                preprocessor.stats['replayed'] += 1
+                # Reads come first: they saw the macros before the header ran
+                for name in variant.deps:
+                    self.lookup(name)
+                for name, macro in variant.effects:
+                    self.assign(name, macro)
+                for recording in self.recordings:
+                    recording.files.update(variant.files)
+                self.output.extend(variant.tokens)
+                self.errors.extend(variant.errors)
+                self.includes.extend(variant.includes)
+                self.missing.extend(variant.missing)
+                return
+
+        recording = _Recording(self)
+        self.recordings.append(recording)
+        self.depth += 1
+        try:
+            self.run_file(source, path)
+        finally:
+            self.depth -= 1
+            self.recordings.pop()
+        preprocessor.remember(path, _Variant(recording, self))
+
+    # Macro expansion
+
+    def expand_text(self, tokens):
+        """Append a run of (kind, value) text tokens to the output, macros expanded"""
+        lookup = self.lookup
+        for index, (kind, value) in enumerate(tokens):
+            if kind in _NAME_KINDS and lookup(value) is not None:
+                break
+        else:
+            self.output.extend(tokens)
+            return
+        self.output.extend(tokens[:index])
+        self.output.extend((kind, value) for kind, value, _ in self.expand(_hidden(tokens[index:])))
+
+    def expand(self, pending):
+        """Fully expand a deque of (kind, value, hide set) tokens
+
+        A token's hide set names the macros it came out of, which may not
+        expand it again; this stops recursion the way C requires.
+        """
+        out = []
+        while pending:
+            token = pending.popleft()
+            kind, value, hide = token
+            if kind not in _NAME_KINDS or value in hide:
+                out.append(token)
+                continue
+            macro = self.lookup(value)
+            if macro is None:
+                out.append(token)
+                continue
+            if macro.params is None:
+                pending.extendleft(reversed(self.substitute(macro, (), hide | {value})))
+                continue
+            if not pending or pending[0][1] != '(':
+                # A function-like macro name without arguments is left alone
+                out.append(token)
+                continue
+            collected = _collect_arguments(pending)
+            if collected is None:
+                self.error(f"unterminated call of macro {value}")
+                out.append(token)
+                continue
+            args, closing_hide, used = collected
+            args = self.match_arguments(macro, args)
+            if args is None:
+                out.append(token)
+                continue
+            for _ in range(used):
+                pending.popleft()
+            pending.extendleft(reversed(self.substitute(macro, args, (hide & closing_hide) | {value})))
+        return out
+
+    def match_arguments(self, macro, args):
+        """Fit collected arguments to macro's parameters, or report a mismatch"""
+        count = len(macro.params)
+        if count == 0 and args == [[]]:
+            return []
+        if macro.variadic:
+            if len(args) == count - 1:
+                args.append([])
+            elif len(args) > count:
+                rest = args[count - 1]
+                for arg in args[count:]:
+                    rest.append(('OPERATOR', ',', _NO_HIDE))
+                    rest.extend(arg)
+                del args[count:]
+        if len(args) != count:
+            self.error(f"macro {macro.name} expects {count} argument(s), got {len(args)}")
+            return None
+        return args
+
+    def substitute(self, macro, args, hide):
+        """Return macro's replacement list with arguments, # and ## applied"""
+        body = macro.body
+        params = {name: index for index, name in enumerate(macro.params or ())}
+        expanded = {}
+        result = []
+        i = 0
+        while i < len(body):
+            kind, value = body[i]
+            pasted_next = i + 1 < len(body) and body[i + 1][1] == '##'
+            if value == '#' and params and i + 1 < len(body) and body[i + 1][1] in params:
+                result.append(('STRING', _stringify(args[params[body[i + 1][1]]]), _NO_HIDE))
+                i += 2
+                continue
+            if value == '##' and result and i + 1 < len(body):
+                kind, value = body[i + 1]
+                if value in params:
+                    right = args[params[value]] or [_PLACEMARKER]
+                else:
+                    right = [(kind, value, _NO_HIDE)]
+                result.extend(self.paste(result.pop(), right[0]))
+                result.extend(right[1:])
+                i += 2
+                continue
+            if value in params and kind in _NAME_KINDS:
+                index = params[value]
+                if pasted_next:
+                    # Operands of ## are not expanded first
+                    result.extend(args[index] or [_PLACEMARKER])
+                else:
+                    if index not in expanded:
+                        expanded[index] = self.expand(deque(args[index]))
+                    result.extend(expanded[index])
+            else:
+                result.append((kind, value, _NO_HIDE))
+            i += 1
+        return [(kind, value, hide | token_hide if token_hide else hide)
+                for kind, value, token_hide in result if kind is not None]
+
+    def paste(self, left, right):
+        """Join two tokens with ##, returning the resulting token(s)"""
+        if left[0] is None:
+            return [right]
+        if right[0] is None:
+            return [left]
+        text = left[1] + right[1]
+        scanned = list(scanner.scan(text))
+        if len(scanned) == 1 and scanned[0][1:] == (0, len(text)):
+            return [(scanned[0][0], text, left[2] & right[2])]
+        self.error(f"pasting {left[1]} and {right[1]} does not give a valid token")
+        return [left, right]
+
+    # #if expressions
+
+    def evaluate(self, tokens):
+        """Evaluate the tokens of an #if or #elif as true or false"""
+        items = []
+        i = 0
+        while i < len(tokens):
+            kind, value = tokens[i]
+            if value == 'defined':
+                name = None
+                if i + 1 < len(tokens) and tokens[i + 1][1] == '(':
+                    if i + 3 < len(tokens) and tokens[i + 3][1] == ')':
+                        name = tokens[i + 2]
+                    i += 4
+                elif i + 1 < len(tokens):
+                    name = tokens[i + 1]
+                    i += 2
+                else:
+                    i += 1
+                if name is None or name[0] not in _NAME_KINDS:
+                    self.error("'defined' expects a macro name")
+                    return False
+                items.append(('NUMBER', '1' if self.lookup(name[1]) is not None else '0', _NO_HIDE))
+                continue
+            items.append((kind, value, _NO_HIDE))
+            i += 1
+        try:
+            return _ConditionParser(self.expand(deque(items))).parse() != 0
+        except ValueError as e:
+            self.error(f"invalid #if expression: {e}")
+            return False
+
+
+class _ConditionParser:
+    """Precedence-climbing evaluator of expanded #if tokens"""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def parse(self):
+        if not self.tokens:
+            raise ValueError("empty expression")
+        value = self.conditional(True)
+        if self.pos != len(self.tokens):
+            raise ValueError(f"unexpected '{self.tokens[self.pos][1]}'")
+        return value
+
+    def peek(self):
+        return self.tokens[self.pos][1] if self.pos < len(self.tokens) else None
+
+    def expect(self, value):
+        if self.peek() != value:
+            raise ValueError(f"expected '{value}'")
+        self.pos += 1
+
+    def conditional(self, live):
+        condition = self.binary(1, live)
+        if self.peek() != '?':
+            return condition
+        self.pos += 1
+        # Only the chosen branch may fail on division by zero
+        if_true = self.conditional(live and condition != 0)
+        self.expect(':')
+        if_false = self.conditional(live and condition == 0)
+        return if_true if condition else if_false
+
+    def binary(self, min_precedence, live):
+        left = self.unary(live)
+        while True:
+            operator = self.peek()
+            precedence = _BINARY_PRECEDENCE.get(operator)
+            if precedence is None or precedence < min_precedence:
+                return left
+            self.pos += 1
+            if operator == '&&':
+                right = self.binary(precedence + 1, live and left != 0)
+                left = int(left != 0 and right != 0)
+            elif operator == '||':
+                right = self.binary(precedence + 1, live and left == 0)
+                left = int(left != 0 or right != 0)
+            else:
+                right = self.binary(precedence + 1, live)
+                left = _apply(operator, left, right, live)
+
+    def unary(self, live):
+        if self.pos >= len(self.tokens):
+            raise ValueError("unexpected end of expression")
+        kind, value, _ = self.tokens[self.pos]
+        self.pos += 1
+        if value == '(':
+            result = self.conditional(live)
+            self.expect(')')
+            return result
+        if value in ('+', '-', '!', '~'):
+            operand = self.unary(live)
+            if value == '-':
+                return -operand
+            if value == '!':
+                return int(operand == 0)
+            if value == '~':
+                return ~operand
+            return operand
+        if kind == 'NUMBER':
+            return _parse_integer(value)
+        if kind == 'STRING' and value.endswith("'"):
+            return _parse_character(value)
+        if kind in _NAME_KINDS:
+            # Identifiers left after expansion count as 0
+            return 0
+        raise ValueError(f"unexpected '{value}'")
+
+
+def _apply(operator, left, right, live):
+    if operator in ('/', '%'):
+        if right == 0:
+            if live:
+                raise ValueError("division by zero")
+            return 0
+        # C division truncates toward zero
+        quotient = abs(left) // abs(right) * (1 if (left < 0) == (right < 0) else -1)
+        return quotient if operator == '/' else left - quotient * right
+    if operator == '*':
+        return left * right
+    if operator == '+':
+        return left + right
+    if operator == '-':
+        return left - right
+    if operator == '<<':
+        return left << right if right >= 0 else left >> -right
+    if operator == '>>':
+        return left >> right if right >= 0 else left << -right
+    if operator == '<':
+        return int(left < right)
+    if operator == '>':
+        return int(left > right)
+    if operator == '<=':
+        return int(left <= right)
+    if operator == '>=':
+        return int(left >= right)
+    if operator == '==':
+        return int(left == right)
+    if operator == '!=':
+        return int(left != right)
+    if operator == '&':
+        return left & right
+    if operator == '^':
+        return left ^ right
+    return left | right
+
+
+def _parse_integer(text):
+    digits = _INTEGER_SUFFIX.sub('', text)
+    try:
+        if digits[:2] in ('0x', '0X'):
+            return int(digits[2:], 16)
+        if digits[:2] in ('0b', '0B'):
+            return int(digits[2:], 2)
+        if len(digits) > 1 and digits[0] == '0':
+            return int(digits[1:], 8)
+        return int(digits)
+    except ValueError:
+        raise ValueError(f"'{text}' is not an integer") from None
+
+
+def _parse_character(text):
+    body = text[text.index("'") + 1:-1]
+    try:
+        decoded = body.encode('latin-1', 'backslashreplace').decode('unicode_escape')
+    except UnicodeDecodeError:
+        decoded = body
+    if not decoded:
+        raise ValueError("empty character constant")
+    return ord(decoded[0])
+
+
+# Stands in for an empty argument next to ##; dropped after substitution
+_PLACEMARKER = (None, '', _NO_HIDE)
+
+
+def _hidden(tokens):
+    """Return a deque of (kind, value) tokens with empty hide sets"""
+    return deque((kind, value, _NO_HIDE) for kind, value in tokens)
+
+
+def _once_key(path):
+    """Macro table key marking a #pragma once header as included"""
+    # Not an identifier, so no source can define, test or expand it
+    return f"#once {path}"
+
+
+def _collect_arguments(pending):
+    """Read a call's arguments from pending, which starts at its '('
+
+    Returns (arguments, hide set of the closing ')', tokens used) without
+    consuming anything, or None when the call is never closed.
+    """
+    args = [[]]
+    depth = 0
+    for used, token in enumerate(pending, 1):
+        value = token[1]
+        if value == '(':
+            depth += 1
+            if depth == 1:
+                continue
+        elif value == ')':
+            depth -= 1
+            if depth == 0:
+                return args, token[2], used
+        elif value == ',' and depth == 1:
+            args.append([])
+            continue
+        args[-1].append(token)
+    return None
+
+
+def _stringify(tokens):
+    """Spell an argument as a string literal for the # operator"""
+    # Token spacing is not kept, so tokens are joined by single spaces
+    parts = []
+    for kind, value, _ in tokens:
+        if kind == 'STRING':
+            value = value.replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(value)
+    return '"' + ' '.join(parts) + '"'
+
+
+def _directive_tokens(text):
+    """Lex the text after a directive name into (kind, value) tokens"""
+    tokens = []
+    last_end = None
+    for kind, start, end in scanner.scan(text):
+        if kind == 'COMMENT':
+            continue
+        value = text[start:end]
+        # '#' is not a C operator, so ## arrives as two adjacent '#'s
+        if value == '#' and tokens and tokens[-1][1] == '#' and last_end == start:
+            tokens[-1] = ('OPERATOR', '##')
+        elif value == '#':
+            tokens.append(('OPERATOR', '#'))
+        else:
+            tokens.append((kind, value))
+        last_end = end
+    return tokens
+
+
+def _parse_define(text, tokens=None):
+    """Build a Macro from the text after #define, or None if it is malformed"""
+    match = _DEFINE_PATTERN.match(text)
+    if match is None:
+        return None
+    if tokens is None:
+        tokens = _directive_tokens(text)
+    name = match.group(1)
+    if match.group(2) is None:
+        # Object-like: everything after the name is the body
+        return Macro(name, None, False, tuple(tokens[1:]))
+
+    params = []
+    variadic = False
+    i = 2
+    while i < len(tokens) and tokens[i][1] != ')':
+        kind, value = tokens[i]
+        if value == '...':
+            params.append('__VA_ARGS__')
+            variadic = True
+        elif kind in _NAME_KINDS and not variadic:
+            if i + 1 < len(tokens) and tokens[i + 1][1] == '...':
+                # GNU named variadic parameter: args...
+                variadic = True
+                i += 1
+            params.append(value)
+        elif value != ',' or not params:
+            return None
+        i += 1
+    if i >= len(tokens):
+        return None
+    return Macro(name, tuple(params), variadic, tuple(tokens[i + 1:]))
+
+
+def _split_items(tokens):
+    """Split a TokenBuffer into SourceFile items"""
+    items = []
+    text = []
+    text_line = 0
+    kinds = tokens.kinds
+    lines = tokens.lines
+    for index in range(len(kinds)):
+        kind = kinds[index]
+        if kind == COMMENT_GROUP:
+            continue
+        if kind == PREPROCESSOR_GROUP:
+            if text:
+                items.append((None, text, None, text_line))
+                text = []
+            directive = _CONTINUATION_PATTERN.sub('', tokens.value(index))
+            match = _DIRECTIVE_PATTERN.match(directive)
+            if match.group(1):
+                rest = directive[match.end():]
+                items.append((match.group(1), _directive_tokens(rest), rest, lines[index]))
+            continue
+        if not text:
+            text_line = lines[index]
+        text.append((KIND_NAMES[kind], tokens.value(index)))
+    if text:
+        items.append((None, text, None, text_line))
+    return items
+
+
+def _find_guard(items):
+    """Return the macro of an #ifndef ... #endif wrapping all items, if any"""
+    if len(items) < 2:
+        return None
+    name, tokens, _, _ = items[0]
+    if name == 'ifndef' and len(tokens) == 1:
+        guard = tokens[0][1]
+    elif (name == 'if' and tokens[:2] == [('OPERATOR', '!'), ('IDENTIFIER', 'defined')]
+          and len(tokens) in (3, 5)):
+        guard = tokens[2][1] if len(tokens) == 3 else tokens[3][1]
+    else:
+        return None
+    depth = 0
+    for index, item in enumerate(items):
+        if item[0] in ('if', 'ifdef', 'ifndef'):
+            depth += 1
+        elif item[0] == 'endif':
+            depth -= 1
+            if depth == 0:
+                return guard if index == len(items) - 1 else None
+        elif depth == 1 and item[0] in ('elif', 'else'):
+            return None
+    return None
@@ -0,0 +1,451 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import C_EXTENSIONS, collect_files, make_engine, read_source
+from disk_cache import default_cache_dir
+from watch import DEFAULT_DEBOUNCE, DEFAULT_INTERVAL, make_watcher
+
+# Fewer changed files than this are summarized in-process; starting a
+# pool costs more than it saves
+PARALLEL_THRESHOLD = 64
+
+# Files handed to a worker at a time
+DEFAULT_CHUNKSIZE = 16
+
+# Names listed per finding in the report before it is cut short
+REPORT_LIMIT = 20
+
+# Engine instance owned by each worker process
+_worker_engine = None
+
+
+def _init_worker(cache_dir):
+    """Create the engine once per worker process"""
+    global _worker_engine
+    _worker_engine = make_engine(cache_dir)
+
+
+def _summarize(engine, path):
+    """Return (path, (mtime_ns, size), FileSummary), or (path, None, None) if it is gone"""
+    try:
+        stat = os.stat(path)
+        code = read_source(path)
+    except OSError:
+        return path, None, None
+    return path, (stat.st_mtime_ns, stat.st_size), engine.file_summary(code)
+
+
+def _summarize_chunk(paths):
+    """Summarize a chunk of files inside a worker process"""
+    return [_summarize(_worker_engine, path) for path in paths]
+
+
+class ProjectIndex:
+    """Functions and includes of every C file under a root, merged across files
+
+    Each file is reduced to a FileSummary (cached by content, so unchanged
+    files cost a read and a hash). update() re-summarizes only new and
+    changed files and patches the merged index with their differences.
+    """
+
+    def __init__(self, root, include_dirs=(), workers=None, cache_dir=None,
+                 chunksize=DEFAULT_CHUNKSIZE):
+        self.root = os.path.abspath(root)
+        self.include_dirs = [os.path.abspath(directory) for directory in include_dirs]
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.chunksize = chunksize
+        self._engine = None
+        # path -> FileSummary and (mtime_ns, size) of every file
+        self.files = {}
+        self.signatures = {}
+        # Function name -> paths that define, declare or call it
+        self.mentions = {}
+        # path -> project files it includes, and the reverse
+        self.includes = {}
+        self.includers = {}
+        # path -> headers it includes from outside the project, as written
+        self.external = {}
+
+    # Updating
+
+    def update(self, paths=None):
+        """Re-summarize new and changed files and return what changed
+
+        paths limits the check to those files or directories (as reported
+        by a watcher); by default the whole tree is rescanned.
+        """
+        started = time.perf_counter()
+        if paths is None:
+            candidates = set(collect_files([self.root]))
+            removed = set(self.files) - candidates
+        else:
+            candidates = set()
+            removed = set()
+            for path in map(os.path.abspath, paths):
+                if os.path.isdir(path):
+                    candidates.update(collect_files([path]))
+                elif path.endswith(C_EXTENSIONS):
+                    candidates.add(path)
+                # A removed directory's files are only known by prefix
+                prefix = os.path.join(path, '')
+                removed.update(known for known in self.files
+                               if known.startswith(prefix) or known == path)
+            removed -= {path for path in candidates if os.path.exists(path)}
+
+        stale = []
+        for path in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                removed.add(path)
+                continue
+            if self.signatures.get(path) != (stat.st_mtime_ns, stat.st_size):
+                stale.append(path)
+
+        changed = set()
+        added = set()
+        for path, signature, summary in self._summarize_all(sorted(stale)):
+            if summary is None:
+                removed.add(path)
+                continue
+            self.signatures[path] = signature
+            previous = self.files.get(path)
+            if previous == summary:
+                # Touched, or edited without changing anything indexed
+                continue
+            if previous is None:
+                added.add(path)
+            else:
+                self._unmerge(path, previous)
+            self.files[path] = summary
+            self._merge(path, summary)
+            changed.add(path)
+
+        removed &= set(self.files)
+        affected = set(changed)
+        for path in removed:
+            affected |= self.dependents(path)
+            self._unmerge(path, self.files.pop(path))
+            del self.signatures[path]
+            for target in self.includes.pop(path, ()):
+                self.includers.get(target, set()).discard(path)
+            self.includers.pop(path, None)
+            self.external.pop(path, None)
+
+        if added or removed:
+            # New or deleted headers can change how any #include resolves
+            for path in self.files:
+                self._resolve(path)
+        else:
+            for path in changed:
+                self._resolve(path)
+        for path in changed:
+            affected |= self.dependents(path)
+        return {
+            'changed': sorted(changed - added),
+            'added': sorted(added),
+            'removed': sorted(removed),
+            'affected': sorted(affected - removed),
+            'files': len(self.files),
+            'elapsed_ms': (time.perf_counter() - started) * 1000,
+        }
+
+    def _summarize_all(self, paths):
+        """Yield _summarize results for paths, in a process pool when there are many"""
+        if self.workers == 1 or len(paths) < PARALLEL_THRESHOLD:
+            if self._engine is None:
+                self._engine = make_engine(self.cache_dir)
+            for path in paths:
+                yield _summarize(self._engine, path)
+            return
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.cache_dir,)) as pool:
+            chunks = [paths[i:i + self.chunksize] for i in range(0, len(paths), self.chunksize)]
+            for results in pool.map(_summarize_chunk, chunks):
+                yield from results
+
+    def _merge(self, path, summary):
+        for name in summary.names():
+            self.mentions.setdefault(name, set()).add(path)
+
+    def _unmerge(self, path, summary):
+        for name in summary.names():
+            paths = self.mentions.get(name)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self.mentions[name]
+
+    def _resolve(self, path):
+        """Point path's #includes at project files, like a compiler's search"""
+        resolved = set()
+        external = []
+        directory = os.path.dirname(path)
+        for header, quoted, _ in self.files[path].includes:
+            directories = ([directory] if quoted else []) + self.include_dirs
+            for base in directories:
+                target = os.path.normpath(os.path.join(base, header))
+                if target in self.files:
+                    resolved.add(target)
+                    break
+            else:
+                external.append(header)
+        for target in self.includes.get(path, set()) - resolved:
+            self.includers.get(target, set()).discard(path)
+        for target in resolved:
+            self.includers.setdefault(target, set()).add(path)
+        self.includes[path] = resolved
+        if external:
+            self.external[path] = external
+        else:
+            self.external.pop(path, None)
+
+    # Queries
+
+    def function(self, name):
+        """Return the definitions, declarations and call sites of a function"""
+        result = {'name': name, 'definitions': [], 'declarations': [], 'calls': []}
+        for path in sorted(self.mentions.get(name, ())):
+            summary = self.files[path]
+            for line, static in summary.definitions.get(name, ()):
+                result['definitions'].append({'path': path, 'line': line, 'static': static})
+            for line in summary.declarations.get(name, ()):
+                result['declarations'].append({'path': path, 'line': line})
+            for line, column in summary.calls.get(name, ()):
+                result['calls'].append({'path': path, 'line': line, 'column': column})
+        return result
+
+    def definition_of(self, name, path=None):
+        """Return the (path, line) a call of name from path links to, or None
+
+        A static definition in path itself wins over external ones.
+        """
+        external = None
+        for candidate in sorted(self.mentions.get(name, ())):
+            for line, static in self.files[candidate].definitions.get(name, ()):
+                if candidate == path:
+                    return candidate, line
+                if not static and external is None:
+                    external = (candidate, line)
+        return external
+
+    def dependents(self, path):
+        """Return every file that includes path, directly or through other headers"""
+        found = set()
+        stack = [path]
+        while stack:
+            for includer in self.includers.get(stack.pop(), ()):
+                if includer not in found:
+                    found.add(includer)
+                    stack.append(includer)
+        return found
+
+    def include_cycles(self):
+        """Return the groups of files that include each other, as sorted lists"""
+        # Tarjan's strongly connected components, without recursion
+        order = {}
+        low = {}
+        on_stack = set()
+        stack = []
+        cycles = []
+        for start in sorted(self.includes):
+            if start in order:
+                continue
+            work = [(start, iter(sorted(self.includes.get(start, ()))))]
+            order[start] = low[start] = len(order)
+            stack.append(start)
+            on_stack.add(start)
+            while work:
+                node, targets = work[-1]
+                for target in targets:
+                    if target not in order:
+                        order[target] = low[target] = len(order)
+                        stack.append(target)
+                        on_stack.add(target)
+                        work.append((target, iter(sorted(self.includes.get(target, ())))))
+                        break
+                    if target in on_stack:
+                        low[node] = min(low[node], order[target])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[node])
+                    if low[node] == order[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in self.includes.get(node, ()):
+                            cycles.append(sorted(component))
+        return cycles
+
+    def problems(self):
+        """Return the cross-file findings as a dict of sorted lists"""
+        duplicates = []
+        undefined = []
+        unreferenced = []
+        for name in sorted(self.mentions):
+            entry = self.function(name)
+            external = [d for d in entry['definitions'] if not d['static']]
+            if len(external) > 1:
+                duplicates.append({'name': name, 'definitions': external})
+            if entry['declarations'] and entry['calls'] and not entry['definitions']:
+                undefined.append({'name': name, 'calls': len(entry['calls'])})
+            if entry['definitions'] and not entry['calls'] and name != 'main':
+                unreferenced.append({'name': name, 'definitions': entry['definitions']})
+        return {
+            'duplicates': duplicates,
+            'undefined': undefined,
+            'unreferenced': unreferenced,
+            'include_cycles': self.include_cycles(),
+        }
+
+    def as_dict(self):
+        """Return the project totals and findings as a JSON-serializable dict"""
+        return {
+            'root': self.root,
+            'files': len(self.files),
+            'functions': sum(1 for summary in self.files.values() for _ in summary.definitions),
+            'calls': sum(len(calls) for summary in self.files.values()
+                         for calls in summary.calls.values()),
+            'include_edges': sum(len(targets) for targets in self.includes.values()),
+            'external_includes': sorted({header for headers in self.external.values()
+                                         for header in headers}),
+            'problems': self.problems(),
+        }
+
+    def rules(self):
+        """Render the project totals and findings as report lines"""
+        summary = self.as_dict()
+        problems = summary['problems']
+        relative = self.relative
+        rules = [
+            f"Project {self.root}: {summary['files']} files",
+            f"  {summary['functions']} function definitions, {summary['calls']} call sites, "
+            f"{summary['include_edges']} include edges",
+        ]
+        if problems['duplicates']:
+            rules.append(f"✗ {len(problems['duplicates'])} function(s) defined in several files:")
+            for entry in problems['duplicates'][:REPORT_LIMIT]:
+                places = ", ".join(f"{relative(d['path'])}:{d['line']}" for d in entry['definitions'])
+                rules.append(f"  - {entry['name']} ({places})")
+        else:
+            rules.append("✓ No function is defined in more than one file")
+        if problems['undefined']:
+            rules.append(f"✗ {len(problems['undefined'])} function(s) declared and called "
+                         f"but never defined:")
+            rules.extend(f"  - {entry['name']} ({entry['calls']} call(s))"
+                         for entry in problems['undefined'][:REPORT_LIMIT])
+        if problems['unreferenced']:
+            rules.append(f"✗ {len(problems['unreferenced'])} function(s) never called:")
+            for entry in problems['unreferenced'][:REPORT_LIMIT]:
+                first = entry['definitions'][0]
+                rules.append(f"  - {entry['name']} ({relative(first['path'])}:{first['line']})")
+        if problems['include_cycles']:
+            rules.append(f"✗ {len(problems['include_cycles'])} include cycle(s):")
+            for cycle in problems['include_cycles'][:REPORT_LIMIT]:
+                rules.append("  - " + ", ".join(map(relative, cycle)))
+        else:
+            rules.append("✓ No include cycles")
+        return rules
+
+    def relative(self, path):
+        """Return path relative to the project root for display"""
+        return os.path.relpath(path, self.root)
+
+
+def format_function(entry, relative):
+    """Render a ProjectIndex.function() entry as lines"""
+    lines = [f"{entry['name']}:"]
+    for definition in entry['definitions']:
+        storage = "static " if definition['static'] else ""
+        lines.append(f"  {storage}definition {relative(definition['path'])}:{definition['line']}")
+    for declaration in entry['declarations']:
+        lines.append(f"  declaration {relative(declaration['path'])}:{declaration['line']}")
+    for call in entry['calls']:
+        lines.append(f"  call {relative(call['path'])}:{call['line']}:{call['column']}")
+    if len(lines) == 1:
+        lines.append("  not found")
+    return "\n".join(lines)
+
+
+def format_update(update):
+    """Render an update() result as one line"""
+    counts = [f"{len(update[kind])} {kind}" for kind in ('added', 'changed', 'removed') if update[kind]]
+    return (f"[{time.strftime('%H:%M:%S')}] {', '.join(counts) or 'no index changes'}; "
+            f"{len(update['affected'])} file(s) affected, {update['elapsed_ms']:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index the functions and includes of a C project")
+    parser.add_argument('root', help="project directory")
+    parser.add_argument('-I', '--include-dir', action='append', default=[],
+                        help="directory searched for #include <...> and \"...\" (repeatable)")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="worker processes (default: CPU count, 1 disables the pool)")
+    parser.add_argument('--cache-dir', default=default_cache_dir(),
+                        help="directory of the persistent result cache")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="do not read or write the persistent cache")
+    parser.add_argument('-f', '--function', action='append', default=[],
+                        help="print where a function is defined, declared and called (repeatable)")
+    parser.add_argument('--json', action='store_true', help="emit JSON instead of text")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep the index current as files change and reprint the report")
+    parser.add_argument('--poll', action='store_true',
+                        help="with --watch, poll even where inotify is available")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        print(f"Not a directory: {args.root}", file=sys.stderr)
+        return 2
+
+    project = ProjectIndex(args.root, args.include_dir, args.workers,
+                           None if args.no_cache else args.cache_dir)
+
+    def report(update):
+        if args.json:
+            result = dict(project.as_dict(), update=update)
+            if args.function:
+                result['lookups'] = [project.function(name) for name in args.function]
+            print(json.dumps(result), flush=True)
+            return
+        lines = [format_update(update)] + project.rules()
+        lines.extend(format_function(project.function(name), project.relative)
+                     for name in args.function)
+        print("\n".join(lines), flush=True)
+
+    report(project.update())
+    if not args.watch:
+        return 0
+    watcher = make_watcher(project.root, DEFAULT_INTERVAL, not args.poll)
+    try:
+        while True:
+            changed = watcher.wait()
+            # Let a burst of saves settle before re-indexing anything
+            while True:
+                more = watcher.wait(DEFAULT_DEBOUNCE)
+                if not more:
+                    break
+                changed |= more
+            update = project.update(changed)
+            if update['added'] or update['changed'] or update['removed']:
+                report(update)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
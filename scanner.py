@@ -0,0 +1,262 @@
+import codecs
+import io
+import mmap
+import os
+import re
+
+# C keywords
+C_KEYWORDS = frozenset({
+    'auto', 'break', 'case', 'char', 'const', 'continue', 'default', 'do',
+    'double', 'else', 'enum', 'extern', 'float', 'for', 'goto', 'if',
+    'int', 'long', 'register', 'return', 'short', 'signed', 'sizeof', 'static',
+    'struct', 'switch', 'typedef', 'union', 'unsigned', 'void', 'volatile', 'while'
+})
+
+# C operators and punctuators, longest first so the scanner is greedy
+C_OPERATORS = (
+    '...', '<<=', '>>=',
+    '->', '++', '--', '<<', '>>', '<=', '>=', '==', '!=', '&&', '||',
+    '+=', '-=', '*=', '/=', '%=', '&=', '|=', '^=',
+    '+', '-', '*', '/', '%', '=', '>', '<', '!', '&', '|', '^', '~',
+    '.', '?', ':', ';', ',', '(', ')', '[', ']', '{', '}'
+)
+
+# Speedup over the line-by-line tokenizer it replaced (bench.reference_tokenize)
+# that lexing must reach on every corpus profile
+TARGET_SPEEDUP = 1.0
+
+# Characters decoded and scanned at a time by the streaming tokenizer
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+# Tokens ending within this many characters of a chunk's end may still change
+_OPEN_MARGIN = 2
+
+# The tokens of each kind. Every alternative starts with a literal or a
+# character class, so the regex engine rules out most of them from the
+# next character alone. A directive is only recognized where its '#'
+# opens a line, so in TOKEN_PATTERN it takes the line break before it.
+# Bodies are taken as possessive runs of ordinary characters rather than
+# one character per repetition; nothing after a token can make the engine
+# give characters back, so this only saves steps.
+_DIRECTIVE = r'\#(?:[^\\\n]++|\\\r?\n|\\)*+'
+_COMMENTS = (r'//(?:[^\\\n]++|\\\r?\n|\\)*+', r'/\*(?:[^*]++|\*(?!/))*+(?:\*/|\Z)')
+_STRING_BODY = r'"(?:[^"\\\n]++|\\(?s:.))*+"?'
+_CHARACTER_BODY = r"'(?:[^'\\\n]++|\\(?s:.))*+'?"
+_STRINGS = (_STRING_BODY, _CHARACTER_BODY, '[LuU]' + _STRING_BODY,
+            '[LuU]' + _CHARACTER_BODY, 'u8' + _STRING_BODY)
+_IDENTIFIERS = (r'[A-Za-z_]\w*+',)
+# An exponent sign is only part of a number right after its e, E, p or P
+_NUMBERS = (r'[0-9](?:[\w.]++|(?<=[eEpP])[+-])*+', r'\.[0-9](?:[\w.]++|(?<=[eEpP])[+-])*+')
+# C_OPERATORS, longest first, with the one-character operators and the
+# '=' forms folded into character classes to keep the alternation short
+_OPERATORS = (r'\.\.\.', '<<=', '>>=', '->', r'\+\+', '--', '<<', '>>', '&&', r'\|\|',
+              r'[-+*/%&|^=!<>]=', r'[-+*/%=<>!&|^~.?:;,()\[\]{}]')
+_UNKNOWN = (r'(?s:.)',)
+
+# Characters skipped between tokens
+WHITESPACE = ' \t\r\f\v\n'
+
+# Whitespace before a token: blank lines, then spaces. The line break
+# before a directive is left for the directive to take.
+_SPACE = r'[ \t\r\f\v]*+(?:\n(?![ \t\r\f\v]*+\#)[ \t\r\f\v]*+)*+'
+
+# One master pattern applied once over the whole buffer: the whitespace
+# skipped before a token, then the token as group 1 (a directive's text
+# starts with the line break before it). The order of the alternatives
+# matters: comments must win over the '/' operator and string prefixes
+# over identifiers. The empty match at the end consumes trailing whitespace.
+_TOKEN = '|'.join((r'\n[ \t\r\f\v]*' + _DIRECTIVE,) + _COMMENTS + _STRINGS + _IDENTIFIERS
+                  + _NUMBERS + _OPERATORS + _UNKNOWN + (r'\Z',))
+TOKEN_PATTERN = re.compile(f'{_SPACE}({_TOKEN})')
+
+# The same without the group: findall() returns each token together with
+# the whitespace before it, so token offsets can be summed from the lengths
+SPACED_TOKEN_PATTERN = re.compile(f'{_SPACE}(?:{_TOKEN})')
+
+# A directive on the first line, which has no line break before it
+LEADING_DIRECTIVE = re.compile(r'[ \t\r\f\v]*+' + _DIRECTIVE)
+
+# Classifies the text of one token: the group that matches is its kind. A
+# '#' reads as a directive here; it is one only where it opens a line.
+KIND_PATTERN = re.compile('|'.join(
+    '(' + '|'.join(alternatives) + ')' for alternatives in
+    ((r'\n?[ \t\r\f\v]*' + _DIRECTIVE,), _COMMENTS, _STRINGS, _IDENTIFIERS, _NUMBERS,
+     _OPERATORS, _UNKNOWN)))
+
+# Token kind for each capturing group of KIND_PATTERN
+GROUP_KINDS = (
+    None, 'PREPROCESSOR', 'COMMENT', 'STRING', 'IDENTIFIER', 'NUMBER',
+    'OPERATOR', 'UNKNOWN'
+)
+PREPROCESSOR_GROUP = 1
+COMMENT_GROUP = 2
+STRING_GROUP = 3
+IDENTIFIER_GROUP = 4
+NUMBER_GROUP = 5
+OPERATOR_GROUP = 6
+UNKNOWN_GROUP = 7
+
+
+def kind_of(text):
+    """Return the kind name of a token's text (a '#' reads as a directive)"""
+    kind = GROUP_KINDS[KIND_PATTERN.match(text).lastindex]
+    if kind == 'IDENTIFIER' and text in C_KEYWORDS:
+        return 'KEYWORD'
+    return kind
+
+
+class TokenTable(dict):
+    """TOKEN_PATTERN group text -> (type, value) token, built once per text
+
+    Keywords, identifiers and operators repeat, so most tokens are plain
+    dictionary hits, and equal tokens share one tuple.
+    """
+    __slots__ = ()
+
+    def __missing__(self, text):
+        kind = kind_of(text)
+        if kind != 'PREPROCESSOR':
+            token = (kind, text)
+        elif text[0] == '\n':
+            token = (kind, text.strip())
+        else:
+            # A '#' that does not open a line
+            token = ('UNKNOWN', text)
+        self[text] = token
+        return token
+
+
+def indices(sequence, item):
+    """Yield the positions of item in a list or array, searching at C speed"""
+    index = -1
+    for _ in range(sequence.count(item)):
+        index = sequence.index(item, index + 1)
+        yield index
+
+
+def scan(code, pos=0, endpos=None):
+    """Yield (kind, start, end) for every token in code[pos:endpos]"""
+    if endpos is None:
+        endpos = len(code)
+    if pos == 0:
+        leading = LEADING_DIRECTIVE.match(code, 0, endpos)
+        if leading is not None:
+            yield 'PREPROCESSOR', code.index('#'), leading.end()
+            pos = leading.end()
+    elif code[pos - 1] == '\n':
+        # Let the pattern see the line break, so a directive can open the line
+        pos -= 1
+    tokens = TokenTable()
+    for match in TOKEN_PATTERN.finditer(code, pos, endpos):
+        text = match[1]
+        if not text:
+            continue
+        kind = tokens[text][0]
+        start, end = match.span(1)
+        if kind == 'PREPROCESSOR':
+            start = code.index('#', start)
+        yield kind, start, end
+
+
+def tokenize(code):
+    """Tokenize C code into a list of (type, value) tuples in one pass"""
+    tokens = []
+    pos = 0
+    leading = LEADING_DIRECTIVE.match(code)
+    if leading is not None:
+        tokens.append(('PREPROCESSOR', leading[0].strip()))
+        pos = leading.end()
+    texts = TOKEN_PATTERN.findall(code, pos)
+    # The match at the end of the text only consumes trailing whitespace
+    while texts and not texts[-1]:
+        texts.pop()
+    tokens += map(TokenTable().__getitem__, texts)
+    return tokens
+
+
+def read_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, encoding='utf-8'):
+    """Yield the decoded text of a file in chunks, reading it through mmap"""
+    decoder = io.IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(encoding)(errors='replace'), translate=True)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for offset in range(0, size, chunk_size):
+                    text = decoder.decode(view[offset:offset + chunk_size])
+                    if text:
+                        yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def scan_chunks(chunks):
+    """Yield (kind, value, start) for the tokens of text arriving in chunks
+
+    A token ending near the end of the buffered text may continue in the
+    next chunk (an open comment or string, a split identifier or '...'),
+    so it is held back and scanned again once more text has arrived. Only
+    the held tokens and the whitespace after the last one are kept between
+    chunks.
+    """
+    tokens = TokenTable()
+    # The buffer starts with a line break of its own, so a directive on
+    # the first line is recognized like any other; base is the absolute
+    # offset of buffer[0]
+    buffer = "\n"
+    base = -1
+    # Buffer length to wait for before rescanning a token that is still open
+    wait_for = 0
+    chunks = iter(chunks)
+    final = False
+    while not final:
+        chunk = next(chunks, None)
+        if chunk is None:
+            final = True
+        else:
+            buffer += chunk
+            if len(buffer) < wait_for:
+                continue
+
+        # Resume right after the last emitted token, so the line break
+        # before a directive on the next line is scanned again
+        restart = 0
+        # A string stops before a trailing backslash and an operator may
+        # grow by two characters, so tokens ending this close are not final
+        limit = len(buffer) - _OPEN_MARGIN
+        for match in TOKEN_PATTERN.finditer(buffer):
+            text = match[1]
+            if not text:
+                continue
+            start, end = match.span(1)
+            if end > limit and not final:
+                break
+            kind, value = tokens[text]
+            if kind == 'PREPROCESSOR':
+                start = buffer.index('#', start)
+            yield kind, value, base + start
+            restart = end
+
+        if restart == 0:
+            # One open token or blank run spans the whole buffer; rescanning
+            # it on every chunk would be quadratic, so let the buffer double
+            wait_for = 2 * len(buffer)
+            continue
+        wait_for = 0
+        base += restart
+        buffer = buffer[restart:]
+
+
+def stream_tokens(source, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Lazily tokenize a file path or text file object into (type, value) tuples
+
+    Yields the same tokens as tokenize() while holding only about one chunk
+    of the source in memory.
+    """
+    if isinstance(source, (str, bytes, os.PathLike)):
+        chunks = read_chunks(source, chunk_size)
+    else:
+        chunks = iter(lambda: source.read(chunk_size), '')
+    for kind, value, _ in scan_chunks(chunks):
+        yield kind, value
@@ -0,0 +1,595 @@
+import re
+import sys
+from array import array
+from bisect import bisect_left
+
+import token_buffer
+from c_parser import TYPE_KEYWORDS
+from scanner import COMMENT_GROUP, IDENTIFIER_GROUP, PREPROCESSOR_GROUP
+from token_buffer import KEYWORD_KIND
+
+# Symbol kinds
+FUNCTION = 'function'
+VARIABLE = 'variable'
+PARAMETER = 'parameter'
+FIELD = 'field'
+TYPEDEF = 'typedef'
+TAG = 'tag'
+ENUMERATOR = 'enumerator'
+MACRO = 'macro'
+
+_RECORD_KEYWORDS = frozenset({'struct', 'union', 'enum'})
+
+# Tokens after a typedef name and its '*'s that make `T *x` a declaration
+_DECLARATOR_FOLLOWERS = frozenset({';', '=', ',', '[', ')'})
+
+_DEFINE_PATTERN = re.compile(r'#[ \t]*define[ \t]+([A-Za-z_]\w*)')
+_INCLUDE_PATTERN = re.compile(r'#[ \t]*include[ \t]*([<"])([^>"\n]+)[>"]')
+
+# Tokens that end the declaration before a function's name
+_DECLARATION_BOUNDARIES = frozenset({';', '{', '}'})
+
+
+class Symbol:
+    """One declaration of a name and the number of uses resolved to it"""
+    __slots__ = ('name', 'kind', 'line', 'column', 'depth', 'scope', 'is_definition', 'uses')
+
+    def __init__(self, name, kind, line, column, depth, scope, is_definition=True):
+        self.name = name
+        self.kind = kind
+        self.line = line
+        self.column = column
+        # Brace nesting of the declaration; 0 is file scope
+        self.depth = depth
+        # Id of the scope the name was declared in
+        self.scope = scope
+        # False for function prototypes
+        self.is_definition = is_definition
+        self.uses = 0
+
+    def __repr__(self):
+        return f"Symbol({self.name!r}, {self.kind}, line {self.line})"
+
+
+class SymbolIndex:
+    """Declarations and uses of every name in a source, keyed by interned name"""
+    __slots__ = ('tokens', 'definitions', 'references', 'duplicate_pairs')
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        # name -> [Symbol] in source order
+        self.definitions = {}
+        # name -> token indices of every use of the name
+        self.references = {}
+        # (first Symbol, redefining Symbol) for names defined twice in one scope
+        self.duplicate_pairs = []
+
+    def __len__(self):
+        return len(self.definitions)
+
+    def __contains__(self, name):
+        return name in self.definitions or name in self.references
+
+    def lookup(self, name):
+        """Return the declarations of name"""
+        return self.definitions.get(name, [])
+
+    def uses(self, name):
+        """Return the (line, column) of every use of name"""
+        lines, columns = self.tokens.lines, self.tokens.columns
+        return [(lines[index], columns[index]) for index in self.references.get(name, ())]
+
+    def unused(self):
+        """Return the local variables that are never used, by line"""
+        return sorted((symbol for symbols in self.definitions.values() for symbol in symbols
+                       if symbol.kind == VARIABLE and symbol.depth and not symbol.uses),
+                      key=lambda symbol: (symbol.line, symbol.column))
+
+    def duplicates(self):
+        """Return (first, duplicate) pairs of names defined twice in one scope"""
+        return list(self.duplicate_pairs)
+
+    def as_dict(self):
+        """Return the index findings as a JSON-serializable dict"""
+        return {
+            'symbols': sum(len(symbols) for symbols in self.definitions.values()),
+            'references': sum(len(indices) for indices in self.references.values()),
+            'unused': [
+                {'name': symbol.name, 'line': symbol.line, 'column': symbol.column}
+                for symbol in self.unused()
+            ],
+            'duplicates': [
+                {'name': duplicate.name, 'kind': duplicate.kind, 'line': duplicate.line,
+                 'column': duplicate.column, 'first_line': first.line}
+                for first, duplicate in self.duplicate_pairs
+            ],
+        }
+
+    def rules(self):
+        """Render the findings as grammar report lines"""
+        rules = []
+        unused = self.unused()
+        if unused:
+            rules.append(f"✗ Found {len(unused)} unused variable(s):")
+            for symbol in unused:
+                rules.append(f"  - {symbol.name} (line {symbol.line})")
+        if self.duplicate_pairs:
+            rules.append(f"✗ Found {len(self.duplicate_pairs)} duplicate definition(s):")
+            for first, duplicate in self.duplicate_pairs:
+                rules.append(f"  - {duplicate.kind} {duplicate.name} (line {duplicate.line}, "
+                             f"first defined on line {first.line})")
+        return rules
+
+
+class FileSummary:
+    """The cross-file facts of one source: its functions, calls and #includes
+
+    Holds no path, so it can be cached by content and merged into a
+    project index under whichever path the text was read from.
+    """
+    __slots__ = ('definitions', 'declarations', 'calls', 'includes')
+
+    def __init__(self):
+        # Function name -> [(line, is static)] of its bodies
+        self.definitions = {}
+        # Function name -> [line] of its prototypes
+        self.declarations = {}
+        # Function name -> [(line, column)] of its call sites
+        self.calls = {}
+        # (header, quoted, line) of every #include "header" or <header>
+        self.includes = []
+
+    def names(self):
+        """Return every function name the file defines, declares or calls"""
+        return self.definitions.keys() | self.declarations.keys() | self.calls.keys()
+
+    def __eq__(self, other):
+        if not isinstance(other, FileSummary):
+            return NotImplemented
+        return (self.definitions == other.definitions and self.declarations == other.declarations
+                and self.calls == other.calls and self.includes == other.includes)
+
+
+def summarize(index):
+    """Build the FileSummary of a SymbolIndex"""
+    tokens = index.tokens
+    code = tokens.source
+    kinds, starts, lengths = tokens.kinds, tokens.starts, tokens.lengths
+    lines, columns = tokens.lines, tokens.columns
+    count = len(kinds)
+    summary = FileSummary()
+
+    def value_at(position):
+        start = starts[position]
+        return code[start:start + lengths[position]]
+
+    def position_of(symbol):
+        position = bisect_left(lines, symbol.line)
+        while columns[position] != symbol.column:
+            position += 1
+        return position
+
+    def is_static(position):
+        while position > 0:
+            position -= 1
+            if kinds[position] in (COMMENT_GROUP, PREPROCESSOR_GROUP):
+                continue
+            value = value_at(position)
+            if value in _DECLARATION_BOUNDARIES:
+                return False
+            if value == 'static':
+                return True
+        return False
+
+    # Names declared as something else: calls through a variable or a
+    # function-like macro are not calls of a function with that name
+    other_names = set()
+    for name, symbols in index.definitions.items():
+        if any(symbol.kind != FUNCTION for symbol in symbols):
+            other_names.add(name)
+            continue
+        for symbol in symbols:
+            if symbol.is_definition:
+                summary.definitions.setdefault(name, []).append(
+                    (symbol.line, is_static(position_of(symbol))))
+            else:
+                summary.declarations.setdefault(name, []).append(symbol.line)
+
+    for name, positions in index.references.items():
+        if name in other_names:
+            continue
+        for position in positions:
+            after = position + 1
+            while after < count and kinds[after] in (COMMENT_GROUP, PREPROCESSOR_GROUP):
+                after += 1
+            if after < count and value_at(after) == '(':
+                summary.calls.setdefault(name, []).append((lines[position], columns[position]))
+
+    for position in range(count):
+        if kinds[position] == PREPROCESSOR_GROUP:
+            match = _INCLUDE_PATTERN.match(value_at(position).lstrip())
+            if match is not None:
+                summary.includes.append((match.group(2), match.group(1) == '"', lines[position]))
+    return summary
+
+
+def _is_duplicate(first, second):
+    """Check whether second redefines first rather than redeclaring it"""
+    if not (first.is_definition and second.is_definition):
+        return False
+    if first.kind == MACRO or second.kind == MACRO:
+        return False
+    # File-scope variables may be declared any number of times
+    return not (first.depth == 0 and first.kind == VARIABLE and second.kind == VARIABLE)
+
+
+def index_symbols(code, tokens=None):
+    """Build the SymbolIndex of code in one pass over its tokens
+
+    Declarations are recognized from the token shapes alone: a type
+    keyword or typedef name followed by declarators, struct, union and
+    enum bodies, parameter lists and #define directives. Every other
+    identifier is a use, resolved to the innermost visible declaration.
+    """
+    if tokens is None:
+        tokens = token_buffer.lex(code)
+    index = SymbolIndex(tokens)
+    definitions = index.definitions
+    references = index.references
+    kinds, starts, lengths = tokens.kinds, tokens.starts, tokens.lengths
+    lines, columns = tokens.lines, tokens.columns
+    count = len(kinds)
+
+    # Visible declarations: lookup key -> stack of Symbols, innermost last.
+    # Tags live in their own namespace under keys like 'struct S'.
+    visible = {}
+    # Open scopes as (id, [(key, Symbol)]); scope 0 is the file
+    scopes = [(0, [])]
+    next_scope = 1
+    typedef_names = set()
+
+    def value_at(position):
+        start = starts[position]
+        return code[start:start + lengths[position]]
+
+    def following(position):
+        """Index of the next token that is not a comment or directive"""
+        position += 1
+        while position < count and kinds[position] in (COMMENT_GROUP, PREPROCESSOR_GROUP):
+            position += 1
+        return position
+
+    def define(name, kind, position, key=None, is_definition=True, check=True):
+        scope_id, declared = scopes[-1]
+        symbol = Symbol(name, kind, lines[position], columns[position],
+                        len(scopes) - 1, scope_id, is_definition)
+        definitions.setdefault(name, []).append(symbol)
+        key = key or name
+        stack = visible.setdefault(key, [])
+        if check:
+            check_duplicate(symbol, stack)
+        stack.append(symbol)
+        declared.append((key, symbol))
+        if kind == TYPEDEF:
+            typedef_names.add(name)
+        return symbol
+
+    def check_duplicate(symbol, stack):
+        for earlier in reversed(stack):
+            if earlier.scope != symbol.scope:
+                break
+            if earlier is not symbol and _is_duplicate(earlier, symbol):
+                index.duplicate_pairs.append((earlier, symbol))
+                break
+
+    def use(name, position, key=None):
+        indices = references.get(name)
+        if indices is None:
+            indices = references[name] = array('I')
+        indices.append(position)
+        stack = visible.get(key or name)
+        if stack:
+            stack[-1].uses += 1
+
+    def open_scope():
+        nonlocal next_scope
+        scopes.append((next_scope, []))
+        next_scope += 1
+
+    def close_scope():
+        if len(scopes) == 1:
+            return
+        _, declared = scopes.pop()
+        for key, symbol in reversed(declared):
+            stack = visible[key]
+            if stack[-1] is symbol:
+                stack.pop()
+            else:
+                stack.remove(symbol)
+            if not stack:
+                del visible[key]
+
+    def names_type(position):
+        """Check whether the identifier at position is a type in a declaration"""
+        after = following(position)
+        if after >= count:
+            return False
+        if kinds[after] == IDENTIFIER_GROUP:
+            return True
+        if value_at(after) != '*':
+            return False
+        if value_at(position) in typedef_names:
+            return True
+        # An unknown typedef name: `T *x;`, `T **x =`, ...
+        while after < count and value_at(after) == '*':
+            after = following(after)
+        return (after < count and kinds[after] == IDENTIFIER_GROUP
+                and following(after) < count and value_at(following(after)) in _DECLARATOR_FOLLOWERS)
+
+    # Open braces as (what, saved declaration state)
+    braces = []
+    paren_depth = 0
+    # The next token may begin a declaration
+    at_start = True
+    # Inside a declaration's specifiers or declarators
+    in_decl = False
+    # Inside an initializer, where identifiers are uses
+    in_init = False
+    # The next identifier is a declarator name
+    expect_name = False
+    decl_kind = VARIABLE
+    decl_paren = 0
+    # Function whose parameter list or body is pending, and its parameters
+    function = None
+    params = []
+    param_paren = None
+    saved_decl = None
+    # 'struct', 'union' or 'enum' whose body is the next '{'
+    body_keyword = None
+    # Paren depths of open for headers; brace depths of for statements
+    # whose body is a single statement
+    for_parens = []
+    single_fors = []
+    for_body = False
+    previous = None
+
+    def base_kind():
+        return FIELD if braces and braces[-1][0] == 'record' else VARIABLE
+
+    position = 0
+    while position < count:
+        group = kinds[position]
+        if group == COMMENT_GROUP:
+            position += 1
+            continue
+        start = starts[position]
+        value = code[start:start + lengths[position]]
+        if group == PREPROCESSOR_GROUP:
+            match = _DEFINE_PATTERN.match(value.strip())
+            if match is not None:
+                name = sys.intern(match.group(1))
+                symbol = Symbol(name, MACRO, lines[position],
+                                columns[position] + value.find(name, value.find('define') + 6),
+                                0, 0)
+                definitions.setdefault(name, []).append(symbol)
+                visible.setdefault(name, []).insert(0, symbol)
+                scopes[0][1].insert(0, (name, symbol))
+            position += 1
+            continue
+
+        if group == KEYWORD_KIND:
+            if value in _RECORD_KEYWORDS:
+                after = following(position)
+                if after < count and kinds[after] == IDENTIFIER_GROUP:
+                    tag = sys.intern(value_at(after))
+                    key = f"{value} {tag}"
+                    body = following(after)
+                    if body < count and value_at(body) == '{':
+                        define(tag, TAG, after, key)
+                    else:
+                        use(tag, after, key)
+                    position = after
+                    after = body
+                if after < count and value_at(after) == '{':
+                    body_keyword = value
+                if at_start or (in_decl and not in_init):
+                    if not in_decl:
+                        decl_paren = paren_depth
+                    in_decl = True
+                    expect_name = True
+            elif value == 'typedef':
+                if not in_decl:
+                    decl_paren = paren_depth
+                in_decl = True
+                expect_name = True
+                decl_kind = TYPEDEF
+            elif value in TYPE_KEYWORDS:
+                if at_start or (in_decl and not in_init):
+                    if not in_decl:
+                        decl_paren = paren_depth
+                    in_decl = True
+                    expect_name = True
+            else:
+                expect_name = False
+            at_start = False
+            previous = value
+            position += 1
+            continue
+
+        if group == IDENTIFIER_GROUP:
+            name = sys.intern(value)
+            if previous == '.' or previous == '->':
+                # A member name; members are not indexed by use
+                pass
+            elif (braces and braces[-1][0] == 'enum' and previous in ('{', ',')
+                  and paren_depth == braces[-1][1][4]):
+                define(name, ENUMERATOR, position)
+            elif (at_start or (in_decl and expect_name and not in_init)) and names_type(position):
+                use(name, position)
+                if not in_decl:
+                    decl_paren = paren_depth
+                in_decl = True
+                expect_name = True
+            elif in_decl and expect_name and not in_init:
+                after = following(position)
+                if (decl_kind != TYPEDEF and after < count and value_at(after) == '('
+                        and paren_depth == decl_paren and param_paren is None):
+                    function = define(name, FUNCTION, position, is_definition=False, check=False)
+                    params = []
+                elif decl_kind == PARAMETER:
+                    if paren_depth == param_paren:
+                        params.append((name, position))
+                else:
+                    define(name, decl_kind, position)
+                expect_name = False
+            else:
+                use(name, position)
+                expect_name = False
+            at_start = False
+            previous = name
+            position += 1
+            continue
+
+        # Operators, numbers and strings
+        if value == '(':
+            paren_depth += 1
+            if previous == 'for':
+                for_parens.append(paren_depth)
+                open_scope()
+                at_start = True
+                in_decl = False
+            elif function is not None and previous == function.name and param_paren is None:
+                param_paren = paren_depth
+                saved_decl = (decl_kind, decl_paren)
+                decl_kind = PARAMETER
+                decl_paren = paren_depth
+                at_start = True
+                in_decl = False
+            elif not (in_decl and expect_name):
+                # `(*name)` keeps waiting for the declarator name
+                expect_name = False
+                at_start = False
+        elif value == ')':
+            if param_paren is not None and paren_depth == param_paren:
+                param_paren = None
+                decl_kind, decl_paren = saved_decl
+                in_decl = True
+                in_init = False
+                expect_name = False
+                at_start = False
+            elif for_parens and paren_depth == for_parens[-1]:
+                for_parens.pop()
+                after = following(position)
+                if after < count and value_at(after) == '{':
+                    for_body = True
+                else:
+                    single_fors.append(len(braces))
+                in_decl = False
+                in_init = False
+                at_start = True
+            else:
+                at_start = False
+            paren_depth = max(0, paren_depth - 1)
+        elif value == ',':
+            if param_paren is not None and paren_depth == param_paren:
+                in_decl = False
+                in_init = False
+                at_start = True
+            elif in_decl and paren_depth == decl_paren:
+                if function is not None and param_paren is None:
+                    # `int f(void), g;` declares f only
+                    function = None
+                in_init = False
+                expect_name = True
+        elif value == '=':
+            if in_decl and paren_depth == decl_paren:
+                in_init = True
+            expect_name = False
+            at_start = False
+        elif value == ';':
+            if for_parens and paren_depth == for_parens[-1]:
+                in_decl = False
+                in_init = False
+                at_start = False
+            elif paren_depth == 0:
+                function = None
+                in_decl = False
+                in_init = False
+                expect_name = False
+                decl_kind = base_kind()
+                at_start = True
+                while single_fors and single_fors[-1] == len(braces):
+                    single_fors.pop()
+                    close_scope()
+        elif value == '{':
+            if in_init:
+                braces.append(('init', None))
+            elif body_keyword is not None:
+                saved = (in_decl, decl_kind, decl_paren, at_start, paren_depth)
+                if body_keyword == 'enum':
+                    braces.append(('enum', saved))
+                else:
+                    braces.append(('record', saved))
+                    open_scope()
+                    decl_kind = FIELD
+                in_decl = False
+                at_start = True
+            elif function is not None:
+                function.is_definition = True
+                check_duplicate(function, visible.get(function.name, []))
+                braces.append(('block', None))
+                open_scope()
+                for name, param in params:
+                    define(name, PARAMETER, param)
+                function = None
+                params = []
+                in_decl = False
+                decl_kind = VARIABLE
+                at_start = True
+            elif for_body:
+                # The for header's scope is the body's scope
+                braces.append(('for', None))
+                at_start = True
+                in_decl = False
+            else:
+                braces.append(('block', None))
+                open_scope()
+                in_decl = False
+                decl_kind = base_kind()
+                at_start = True
+            body_keyword = None
+            for_body = False
+            expect_name = False
+        elif value == '}':
+            what, saved = braces.pop() if braces else ('block', None)
+            if what == 'init':
+                pass
+            elif saved is not None:
+                # The rest of `struct S { ... } s;` declares variables
+                if what == 'record':
+                    close_scope()
+                in_decl, decl_kind, decl_paren, at_start, _ = saved
+                if not in_decl:
+                    decl_paren = paren_depth
+                in_decl = True
+                expect_name = True
+                at_start = False
+            else:
+                close_scope()
+                in_decl = False
+                in_init = False
+                expect_name = False
+                decl_kind = base_kind()
+                at_start = True
+                while single_fors and single_fors[-1] == len(braces):
+                    single_fors.pop()
+                    close_scope()
+        elif value == '*':
+            at_start = False
+        else:
+            expect_name = False
+            at_start = False
+        previous = value
+        position += 1
+
+    return index
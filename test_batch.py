@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+import batch
+
+VALID = "int main() {\n    return 0;\n}\n"
+INVALID = "int main() {\n    return 0\n}\n"
+
+
+@pytest.fixture
+def sources(tmp_path):
+    (tmp_path / 'src' / 'sub').mkdir(parents=True)
+    (tmp_path / 'src' / 'a.c').write_text(VALID)
+    (tmp_path / 'src' / 'sub' / 'b.h').write_text("int b;\n")
+    (tmp_path / 'src' / 'sub' / 'bad.c').write_text(INVALID)
+    (tmp_path / 'src' / 'notes.txt').write_text("not a source")
+    return tmp_path / 'src'
+
+
+def summary(result):
+    """The parts of a result that do not depend on where it was computed"""
+    return (result['path'], [error['line'] for error in result['errors']], len(result.get('tokens', ())),
+            result.get('grammar'))
+
+
+def test_collect_files_expands_directories_and_globs(sources):
+    a, b, bad = str(sources / 'a.c'), str(sources / 'sub' / 'b.h'), str(sources / 'sub' / 'bad.c')
+    assert batch.collect_files([str(sources)]) == sorted([a, b, bad])
+    assert batch.collect_files([str(sources / '**' / '*.c')]) == sorted([a, bad])
+    # A pattern naming a file keeps it whatever its extension
+    assert batch.collect_files([str(sources / 'notes.txt'), a]) == sorted([a, str(sources / 'notes.txt')])
+
+
+def test_analyze_file(sources):
+    result = batch.analyze_file(str(sources / 'a.c'))
+    assert result['errors'] == [] and not result['truncated']
+    assert list(result['tokens'])[:2] == [('KEYWORD', 'int'), ('IDENTIFIER', 'main')]
+    assert 'syntax_tree' in result and 'grammar' in result
+
+    result = batch.analyze_file(str(sources / 'sub' / 'bad.c'), ('lexical',))
+    assert [error['line'] for error in result['errors']] == [2]
+    assert result['errors'][0]['code'] == "    return 0"
+    # The deeper analyses only run on valid code
+    assert 'tokens' not in result
+
+    assert 'error' in batch.analyze_file(str(sources / 'missing.c'))
+
+
+def test_pool_matches_serial_run(sources):
+    paths = batch.collect_files([str(sources)])
+    serial = [summary(result) for result in batch.analyze_files(paths, workers=1)]
+    pooled = [summary(result) for result in batch.analyze_files(paths, workers=2, chunksize=1)]
+    # The pool yields results as they finish, in any order
+    assert sorted(pooled) == serial
+
+
+def test_main_json(sources, capsys):
+    assert batch.main([str(sources), '-j', '1', '--no-cache', '--json', '-a', 'lexical']) == 1
+    results = {result['path']: result for result in map(json.loads, capsys.readouterr().out.splitlines())}
+    assert sorted(results) == batch.collect_files([str(sources)])
+    assert results[str(sources / 'a.c')]['errors'] == []
+    assert results[str(sources / 'a.c')]['tokens'][0] == ['KEYWORD', 'int']
+    assert 'syntax_tree' not in results[str(sources / 'a.c')]
+    assert results[str(sources / 'sub' / 'bad.c')]['errors']
+
+
+def test_main_text(sources, capsys):
+    assert batch.main([str(sources / 'a.c'), '-j', '1', '--no-cache']) == 0
+    out = capsys.readouterr().out
+    assert out.startswith(f"{sources / 'a.c'}: OK\n")
+    assert "tokens" in out
+
+
+def test_main_without_sources(tmp_path, capsys):
+    assert batch.main([str(tmp_path)]) == 2
+    assert "No C files found." in capsys.readouterr().err
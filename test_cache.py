@@ -0,0 +1,127 @@
+import sys
+
+from cache import AnalysisCache, content_key, estimate_size
+from engine import ANALYSES, AnalysisEngine
+
+SOURCE = "int main() {\n    return 0;\n}\n"
+
+
+class Counter:
+    """compute function recording the texts it was called on"""
+
+    def __init__(self, value='result'):
+        self.value = value
+        self.calls = []
+
+    def __call__(self, code):
+        self.calls.append(code)
+        return self.value
+
+
+class MemoryStore:
+    """Stand-in for a DiskCache"""
+
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key, artifact):
+        if (key, artifact) in self.entries:
+            return True, self.entries[key, artifact]
+        return False, None
+
+    def put(self, key, artifact, value):
+        self.entries[key, artifact] = value
+
+
+def test_content_key_identifies_the_text():
+    assert content_key(SOURCE) == content_key(''.join(list(SOURCE)))
+    assert content_key(SOURCE) != content_key(SOURCE + ' ')
+    # Lone surrogates from undecodable input still hash
+    assert content_key('\udcff')
+
+
+def test_hits_and_misses():
+    cache = AnalysisCache()
+    compute = Counter()
+    for _ in range(3):
+        assert cache.get_or_compute(SOURCE, 'tokens', compute) == 'result'
+    assert cache.get_or_compute(SOURCE, 'ast', compute) == 'result'
+    assert len(compute.calls) == 2
+    assert (cache.hits, cache.misses) == (2, 2)
+    # An equal text built separately is the same entry
+    assert cache.get_or_compute(''.join(list(SOURCE)), 'tokens', compute) == 'result'
+    assert cache.hits == 3
+
+
+def test_lru_eviction_within_budget():
+    value = 'x' * 1000
+    size = estimate_size(value)
+    cache = AnalysisCache(max_bytes=2 * size)
+    cache.get_or_compute('a', 'tokens', Counter(value))
+    cache.get_or_compute('b', 'tokens', Counter(value))
+    # Using 'a' again makes 'b' the least recently used text
+    cache.get_or_compute('a', 'tokens', Counter(value))
+    cache.get_or_compute('c', 'tokens', Counter(value))
+    assert len(cache) == 2
+    assert cache.current_bytes == 2 * size
+
+    compute = Counter(value)
+    cache.get_or_compute('a', 'tokens', compute)
+    cache.get_or_compute('c', 'tokens', compute)
+    assert compute.calls == []
+    cache.get_or_compute('b', 'tokens', compute)
+    assert compute.calls == ['b']
+
+
+def test_values_over_budget_are_not_kept():
+    cache = AnalysisCache(max_bytes=100)
+    compute = Counter('x' * 1000)
+    cache.get_or_compute('a', 'tokens', compute)
+    cache.get_or_compute('a', 'tokens', compute)
+    assert len(compute.calls) == 2
+    assert len(cache) == 0 and cache.current_bytes == 0
+
+
+def test_replacing_an_artifact_keeps_the_size_right():
+    cache = AnalysisCache()
+    key = cache.key(SOURCE)
+    cache.put(key, 'tokens', 'x' * 1000)
+    cache.put(key, 'tokens', 'y')
+    assert cache.current_bytes == estimate_size('y')
+    cache.clear()
+    assert len(cache) == 0 and cache.current_bytes == 0
+
+
+def test_store_is_consulted_on_misses():
+    store = MemoryStore()
+    AnalysisCache(store=store).get_or_compute(SOURCE, 'tokens', Counter('stored'))
+
+    cache = AnalysisCache(store=store)
+    compute = Counter()
+    assert cache.get_or_compute(SOURCE, 'tokens', compute) == 'stored'
+    assert cache.get_or_compute(SOURCE, 'tokens', compute) == 'stored'
+    assert compute.calls == []
+    assert (cache.store_hits, cache.hits) == (1, 1)
+
+
+def test_estimate_size_of_deep_and_shared_values():
+    deep = []
+    for _ in range(10000):
+        deep = [deep]
+    assert estimate_size(deep) >= 10000 * estimate_size([])
+    shared = 'x' * 1000
+    pair = [shared, shared]
+    assert estimate_size(pair) == sys.getsizeof(pair) + estimate_size(shared)
+
+
+def test_engine_validates_a_text_once_for_every_analysis(monkeypatch):
+    engine = AnalysisEngine(cache=AnalysisCache())
+    calls = []
+    validate = engine.validate_syntax
+    monkeypatch.setattr(engine, 'validate_syntax', lambda code: calls.append(code) or validate(code))
+    first = engine.analyze_source(SOURCE, ANALYSES)
+    second = engine.analyze_source(SOURCE, ANALYSES)
+    assert calls == [SOURCE]
+    assert second['tokens'] is first['tokens']
+    assert second['syntax_tree'] is first['syntax_tree']
+    assert second['grammar'] is first['grammar']
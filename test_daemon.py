@@ -0,0 +1,106 @@
+import asyncio
+import errno
+import socket
+
+import pytest
+
+import daemon
+
+SOURCE = "int main() {\n    return 0;\n}\n"
+
+
+def run_server(check, path=None, port=None):
+    """Start a one-worker server without a disk cache, run check(server) in a
+    thread while it serves, then close it"""
+    async def main():
+        server = daemon.AnalysisServer(workers=1, cache_dir=None)
+        await server.start(path, '127.0.0.1', port)
+        serving = asyncio.create_task(server.serve_forever())
+        try:
+            return await asyncio.to_thread(check, server)
+        finally:
+            serving.cancel()
+            await server.close()
+    return asyncio.run(main())
+
+
+def tcp_port(server):
+    return server._server.sockets[0].getsockname()[1]
+
+
+def test_code_request_and_stats(tmp_path):
+    path = str(tmp_path / 'd.sock')
+
+    def check(server):
+        return daemon.query([{'code': SOURCE, 'analyses': ['lexical']}, {'op': 'stats'}], path)
+
+    result, stats = run_server(check, path)
+    assert result['result']['tokens'][:2] == [['KEYWORD', 'int'], ['IDENTIFIER', 'main']]
+    assert stats['result']['requests'] == 2
+
+
+def test_path_request_over_unix_socket(tmp_path):
+    path = str(tmp_path / 'd.sock')
+    source = tmp_path / 'a.c'
+    source.write_text(SOURCE)
+    response = run_server(lambda server: daemon.query([{'path': str(source)}], path)[0], path)
+    assert response['result']['path'] == str(source)
+
+
+def test_path_request_rejected_over_tcp(tmp_path):
+    source = tmp_path / 'a.c'
+    source.write_text(SOURCE)
+
+    def check(server):
+        return daemon.query([{'path': str(source)}, {'code': SOURCE}], None, '127.0.0.1', tcp_port(server))
+
+    by_path, by_code = run_server(check, port=0)
+    assert 'Unix socket' in by_path['error']
+    assert 'result' in by_code
+
+
+def test_stale_socket_is_replaced(tmp_path):
+    path = str(tmp_path / 'd.sock')
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+    response = run_server(lambda server: daemon.query([{'op': 'stats'}], path)[0], path)
+    assert 'result' in response
+
+
+def test_live_socket_is_not_replaced(tmp_path):
+    path = str(tmp_path / 'd.sock')
+
+    def check(server):
+        with pytest.raises(OSError) as raised:
+            asyncio.run(daemon.AnalysisServer(workers=1, cache_dir=None).start(path))
+        assert raised.value.errno == errno.EADDRINUSE
+        return daemon.query([{'op': 'stats'}], path)[0]
+
+    assert 'result' in run_server(check, path)
+
+
+def test_path_that_is_not_a_socket_is_kept(tmp_path):
+    path = tmp_path / 'notes.txt'
+    path.write_text("keep me")
+    with pytest.raises(OSError) as raised:
+        asyncio.run(daemon.AnalysisServer(workers=1, cache_dir=None).start(str(path)))
+    assert raised.value.errno == errno.EEXIST
+    assert path.read_text() == "keep me"
+
+
+def test_close_removes_only_its_own_socket(tmp_path):
+    path = tmp_path / 'd.sock'
+    run_server(lambda server: None, str(path))
+    assert not path.exists()
+
+    def replace(server):
+        # A newer daemon took over the path
+        path.unlink()
+        newer = socket.socket(socket.AF_UNIX)
+        newer.bind(str(path))
+        return newer
+
+    newer = run_server(replace, str(path))
+    newer.close()
+    assert path.exists()
@@ -0,0 +1,121 @@
+import pickle
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import batch
+from disk_cache import DiskCache, default_cache_dir
+from token_buffer import lex
+
+SOURCE = "int main() {\n    return 0;\n}\n"
+
+
+def blob_size(value):
+    return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def fill(directory, worker):
+    """Store some results from a separate process"""
+    store = DiskCache(directory, '1')
+    for index in range(20):
+        store.put(f'{worker}-{index}', 'tokens', [worker, index])
+    store.close()
+
+
+def test_round_trip(tmp_path):
+    store = DiskCache(str(tmp_path), '1')
+    tokens = lex(SOURCE)
+    store.put('key', 'tokens', tokens)
+    found, value = store.get('key', 'tokens')
+    assert found
+    assert list(value) == list(tokens)
+    assert list(value.lines) == list(tokens.lines)
+    assert store.get('key', 'grammar') == (False, None)
+    assert store.get('other', 'tokens') == (False, None)
+
+
+def test_only_persisted_artifacts_are_stored(tmp_path):
+    store = DiskCache(str(tmp_path), '1')
+    store.put('key', 'ast', 'tree')
+    assert len(store) == 0
+    assert store.get('key', 'ast') == (False, None)
+
+
+def test_other_versions_are_dropped(tmp_path):
+    store = DiskCache(str(tmp_path), '1')
+    store.put('key', 'tokens', 'old')
+    store.close()
+
+    store = DiskCache(str(tmp_path), '2')
+    assert store.get('key', 'tokens') == (False, None)
+    assert len(store) == 0 and store.total_bytes == 0
+    store.put('key', 'tokens', 'new')
+    store.close()
+    assert DiskCache(str(tmp_path), '2').get('key', 'tokens') == (True, 'new')
+
+
+def test_unreadable_rows_are_misses(tmp_path):
+    store = DiskCache(str(tmp_path), '1')
+    store.put('key', 'tokens', 'value')
+    with sqlite3.connect(store.path) as db:
+        db.execute("UPDATE entries SET value = X'00'")
+    assert store.get('key', 'tokens') == (False, None)
+
+
+def test_least_recently_used_rows_are_evicted(tmp_path, monkeypatch):
+    clock = iter(range(1, 1000))
+    monkeypatch.setattr('disk_cache.time.time', lambda: next(clock))
+    value = 'x' * 1000
+    store = DiskCache(str(tmp_path), '1', max_bytes=3 * blob_size(value))
+    for key in 'abc':
+        store.put(key, 'tokens', value)
+    # Reading 'a' makes 'b' the least recently used row
+    assert store.get('a', 'tokens')[0]
+    store.put('d', 'tokens', value)
+    assert len(store) == 3
+    assert store.total_bytes == 3 * blob_size(value)
+    assert [store.get(key, 'tokens')[0] for key in 'abcd'] == [True, False, True, True]
+
+    # Replacing a row counts only its new size
+    store.put('a', 'tokens', 'y')
+    assert store.total_bytes == 2 * blob_size(value) + blob_size('y')
+
+
+def test_values_over_budget_are_not_stored(tmp_path):
+    store = DiskCache(str(tmp_path), '1', max_bytes=100)
+    store.put('key', 'tokens', 'x' * 1000)
+    assert len(store) == 0 and store.total_bytes == 0
+
+
+def test_clear(tmp_path):
+    store = DiskCache(str(tmp_path), '1')
+    store.put('key', 'tokens', 'value')
+    store.clear()
+    assert len(store) == 0 and store.total_bytes == 0
+
+
+def test_concurrent_writers(tmp_path):
+    with ProcessPoolExecutor(max_workers=3) as pool:
+        list(pool.map(fill, [str(tmp_path)] * 3, range(3)))
+    store = DiskCache(str(tmp_path), '1')
+    assert len(store) == 60
+    assert store.total_bytes == sum(blob_size([worker, index]) for worker in range(3) for index in range(20))
+    assert store.get('2-19', 'tokens') == (True, [2, 19])
+
+
+def test_warm_run_reads_the_store(tmp_path, monkeypatch):
+    source = tmp_path / 'a.c'
+    source.write_text(SOURCE)
+    cache_dir = str(tmp_path / 'cache')
+    cold = batch.analyze_file(str(source), engine=batch.make_engine(cache_dir))
+
+    engine = batch.make_engine(cache_dir)
+    monkeypatch.setattr(engine, 'validate_syntax', None)
+    monkeypatch.setattr(engine, 'tokenize_c_code', None)
+    warm = batch.analyze_file(str(source), ('lexical',), engine)
+    assert list(warm['tokens']) == list(cold['tokens'])
+    assert engine.cache.store_hits == 2
+
+
+def test_default_cache_dir(monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', '/tmp/xdg')
+    assert default_cache_dir() == '/tmp/xdg/c-analyzer'
@@ -0,0 +1,102 @@
+import json
+import sys
+
+import pytest
+
+import corpus
+import export
+from engine import AnalysisEngine
+from token_buffer import KIND_CODES, lex
+
+SOURCE = (
+    '#include <stdio.h>\n'
+    'int main(void) {\n'
+    '    char *s = "caf\u00e9 \\"quoted\\"\\n";\n'
+    '    return s[0] + \'\\t\';  // done\n'
+    '}\n'
+)
+
+
+def records(tokens):
+    return [(tokens.kind(index), tokens.value(index), tuple(tokens.position(index)))
+            for index in range(len(tokens))]
+
+
+def expected(code):
+    tokens = lex(code)
+    return [(kind, value, (line, column))
+            for (kind, value), line, column in zip(tokens, tokens.lines, tokens.columns)]
+
+
+def test_token_file_round_trip(tmp_path):
+    path = str(tmp_path / 'a.ctok')
+    assert export.write_token_file(path, lex(SOURCE)) == len(lex(SOURCE))
+    with export.TokenFile(path) as tokens:
+        assert records(tokens) == expected(SOURCE)
+        assert list(tokens) == list(lex(SOURCE))
+        assert tokens[-1] == ('OPERATOR', '}')
+        assert tokens[1:3] == [('KEYWORD', 'int'), ('IDENTIFIER', 'main')]
+        with pytest.raises(IndexError):
+            tokens[len(tokens)]
+
+
+def test_token_file_across_write_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, '_WRITE_BATCH', 7)
+    code = corpus.generate_profile('typical', 4096, seed=3) + '\nchar *u = "\udcff";\n'
+    path = str(tmp_path / 'a.ctok')
+    export.write_token_file(path, lex(code))
+    with export.TokenFile(path) as tokens:
+        assert records(tokens) == expected(code)
+
+
+def test_token_file_writer_mixes_add_and_extend(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, '_WRITE_BATCH', 2)
+    path = str(tmp_path / 'a.ctok')
+    keyword, identifier = KIND_CODES['KEYWORD'], KIND_CODES['IDENTIFIER']
+    with export.TokenFileWriter(path) as writer:
+        writer.add(keyword, 'int', 1, 0)
+        writer.extend([identifier, identifier], [1, 2], [4, 0], iter(['x', 'y']))
+        writer.add(identifier, 'x', 3, 0)
+    with export.TokenFile(path) as tokens:
+        assert [(tokens.value(index), tokens.position(index)) for index in range(len(tokens))] == [
+            ('int', (1, 0)), ('x', (1, 4)), ('y', (2, 0)), ('x', (3, 0))]
+
+
+def test_token_file_on_big_endian_hosts(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'byteorder', 'big')
+    path = str(tmp_path / 'a.ctok')
+    export.write_token_file(path, lex(SOURCE))
+    with export.TokenFile(path) as tokens:
+        assert records(tokens) == expected(SOURCE)
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / 'a.ctok'
+    path.write_bytes(bytes(64))
+    with pytest.raises(ValueError):
+        export.TokenFile(str(path))
+
+
+def test_jsonl_round_trip(tmp_path):
+    code = SOURCE + 'int broken(\n'
+    engine = AnalysisEngine()
+    path = tmp_path / 'a.jsonl'
+    count = export.write_jsonl(str(path), export.jsonl_lines(code, engine))
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert len(lines) == count
+
+    errors = engine.diagnostics(code)
+    assert [line['type'] for line in lines[:len(errors) + 1]] == ['diagnostic'] * len(errors) + ['grammar_facts']
+    assert lines[0]['line'] == errors[0].line
+    assert lines[len(errors)] == dict({'type': 'grammar_facts'}, **engine.grammar_facts(code).as_dict())
+    tokens = [(line['kind'], line['value'], (line['line'], line['column'])) for line in lines[len(errors) + 1:]]
+    assert tokens == expected(code)
+
+
+def test_export_report_picks_the_format_from_the_extension(tmp_path):
+    engine = AnalysisEngine()
+    report = engine.export_report(SOURCE, str(tmp_path / 'a.ctok'))
+    assert list(report)[-1] == f"Wrote {len(lex(SOURCE))} tokens to {tmp_path / 'a.ctok'}"
+    report = engine.export_report(SOURCE, str(tmp_path / 'a.jsonl'))
+    assert list(report)[-1].startswith("Wrote ")
+    assert (tmp_path / 'a.jsonl').read_text(encoding='utf-8').count('"type": "token"') == len(lex(SOURCE))
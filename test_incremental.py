@@ -0,0 +1,144 @@
+import random
+import threading
+
+import pytest
+
+import corpus
+import scanner
+import token_buffer
+from incremental import IncrementalLexer
+
+# Fragments inserted by the random edits; several open or close comments,
+# strings and directives, so an edit can change how far away text lexes
+FRAGMENTS = (
+    'x', 'int ', ';', '\n', '\n\n', '    ', '{', '}', '(', ')', '/*', '*/', '//',
+    '"', "'", '\\', '\\\n', '#', '#define M(a) \\\n', '#include <x.h>\n',
+    'foo(bar, 1.5e+3);\n', 'a->b', '...', '<<=', '"text"', "'c'", 'é',
+)
+
+
+def assert_same_as_full_lex(lexer):
+    text = lexer.text
+    tokens = lexer.token_buffer()
+    assert list(tokens) == scanner.tokenize(text)
+    expected = token_buffer.lex(text)
+    assert list(tokens.kinds) == list(expected.kinds)
+    assert list(tokens.starts) == list(expected.starts)
+    assert list(tokens.lengths) == list(expected.lengths)
+    assert list(tokens.lines) == list(expected.lines)
+    assert list(tokens.columns) == list(expected.columns)
+
+
+def random_edit(rng, text):
+    start = rng.randrange(len(text) + 1)
+    end = min(len(text), start + rng.choice((0, 0, 1, 2, 5, 20, 200)))
+    insert = "".join(rng.choice(FRAGMENTS) for _ in range(rng.choice((0, 1, 1, 2, 4))))
+    return text[:start] + insert + text[end:]
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_random_edits_match_full_tokenize(seed):
+    rng = random.Random(seed)
+    text = corpus.generate_profile(sorted(corpus.PROFILES)[seed % len(corpus.PROFILES)], 4096, seed)
+    lexer = IncrementalLexer(text)
+    for _ in range(150):
+        text = random_edit(rng, text)
+        lexer.update(text)
+        assert_same_as_full_lex(lexer)
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_edits_between_reads(seed):
+    # Several edits with no read in between pile up the deferred shift
+    rng = random.Random(seed)
+    text = corpus.generate_profile('typical', 4096, seed)
+    lexer = IncrementalLexer(text)
+    for _ in range(40):
+        for _ in range(rng.randrange(1, 6)):
+            text = random_edit(rng, text)
+            lexer.update(text)
+        assert_same_as_full_lex(lexer)
+
+
+def test_shared_buffer_survives_later_edits():
+    text = "int a;\n/* c */\nint b = 1;\n"
+    lexer = IncrementalLexer(text)
+    before = lexer.token_buffer()
+    expected = list(before)
+    lexer.update("/* open\n" + text)
+    assert list(before) == expected
+    assert_same_as_full_lex(lexer)
+
+
+@pytest.mark.parametrize('edit', [
+    ('int a;\nint b;\n', 'int a;\n/*int b;\n'),
+    ('int a; /* x */ int b;\n', 'int a; /* x  int b;\n'),
+    ('#define A 1\nint b;\n', '#define A 1 \\\nint b;\n'),
+    ('char *s = "a";\nint b;\n', 'char *s = "a;\nint b;\n'),
+    ('int a;\n#define X\n', 'int a;#define X\n'),
+    ('', 'int main() {}\n'),
+    ('int main() {}\n', ''),
+])
+def test_edits_that_change_later_tokens(edit):
+    old, new = edit
+    lexer = IncrementalLexer(old)
+    lexer.update(new)
+    assert_same_as_full_lex(lexer)
+    lexer.update(old)
+    assert_same_as_full_lex(lexer)
+
+
+@pytest.mark.parametrize('inserted', ['\n' * 100, '\n', 'int a;\n' * 50, ''])
+@pytest.mark.parametrize('edited', [0, 2, 18])
+def test_edit_above_a_pending_shift(inserted, edited):
+    # The first edit leaves the tail's shift pending; the second edits
+    # above it, so the tokens in between are shifted by the second edit
+    # while the pending shift grows
+    lines = [f"int v{i} = {i};" for i in range(30)]
+    lexer = IncrementalLexer("\n".join(lines) + "\n")
+    lines[19] += inserted
+    lexer.update("\n".join(lines) + "\n")
+    lines[edited] = "long changed = 3;\n\n"
+    lexer.update("\n".join(lines) + "\n")
+    assert_same_as_full_lex(lexer)
+    del lines[edited]
+    lexer.update("\n".join(lines) + "\n")
+    assert_same_as_full_lex(lexer)
+
+
+def test_tokens_for_only_shares_the_lexed_text():
+    lexer = IncrementalLexer("int a;\n")
+    assert lexer.tokens_for("int b;") is None
+    tokens = lexer.tokens_for("int a;")
+    lexer.update("long a;\n")
+    assert list(tokens) == scanner.tokenize("int a;")
+
+
+def test_tokens_for_while_another_thread_edits():
+    # An analysis thread takes the tokens while the editor thread types;
+    # whatever it gets must be the tokens of the text it asked about
+    rng = random.Random(0)
+    texts = [corpus.generate_profile('typical', 4096, 0)]
+    for _ in range(200):
+        texts.append(random_edit(rng, texts[-1]))
+    lexer = IncrementalLexer(texts[0])
+    done = threading.Event()
+    mismatches = []
+
+    def analyze():
+        while not done.is_set():
+            for code in (texts[0], texts[len(texts) // 2], texts[-1]):
+                tokens = lexer.tokens_for(code)
+                if tokens is not None and list(tokens.starts) != list(token_buffer.lex(code).starts):
+                    mismatches.append(code)
+
+    thread = threading.Thread(target=analyze)
+    thread.start()
+    try:
+        for text in texts[1:]:
+            lexer.update(text)
+    finally:
+        done.set()
+        thread.join()
+    assert not mismatches
+    assert_same_as_full_lex(lexer)
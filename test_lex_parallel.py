@@ -0,0 +1,85 @@
+import pytest
+
+import corpus
+import token_buffer
+
+# Lines that comments, strings and continued directives run across, so
+# that many line starts lie inside a token
+SPANNING_SOURCE = (
+    '#define SWAP(a, b) \\\n'
+    '    do { int t = a; a = b; b = t; } while (0)\n'
+    'int x; /* a comment\n'
+    'int not_code;\n'
+    '   still the comment */ int y;\n'
+    '// line comment \\\n'
+    'continued on this line\n'
+    'char *s = "string \\\n'
+    'int inside_string; \\\n'
+    'end";\n'
+    "char c = '\\\n"
+    "';\n"
+    '  #  include "x.h" \\\n'
+    '  more\n'
+    'a = b # c;\n'
+)
+
+
+def columns(tokens):
+    return (tokens.source, list(tokens.kinds), list(tokens.starts), list(tokens.lengths),
+            list(tokens.lines), list(tokens.columns))
+
+
+def spanned_line_starts(code):
+    """Line starts that lie inside a comment, string or directive of lex(code)"""
+    tokens = token_buffer.lex(code)
+    inside = set()
+    for index in range(len(tokens)):
+        start, end = tokens.span(index)
+        line_start = code.find('\n', start, end) + 1
+        while line_start and line_start < end:
+            inside.add(line_start)
+            line_start = code.find('\n', line_start, end) + 1
+    return inside
+
+
+@pytest.fixture
+def no_threshold(monkeypatch):
+    monkeypatch.setattr(token_buffer, 'PARALLEL_THRESHOLD', 0)
+
+
+@pytest.mark.parametrize('parts', range(2, 40))
+def test_split_points_avoid_spanning_tokens(parts):
+    code = SPANNING_SOURCE * 8
+    inside = spanned_line_starts(code)
+    assert inside
+    splits = token_buffer.find_split_points(code, parts)
+    assert splits == sorted(set(splits))
+    assert not inside.intersection(splits)
+    assert all(code[split - 1] == '\n' for split in splits)
+
+
+@pytest.mark.parametrize('workers', [2, 3, 7])
+def test_lex_parallel_matches_lex_on_spanning_tokens(no_threshold, workers):
+    code = SPANNING_SOURCE * 20
+    assert columns(token_buffer.lex_parallel(code, workers)) == columns(token_buffer.lex(code))
+
+
+@pytest.mark.parametrize('profile', sorted(corpus.PROFILES))
+def test_lex_parallel_matches_lex_on_corpus(no_threshold, profile):
+    code = corpus.generate_profile(profile, 50 * 1024, seed=1)
+    assert columns(token_buffer.lex_parallel(code, 4)) == columns(token_buffer.lex(code))
+
+
+def test_lex_parallel_without_split_points(no_threshold):
+    # One comment covers every line start, so nothing can be cut
+    code = "/*" + "\nint x;" * 100 + "\n*/ int y;\n"
+    assert token_buffer.find_split_points(code, 4) == []
+    assert columns(token_buffer.lex_parallel(code, 4)) == columns(token_buffer.lex(code))
+
+
+@pytest.mark.parametrize('code', [SPANNING_SOURCE, '\n\nint x;\n', 'x', ''])
+def test_lex_derives_lines_and_columns_from_starts(code):
+    tokens = token_buffer.lex(code)
+    starts = list(tokens.starts)
+    assert list(tokens.lines) == [code.count('\n', 0, start) + 1 for start in starts]
+    assert list(tokens.columns) == [start - code.rfind('\n', 0, start) - 1 for start in starts]
@@ -0,0 +1,97 @@
+import os
+
+import pytest
+
+from preprocessor import Preprocessor
+
+
+def expand(code, **options):
+    """The preprocessed text of code, one space between tokens"""
+    return ' '.join(value for _, value in Preprocessor(**options).run(code).tokens)
+
+
+@pytest.mark.parametrize('code, expected', [
+    # A macro is not expanded again inside its own expansion
+    ('#define foo foo + 1\nfoo\n', 'foo + 1'),
+    ('#define a b\n#define b a\na b\n', 'a b'),
+    ('#define f(x) x + f(x)\nf(1)\n', '1 + f ( 1 )'),
+    # The hide set of an argument is kept when it is substituted
+    ('#define g(x) x\n#define h h g(h)\nh\n', 'h h'),
+    # The hide set of a call is that of its name and closing ')': f came
+    # out of g, but the ')' after it did not, so f expands again
+    ('#define f(a) a*g\n#define g(a) f(a)\nf(2)(9)\n', '2 * 9 * g'),
+    # An object-like macro naming a function-like one takes the arguments after it
+    ('#define h g\n#define g(x) x+1\nh(2)\n', '2 + 1'),
+    # A function-like macro name without arguments is left alone
+    ('#define g(x) x\ng + 1\n', 'g + 1'),
+])
+def test_hide_sets(code, expected):
+    assert expand(code) == expected
+
+
+def test_arguments_are_expanded_except_for_hash_and_paste():
+    code = ('#define str(s) # s\n#define xstr(s) str(s)\n#define foo 4\n'
+            '#define cat(a, b) a ## b\n'
+            'str(foo) xstr(foo) cat(x, foo) cat(1, 2) cat(, y)\n')
+    assert expand(code) == '"foo" "4" xfoo 12 y'
+
+
+def test_variadic_macros():
+    code = '#define log(fmt, ...) printf(fmt, __VA_ARGS__)\nlog("%d %d", 1, 2);\n'
+    assert expand(code) == 'printf ( "%d %d" , 1 , 2 ) ;'
+
+
+def test_conditionals_and_predefined_macros():
+    code = ('#if defined(DEBUG) && LEVEL > 1\nverbose\n#elif LEVEL\nquiet\n#else\nsilent\n#endif\n'
+            '#ifndef DEBUG\nrelease\n#endif\n')
+    assert expand(code, defines=['DEBUG', 'LEVEL=2']) == 'verbose'
+    assert expand(code, defines=['LEVEL=1']) == 'quiet release'
+    assert expand(code) == 'silent release'
+
+
+def test_errors():
+    result = Preprocessor().run('#define f(a, b) a\nf(1)\n#if 1\n#bogus\n', 'unit.c')
+    assert result.errors == ['unit.c:2: macro f expects 2 argument(s), got 1',
+                             'unit.c:4: unknown directive #bogus',
+                             'unit.c:4: unterminated conditional directive']
+
+
+@pytest.fixture
+def headers(tmp_path):
+    (tmp_path / 'include').mkdir()
+    (tmp_path / 'include' / 'guarded.h').write_text(
+        '#ifndef GUARDED_H\n#define GUARDED_H\nint guarded;\n#endif\n')
+    (tmp_path / 'include' / 'once.h').write_text('#pragma once\nint once;\n')
+    (tmp_path / 'include' / 'config.h').write_text('#ifdef WIDE\nlong\n#else\nint\n#endif\n value;\n')
+    (tmp_path / 'local.h').write_text('#define LOCAL 1\n')
+    return tmp_path
+
+
+def test_includes_are_resolved_and_guarded(headers):
+    preprocessor = Preprocessor([str(headers / 'include')])
+    code = ('#include "local.h"\n#include <guarded.h>\n#include <guarded.h>\n'
+            '#include <once.h>\n#include <once.h>\n#include <missing.h>\nLOCAL\n')
+    result = preprocessor.run(code, str(headers / 'unit.c'))
+    assert ' '.join(value for _, value in result.tokens) == 'int guarded ; int once ; 1'
+    assert result.includes == [str(headers / 'local.h'), str(headers / 'include' / 'guarded.h'),
+                               str(headers / 'include' / 'once.h')]
+    assert result.missing == [('<missing.h>', str(headers / 'unit.c'), 6)]
+    assert 'LOCAL' in result.macros and 'GUARDED_H' in result.macros
+    assert preprocessor.stats['skipped'] == 2
+
+
+def test_headers_are_lexed_once_and_replayed_per_context(headers):
+    preprocessor = Preprocessor([str(headers / 'include')])
+    for _ in range(3):
+        assert [value for _, value in preprocessor.run('#include <config.h>\n').tokens] == ['int', 'value', ';']
+    assert [value for _, value in preprocessor.run('#define WIDE\n#include <config.h>\n').tokens] == [
+        'long', 'value', ';']
+    assert preprocessor.stats['lexed'] == 1
+    assert preprocessor.stats['replayed'] == 2
+
+    # A changed header is lexed and expanded again
+    path = headers / 'include' / 'config.h'
+    path.write_text('short value;\n')
+    os.utime(path, ns=(1, 1))
+    assert [value for _, value in preprocessor.run('#include <config.h>\n').tokens] == ['short', 'value', ';']
+    assert preprocessor.stats['lexed'] == 2
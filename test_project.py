@@ -0,0 +1,129 @@
+import itertools
+import os
+
+import pytest
+
+from project import ProjectIndex
+
+_clock = itertools.count(1)
+
+
+def write(path, text):
+    """Write path with a new mtime, however fast the edits follow each other"""
+    path.write_text(text)
+    stamp = next(_clock) * 10 ** 9
+    os.utime(path, ns=(stamp, stamp))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / 'lib').mkdir()
+    write(tmp_path / 'lib' / 'util.h', 'int helper(int x);\n')
+    write(tmp_path / 'lib' / 'util.c', '#include "util.h"\nint helper(int x) { return x; }\n')
+    write(tmp_path / 'main.c', '#include "lib/util.h"\n#include "extra.h"\n#include <stdio.h>\n'
+                               'int main(void) { return helper(1); }\n')
+    return tmp_path
+
+
+def index_of(tree):
+    index = ProjectIndex(str(tree), workers=1)
+    index.update()
+    return index
+
+
+def test_initial_index(tree):
+    index = ProjectIndex(str(tree), workers=1)
+    update = index.update()
+    util_h, util_c, main = str(tree / 'lib' / 'util.h'), str(tree / 'lib' / 'util.c'), str(tree / 'main.c')
+    assert update['added'] == sorted([util_h, util_c, main])
+    assert update['files'] == 3
+    assert index.function('helper') == {
+        'name': 'helper',
+        'definitions': [{'path': util_c, 'line': 2, 'static': False}],
+        'declarations': [{'path': util_h, 'line': 1}],
+        'calls': [{'path': main, 'line': 4, 'column': 24}],
+    }
+    assert index.definition_of('helper', main) == (util_c, 2)
+    assert index.includes[main] == {util_h}
+    assert index.external[main] == ['extra.h', 'stdio.h']
+    assert index.dependents(util_h) == {util_c, main}
+    assert index.include_cycles() == []
+
+
+def test_unchanged_files_are_not_summarized_again(tree):
+    index = index_of(tree)
+    assert index.update()['changed'] == []
+    # Touched without changes
+    write(tree / 'main.c', (tree / 'main.c').read_text())
+    update = index.update()
+    assert update['changed'] == [] and update['affected'] == []
+
+
+def test_changed_header_affects_its_includers(tree):
+    index = index_of(tree)
+    write(tree / 'lib' / 'util.h', 'int helper(int x);\nint other(void);\n')
+    update = index.update([str(tree / 'lib' / 'util.h')])
+    assert update['changed'] == [str(tree / 'lib' / 'util.h')]
+    assert update['affected'] == sorted([str(tree / 'lib' / 'util.c'), str(tree / 'lib' / 'util.h'),
+                                         str(tree / 'main.c')])
+    assert index.function('other')['declarations'] == [{'path': str(tree / 'lib' / 'util.h'), 'line': 2}]
+
+
+def test_added_header_resolves_existing_includes(tree):
+    index = index_of(tree)
+    main = str(tree / 'main.c')
+    write(tree / 'extra.h', 'void extra(void);\n')
+    update = index.update()
+    assert update['added'] == [str(tree / 'extra.h')]
+    assert index.includes[main] == {str(tree / 'lib' / 'util.h'), str(tree / 'extra.h')}
+    assert index.external[main] == ['stdio.h']
+    assert index.dependents(str(tree / 'extra.h')) == {main}
+
+
+def test_removed_header(tree):
+    index = index_of(tree)
+    util_h = str(tree / 'lib' / 'util.h')
+    os.remove(util_h)
+    update = index.update([util_h])
+    assert update['removed'] == [util_h]
+    assert update['affected'] == sorted([str(tree / 'lib' / 'util.c'), str(tree / 'main.c')])
+    assert util_h not in index.files and util_h not in index.includers
+    assert index.includes[str(tree / 'main.c')] == set()
+    assert index.external[str(tree / 'main.c')] == ['lib/util.h', 'extra.h', 'stdio.h']
+    assert index.function('helper')['declarations'] == []
+    assert index.problems()['undefined'] == []
+
+
+def test_removed_directory(tree):
+    index = index_of(tree)
+    for name in ('util.h', 'util.c'):
+        os.remove(tree / 'lib' / name)
+    os.rmdir(tree / 'lib')
+    update = index.update([str(tree / 'lib')])
+    assert update['removed'] == sorted([str(tree / 'lib' / 'util.c'), str(tree / 'lib' / 'util.h')])
+    assert update['affected'] == [str(tree / 'main.c')]
+    assert sorted(index.files) == [str(tree / 'main.c')]
+    assert 'helper' in index.mentions and not index.function('helper')['definitions']
+
+
+def test_include_cycles(tmp_path):
+    write(tmp_path / 'a.h', '#include "b.h"\n')
+    write(tmp_path / 'b.h', '#include "c.h"\n')
+    write(tmp_path / 'c.h', '#include "a.h"\n')
+    write(tmp_path / 'self.h', '#include "self.h"\n')
+    # A diamond is not a cycle
+    write(tmp_path / 'top.h', '#include "left.h"\n#include "right.h"\n')
+    write(tmp_path / 'left.h', '#include "bottom.h"\n')
+    write(tmp_path / 'right.h', '#include "bottom.h"\n')
+    write(tmp_path / 'bottom.h', 'int bottom;\n')
+    index = index_of(tmp_path)
+    assert index.include_cycles() == [
+        [str(tmp_path / name) for name in ('a.h', 'b.h', 'c.h')],
+        [str(tmp_path / 'self.h')],
+    ]
+    assert index.dependents(str(tmp_path / 'a.h')) == {str(tmp_path / name) for name in ('a.h', 'b.h', 'c.h')}
+
+    write(tmp_path / 'c.h', 'int c;\n')
+    index.update()
+    assert index.include_cycles() == [[str(tmp_path / 'self.h')]]
+    assert index.as_dict()['problems']['include_cycles'] == [[str(tmp_path / 'self.h')]]
@@ -0,0 +1,58 @@
+import io
+
+import pytest
+
+import corpus
+import scanner
+
+# Tokens of every kind, including ones that span lines, so that small
+# chunks split comments, strings, directives and multi-character operators
+SOURCE = (
+    '#include <stdio.h>\n'
+    '  # define LONG(a, b) \\\n'
+    '      ((a) <<= (b))\n'
+    'int main(int argc, char **argv) {\n'
+    '    /* a block\n'
+    '       comment */ int x = 0x1Fu + 1.5e-3 + .25f;\n'
+    '    char *s = "esc \\" \\\n'
+    'continued", c = \'\\n\';\n'
+    '    x >>= 2; x -> y; f(a, ...);  // trailing \\\n'
+    '    still comment\n'
+    '    wchar_t *w = L"wide"; char *u = u8"é";\n'
+    '    a = b # c;\n'
+    '    return x;\n'
+    '}\n'
+    '/* unterminated'
+)
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 8))
+def test_stream_matches_tokenize(chunk_size):
+    assert list(scanner.stream_tokens(io.StringIO(SOURCE), chunk_size)) == scanner.tokenize(SOURCE)
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 8))
+def test_stream_matches_tokenize_on_corpus(chunk_size):
+    code = corpus.generate_profile('typical', 2048, seed=chunk_size)
+    assert list(scanner.stream_tokens(io.StringIO(code), chunk_size)) == scanner.tokenize(code)
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 8))
+def test_stream_from_file_matches_tokenize(tmp_path, chunk_size):
+    # Chunks are cut in bytes, so they can also split the UTF-8 of 'é'
+    path = tmp_path / 'source.c'
+    path.write_text(SOURCE, encoding='utf-8')
+    assert list(scanner.stream_tokens(path, chunk_size)) == scanner.tokenize(SOURCE)
+
+
+@pytest.mark.parametrize('chunk_size', range(1, 8))
+def test_scan_chunks_offsets_match_scan(chunk_size):
+    chunks = (SOURCE[i:i + chunk_size] for i in range(0, len(SOURCE), chunk_size))
+    offsets = [(kind, start) for kind, _, start in scanner.scan_chunks(chunks)]
+    assert offsets == [(kind, start) for kind, start, _ in scanner.scan(SOURCE)]
+
+
+@pytest.mark.parametrize('text', ['', '\n\n', '   ', '#', 'x', '/*', '"'])
+def test_stream_edge_cases(text):
+    for chunk_size in range(1, 4):
+        assert list(scanner.stream_tokens(io.StringIO(text), chunk_size)) == scanner.tokenize(text)
@@ -0,0 +1,99 @@
+import symbols
+
+SOURCE = (
+    '#include <stdio.h>\n'
+    '#include "util.h"\n'
+    '#define LIMIT 10\n'
+    'typedef struct node { int value; struct node *next; } node_t;\n'
+    'enum color { RED, GREEN = 2 };\n'
+    'int count;\n'
+    'int count;\n'
+    'static int helper(int x);\n'
+    'static int helper(int x) {\n'
+    '    int unused;\n'
+    '    return x + LIMIT;\n'
+    '}\n'
+    'int main(int argc, char **argv) {\n'
+    '    node_t *head = 0;\n'
+    '    int total = count;\n'
+    '    for (int i = 0; i < argc; i++) {\n'
+    '        int total = i;\n'
+    '        total += helper(i);\n'
+    '    }\n'
+    '    return total + RED + head->value;\n'
+    '}\n'
+)
+
+
+def kinds(index, name):
+    return [symbol.kind for symbol in index.lookup(name)]
+
+
+def test_declarations_by_kind():
+    index = symbols.index_symbols(SOURCE)
+    assert kinds(index, 'LIMIT') == [symbols.MACRO]
+    assert kinds(index, 'node') == [symbols.TAG]
+    assert kinds(index, 'value') == [symbols.FIELD]
+    assert kinds(index, 'node_t') == [symbols.TYPEDEF]
+    assert kinds(index, 'RED') == [symbols.ENUMERATOR]
+    assert kinds(index, 'GREEN') == [symbols.ENUMERATOR]
+    assert kinds(index, 'count') == [symbols.VARIABLE, symbols.VARIABLE]
+    assert kinds(index, 'helper') == [symbols.FUNCTION, symbols.FUNCTION]
+    assert [symbol.is_definition for symbol in index.lookup('helper')] == [False, True]
+    assert kinds(index, 'argv') == [symbols.PARAMETER]
+    assert kinds(index, 'total') == [symbols.VARIABLE, symbols.VARIABLE]
+    assert [(symbol.depth, symbol.line) for symbol in index.lookup('total')] == [(1, 15), (2, 17)]
+    assert index.lookup('printf') == []
+
+
+def test_uses_resolve_to_the_innermost_declaration():
+    index = symbols.index_symbols(SOURCE)
+    outer, inner = index.lookup('total')
+    assert (outer.uses, inner.uses) == (1, 1)
+    assert index.uses('count') == [(15, 16)]
+    assert index.uses('i')[:2] == [(16, 20), (16, 30)]
+    assert index.lookup('LIMIT')[0].uses == 1
+    assert index.lookup('LIMIT')[0].column == 8
+    # Member names after '.' and '->' are not uses of anything
+    assert index.uses('value') == []
+    assert 'value' in index and 'printf' not in index
+
+
+def test_unused_and_duplicates():
+    index = symbols.index_symbols(SOURCE)
+    assert [symbol.name for symbol in index.unused()] == ['unused']
+    # Neither the prototype of helper nor the second file-scope count
+    # is a redefinition
+    assert index.duplicates() == []
+
+    index = symbols.index_symbols('int f(void) {\n    int a;\n    int a;\n    return a;\n}\n'
+                                  'int f(void) { return 0; }\n')
+    assert [(first.line, duplicate.line, duplicate.name) for first, duplicate in index.duplicates()] == [
+        (2, 3, 'a'), (1, 6, 'f')]
+    assert index.as_dict()['duplicates'][0] == {
+        'name': 'a', 'kind': symbols.VARIABLE, 'line': 3, 'column': 8, 'first_line': 2}
+    # The uses of a resolve to the second declaration
+    assert [symbol.line for symbol in index.unused()] == [2]
+    assert index.rules()[2] == "✗ Found 2 duplicate definition(s):"
+
+
+def test_shadowing_in_an_inner_scope_is_not_a_duplicate():
+    index = symbols.index_symbols('int a;\nvoid f(int a) {\n    { int a = 1; a++; }\n}\n')
+    assert index.duplicates() == []
+    assert [symbol.uses for symbol in index.lookup('a')] == [0, 0, 1]
+
+
+def test_summarize():
+    summary = symbols.summarize(symbols.index_symbols(SOURCE))
+    assert summary.definitions == {'helper': [(9, True)], 'main': [(13, False)]}
+    assert summary.declarations == {'helper': [8]}
+    assert summary.calls == {'helper': [(18, 17)]}
+    assert summary.includes == [('stdio.h', False, 1), ('util.h', True, 2)]
+    assert summary.names() == {'helper', 'main'}
+    assert summary == symbols.summarize(symbols.index_symbols(SOURCE))
+
+
+def test_calls_through_variables_are_not_function_calls():
+    summary = symbols.summarize(symbols.index_symbols(
+        'int (*handler)(int);\n#define CALL(x) x\nint g(void) { return handler(1) + CALL(2); }\n'))
+    assert summary.calls == {}
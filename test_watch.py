@@ -0,0 +1,128 @@
+import os
+import sys
+
+import pytest
+
+import watch
+from cache import AnalysisCache
+from engine import AnalysisEngine
+
+SOURCE = "int main() {\n    return 0;\n}\n"
+
+inotify_only = pytest.mark.skipif(not sys.platform.startswith('linux'), reason="inotify is Linux-only")
+
+
+def settle(watcher):
+    """Return every path the watcher reports until it has been quiet briefly"""
+    changed = watcher.wait(2)
+    while True:
+        more = watcher.wait(0.1)
+        if not more:
+            return changed
+        changed |= more
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / 'root'
+    (root / 'sub' / 'deep').mkdir(parents=True)
+    (root / 'sub' / 'a.c').write_text(SOURCE)
+    (root / 'sub' / 'deep' / 'b.h').write_text("int b;\n")
+    return root
+
+
+@pytest.fixture
+def inotify(tree):
+    watcher = watch.InotifyWatcher(str(tree))
+    yield watcher
+    watcher.close()
+
+
+@inotify_only
+def test_inotify_reports_edited_sources(tree, inotify):
+    (tree / 'sub' / 'deep' / 'b.h').write_text("int c;\n")
+    (tree / 'notes.txt').write_text("not a source")
+    assert settle(inotify) == {str(tree / 'sub' / 'deep' / 'b.h')}
+
+
+@inotify_only
+def test_inotify_follows_a_directory_renamed_within_the_tree(tree, inotify):
+    os.rename(tree / 'sub', tree / 'moved')
+    changed = settle(inotify)
+    assert str(tree / 'sub') in changed
+    assert str(tree / 'moved' / 'deep' / 'b.h') in changed
+
+    (tree / 'moved' / 'deep' / 'b.h').write_text("int c;\n")
+    assert settle(inotify) == {str(tree / 'moved' / 'deep' / 'b.h')}
+
+
+@inotify_only
+def test_inotify_drops_a_directory_moved_out_of_the_tree(tree, tmp_path, inotify):
+    os.rename(tree / 'sub', tmp_path / 'outside')
+    assert settle(inotify) == {str(tree / 'sub')}
+    assert all(not path.startswith(str(tree / 'sub')) for path in inotify._directories.values())
+
+    (tmp_path / 'outside' / 'a.c').write_text("int x;\n")
+    assert inotify.wait(0.2) == set()
+
+
+@inotify_only
+def test_inotify_reports_the_root_moved_away(tree, tmp_path, inotify):
+    os.rename(tree, tmp_path / 'elsewhere')
+    assert str(tree) in settle(inotify)
+    assert not inotify._directories
+
+
+def test_source_tree_events(tree):
+    sources = watch.SourceTree(AnalysisEngine(cache=AnalysisCache()))
+    path = str(tree / 'sub' / 'a.c')
+    assert sources.refresh(path)['event'] == 'added'
+    assert sources.refresh(path) is None
+
+    # Saved again without changes
+    os.utime(path, ns=(1, 1))
+    assert sources.refresh(path) is None
+
+    (tree / 'sub' / 'a.c').write_text("int main() {\n    return 0\n}\n")
+    event = sources.refresh(path)
+    assert event['event'] == 'changed'
+    assert event['errors']
+
+    assert sources.expand({str(tree / 'sub')}) == {path}
+    os.remove(path)
+    assert sources.refresh(path) == {'path': path, 'event': 'removed'}
+
+
+class ScriptedWatcher:
+    """Watcher returning scripted change sets, then interrupting the loop"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.timeouts = []
+
+    def wait(self, timeout=None):
+        self.timeouts.append(timeout)
+        if not self.script:
+            raise KeyboardInterrupt
+        return self.script.pop(0)
+
+    def close(self):
+        pass
+
+
+def test_watch_analyzes_a_burst_of_saves_once(tree, monkeypatch):
+    a = str(tree / 'sub' / 'a.c')
+    b = str(tree / 'sub' / 'deep' / 'b.h')
+    watcher = ScriptedWatcher([{a}, {b}, {a}, set()])
+    monkeypatch.setattr(watch, 'make_watcher', lambda *args: watcher)
+    refreshed = []
+    monkeypatch.setattr(watch.SourceTree, 'refresh', lambda self, path: refreshed.append(path))
+
+    with pytest.raises(KeyboardInterrupt):
+        watch.watch(str(tree), lambda event: None, debounce=0.01)
+
+    initial = sorted(refreshed[:2])
+    assert initial == sorted([a, b])
+    # The three saves settle into one pass over the two files
+    assert refreshed[2:] == sorted([a, b])
+    assert watcher.timeouts == [None, 0.01, 0.01, 0.01, None]
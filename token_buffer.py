@@ -0,0 +1,286 @@
+import os
+import re
+import string
+import sys
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, chain, count, repeat
+from multiprocessing import shared_memory
+from operator import sub
+
+import scanner
+from scanner import (COMMENT_GROUP, IDENTIFIER_GROUP, NUMBER_GROUP, OPERATOR_GROUP,
+                     PREPROCESSOR_GROUP, STRING_GROUP, UNKNOWN_GROUP)
+
+# Kind codes stored in the kinds column; codes 1-7 are the scanner's group
+# numbers, and keywords (identifiers in C_KEYWORDS) get code 0
+KEYWORD_KIND = 0
+KIND_NAMES = ('KEYWORD',) + scanner.GROUP_KINDS[1:]
+KIND_CODES = {name: code for code, name in enumerate(KIND_NAMES)}
+
+# Kinds whose values are interned so repeated names share one string
+_INTERNED_KINDS = frozenset({KEYWORD_KIND, IDENTIFIER_GROUP})
+
+# Kind of a token whose first character alone decides it; identifiers
+# still need the keyword and string prefix checks
+_FIRST_KINDS = dict.fromkeys(string.digits, NUMBER_GROUP)
+_FIRST_KINDS.update(dict.fromkeys('-+*%=<>!&|^~?:;,()[]{}', OPERATOR_GROUP))
+_FIRST_KINDS.update(dict.fromkeys('"\'', STRING_GROUP))
+_FIRST_KINDS.update(dict.fromkeys(string.ascii_letters + '_', IDENTIFIER_GROUP))
+
+# Sources smaller than this are not worth splitting across processes
+PARALLEL_THRESHOLD = 4 * 1024 * 1024
+
+# The only tokens that can span a newline, in the scanner's order of
+# precedence. Every '"', "'", '/*', '//' and line-opening '#' the scanner
+# sees starts one of these, so skipping from match to match tracks exactly
+# which line starts lie inside a token. String prefixes are left out; they
+# do not change where a string ends.
+_SPANNING_PATTERN = re.compile(r'''
+    ^[ \t\r\f\v]*\#(?:\\\r?\n|[^\n])*
+  | //(?:\\\r?\n|[^\n])*
+  | /\*(?s:.*?)(?:\*/|\Z)
+  | "(?:[^"\\\n]|\\(?s:.))*"?
+  | '(?:[^'\\\n]|\\(?s:.))*'?
+''', re.MULTILINE | re.VERBOSE)
+
+
+class TokenBuffer:
+    """Token stream stored as parallel array columns over the source text
+
+    Reads like a sequence of (type, value) tuples, the shape tokenize()
+    returns, but keeps only about 21 bytes per token; values are sliced
+    from the source on access. The lines and columns may be left as None,
+    to be derived from the starts when first read.
+    """
+    __slots__ = ('source', 'kinds', 'starts', 'lengths', '_lines', '_columns')
+
+    def __init__(self, source):
+        self.source = source
+        self.kinds = array('B')
+        self.starts = array('q')
+        self.lengths = array('I')
+        # 1-based line and 0-based column of each token's first character
+        self._lines = array('I')
+        self._columns = array('I')
+
+    @property
+    def lines(self):
+        """Line of each token, derived from the starts if not set"""
+        if self._lines is None:
+            self._locate()
+        return self._lines
+
+    @lines.setter
+    def lines(self, lines):
+        self._lines = lines
+
+    @property
+    def columns(self):
+        """Column of each token, derived from the starts if not set"""
+        if self._columns is None:
+            self._locate()
+        return self._columns
+
+    @columns.setter
+    def columns(self, columns):
+        self._columns = columns
+
+    def _locate(self):
+        """Derive the lines and columns from the starts"""
+        starts = self.starts.tolist()
+        # Tokens per line, from the first token at or after each line start
+        line_starts = list(accumulate(map((1).__add__, map(len, self.source.split('\n'))), initial=0))
+        line_starts.pop()
+        firsts = list(map(bisect_left, repeat(starts), line_starts))
+        firsts.append(len(starts))
+        counts = list(map(sub, firsts[1:], firsts))
+        del firsts
+        self._lines = array('I', list(chain.from_iterable(map(repeat, count(1), counts))))
+        self._columns = array('I', list(map(sub, starts, chain.from_iterable(map(repeat, line_starts, counts)))))
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return KIND_NAMES[self.kinds[index]], self.value(index)
+
+    def __iter__(self):
+        for index in range(len(self.kinds)):
+            yield KIND_NAMES[self.kinds[index]], self.value(index)
+
+    def value(self, index):
+        """Return the text of token index, as tokenize() would report it"""
+        start = self.starts[index]
+        value = self.source[start:start + self.lengths[index]]
+        kind = self.kinds[index]
+        if kind in _INTERNED_KINDS:
+            return sys.intern(value)
+        if kind == PREPROCESSOR_GROUP:
+            return value.strip()
+        return value
+
+    def kind(self, index):
+        """Return the kind name of token index"""
+        return KIND_NAMES[self.kinds[index]]
+
+    def span(self, index):
+        """Return the (start, end) source offsets of token index"""
+        start = self.starts[index]
+        return start, start + self.lengths[index]
+
+    def position(self, index):
+        """Return the (line, column) of token index"""
+        return self.lines[index], self.columns[index]
+
+    @property
+    def nbytes(self):
+        """Bytes held by the columns, excluding the source text and the
+        lines and columns not derived yet"""
+        return sum(column.itemsize * len(column) for column in
+                   (self.kinds, self.starts, self.lengths, self._lines, self._columns)
+                   if column is not None)
+
+
+class _MatchKinds(dict):
+    """SPACED_TOKEN_PATTERN match -> kind code, with the length of its token
+    (the match less the whitespace before it) kept in lengths
+
+    Built once per distinct match; most matches repeat (a keyword after a
+    space, an operator), so classifying a token is a dictionary hit.
+    """
+    __slots__ = ('lengths',)
+
+    def __init__(self):
+        super().__init__()
+        self.lengths = {}
+
+    def __missing__(self, match):
+        text = match.lstrip(scanner.WHITESPACE)
+        kind = _FIRST_KINDS.get(text[0])
+        if kind == IDENTIFIER_GROUP:
+            if '"' in text or "'" in text:
+                # A string with an encoding prefix
+                kind = STRING_GROUP
+            elif text in scanner.C_KEYWORDS:
+                kind = KEYWORD_KIND
+        elif kind is None:
+            if text.startswith(('//', '/*')):
+                kind = COMMENT_GROUP
+            else:
+                kind = KIND_CODES[scanner.kind_of(text)]
+                if kind == PREPROCESSOR_GROUP and '\n' not in match:
+                    # A '#' that does not open a line
+                    kind = UNKNOWN_GROUP
+        self[match] = kind
+        self.lengths[match] = len(text)
+        return kind
+
+
+def lex(code):
+    """Tokenize code into a TokenBuffer in one pass
+
+    The scanner's pattern runs once over the text with findall, and the
+    columns are then built by whole-list passes that run at C speed rather
+    than by Python code per token. The lines and columns are left to be
+    derived on first use.
+    """
+    tokens = TokenBuffer(code)
+    tokens.lines = tokens.columns = None
+    matches = []
+    leading = scanner.LEADING_DIRECTIVE.match(code)
+    if leading is not None:
+        matches.append(leading[0])
+    matches += scanner.SPACED_TOKEN_PATTERN.findall(code, leading.end() if leading else 0)
+    # The match at the end of the text only consumes trailing whitespace
+    while matches and not matches[-1].lstrip(scanner.WHITESPACE):
+        matches.pop()
+    if not matches:
+        return tokens
+    kinds = _MatchKinds()
+    tokens.kinds = array('B', bytes(map(kinds.__getitem__, matches)))
+    if leading is not None:
+        tokens.kinds[0] = PREPROCESSOR_GROUP
+    # Each match ends where its token does, after the skipped whitespace.
+    # array() copies a list much faster than it consumes an iterator.
+    lengths = list(map(kinds.lengths.__getitem__, matches))
+    tokens.starts = array('q', list(map(sub, accumulate(map(len, matches)), lengths)))
+    tokens.lengths = array('I', lengths)
+    return tokens
+
+
+def find_split_points(code, parts):
+    """Return up to parts - 1 sorted line starts that no token spans"""
+    splits = []
+    spans = _SPANNING_PATTERN.finditer(code)
+    span = next(spans, None)
+    for part in range(1, parts):
+        target = max(len(code) * part // parts, splits[-1] + 1 if splits else 1)
+        split = code.find('\n', target - 1) + 1
+        while split:
+            while span is not None and span.end() <= split:
+                span = next(spans, None)
+            if span is None or span.start() >= split:
+                break
+            # The line start is inside a comment, string or directive
+            split = code.find('\n', span.end() - 1) + 1
+        if not split or split >= len(code):
+            break
+        splits.append(split)
+    return splits
+
+
+def _lex_chunk(name, byte_start, byte_end, start):
+    """Lex one chunk of the shared UTF-8 source and return its kinds, global
+    starts and lengths"""
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        chunk = bytes(memory.buf[byte_start:byte_end]).decode('utf-8', 'surrogatepass')
+    finally:
+        memory.close()
+    tokens = lex(chunk)
+    # The lines and columns are derived from the global starts later on
+    return tokens.kinds, array('q', list(map(start.__add__, tokens.starts))), tokens.lengths
+
+
+def lex_parallel(code, workers=None):
+    """Tokenize code into a TokenBuffer, lexing chunks in a process pool
+
+    The result is identical to lex(code); chunks are cut at line starts
+    outside comments, strings and continued directives.
+    """
+    workers = workers or os.cpu_count() or 1
+    splits = find_split_points(code, workers) if workers > 1 and len(code) >= PARALLEL_THRESHOLD else []
+    if not splits:
+        return lex(code)
+
+    bounds = [0] + splits + [len(code)]
+    data = code.encode('utf-8', 'surrogatepass')
+    memory = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        memory.buf[:len(data)] = data
+        del data
+        jobs = []
+        byte_start = 0
+        for start, end in zip(bounds, bounds[1:]):
+            part = code[start:end]
+            byte_end = byte_start + (len(part) if part.isascii() else len(part.encode('utf-8', 'surrogatepass')))
+            jobs.append((byte_start, byte_end, start))
+            byte_start = byte_end
+
+        tokens = TokenBuffer(code)
+        tokens.lines = tokens.columns = None
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            futures = [pool.submit(_lex_chunk, memory.name, *job) for job in jobs]
+            for future in futures:
+                kinds, starts, lengths = future.result()
+                tokens.kinds.extend(kinds)
+                tokens.starts.extend(starts)
+                tokens.lengths.extend(lengths)
+        return tokens
+    finally:
+        memory.close()
+        memory.unlink()
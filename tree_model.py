@@ -0,0 +1,63 @@
+import sys
+from array import array
+from bisect import bisect_right
+
+
+class SyntaxTreeModel:
+    """An AST prepared for lazy display: children, subtree sizes and line spans
+
+    Sizes are counted once, bottom-up and without recursion, so a view can
+    show how big any subtree is without walking or rendering it.
+    """
+    def __init__(self, code, root):
+        self.root = root
+        # id(node) -> nodes in its subtree, for nodes with children; leaves are 1
+        self._sizes = {}
+        # Offset of the first character of every line
+        self._line_starts = array('q', [0])
+        position = code.find('\n')
+        while position != -1:
+            self._line_starts.append(position + 1)
+            position = code.find('\n', position + 1)
+
+        # Pre-order with each node's children, then summed in reverse so
+        # every child is counted before its parent
+        order = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            children = self.children(node)
+            if children:
+                order.append((node, children))
+                stack.extend(children)
+        sizes = self._sizes
+        for node, children in reversed(order):
+            sizes[id(node)] = 1 + sum(sizes.get(id(child), 1) for child in children)
+
+    @staticmethod
+    def children(node):
+        """Return the child nodes of node in source order"""
+        return [child for child in node.children() if child is not None]
+
+    def size(self, node):
+        """Number of nodes in the subtree rooted at node"""
+        return self._sizes.get(id(node), 1)
+
+    def has_children(self, node):
+        """Check whether node has any child nodes"""
+        return id(node) in self._sizes
+
+    def line(self, offset):
+        """1-based line of a source offset"""
+        return bisect_right(self._line_starts, offset)
+
+    def lines(self, node):
+        """Return the 1-based (first, last) lines node spans"""
+        return self.line(node.start), self.line(max(node.start, node.end - 1))
+
+    def __len__(self):
+        return self.size(self.root)
+
+    def __sizeof__(self):
+        # The AST itself is cached separately; count only what the model adds
+        return object.__sizeof__(self) + sys.getsizeof(self._sizes) + sys.getsizeof(self._line_starts)
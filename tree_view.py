@@ -0,0 +1,95 @@
+import tkinter as tk
+from tkinter import ttk
+
+# Children inserted per expansion; the rest load on demand from a "more" row
+PAGE_SIZE = 500
+
+
+class LazyTreeView:
+    """ttk.Treeview over a SyntaxTreeModel that creates rows only when their parent opens"""
+
+    def __init__(self, parent, font=None):
+        self.frame = ttk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=('nodes', 'lines'), selectmode=tk.BROWSE)
+        self.tree.heading('#0', text="Node", anchor=tk.W)
+        self.tree.heading('nodes', text="Nodes", anchor=tk.E)
+        self.tree.heading('lines', text="Lines", anchor=tk.W)
+        self.tree.column('#0', stretch=True, width=320)
+        self.tree.column('nodes', stretch=False, width=80, anchor=tk.E)
+        self.tree.column('lines', stretch=False, width=110)
+        if font is not None:
+            style = ttk.Style()
+            style.configure('Syntax.Treeview', font=font, rowheight=font.metrics('linespace') + 4)
+            self.tree.configure(style='Syntax.Treeview')
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.scrollbar.set)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        self.model = None
+        # Row id -> AST node, for rows whose children are not inserted yet
+        self._pending = {}
+        # Row id of a "more" row -> (parent row, remaining child nodes)
+        self._more = {}
+
+        self.tree.bind('<<TreeviewOpen>>', self._on_open)
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+
+    def pack(self, **options):
+        self.frame.pack(**options)
+
+    def pack_forget(self):
+        self.frame.pack_forget()
+
+    def set_model(self, model):
+        """Show a new tree with only its root's children inserted"""
+        self.clear()
+        self.model = model
+        root = self._insert('', model.root)
+        self._expand(root)
+        self.tree.item(root, open=True)
+
+    def clear(self):
+        """Drop every row"""
+        self.tree.delete(*self.tree.get_children())
+        self._pending.clear()
+        self._more.clear()
+        self.model = None
+
+    def _insert(self, parent, node):
+        """Insert one row for node, with a placeholder child if it has any"""
+        model = self.model
+        first, last = model.lines(node)
+        item = self.tree.insert(parent, tk.END, text=node.label(), values=(
+            model.size(node), str(first) if first == last else f"{first}-{last}"))
+        if model.has_children(node):
+            # The placeholder makes Tk draw the expander
+            self.tree.insert(item, tk.END, text="...")
+            self._pending[item] = node
+        return item
+
+    def _expand(self, item):
+        """Replace the placeholder under item by its first page of children"""
+        node = self._pending.pop(item, None)
+        if node is None:
+            return
+        self.tree.delete(*self.tree.get_children(item))
+        self._insert_page(item, self.model.children(node))
+
+    def _insert_page(self, item, children):
+        for child in children[:PAGE_SIZE]:
+            self._insert(item, child)
+        remaining = children[PAGE_SIZE:]
+        if remaining:
+            more = self.tree.insert(item, tk.END, text=f"... {len(remaining)} more")
+            self._more[more] = (item, remaining)
+
+    def _on_open(self, event):
+        self._expand(self.tree.focus())
+
+    def _on_select(self, event):
+        for item in self.tree.selection():
+            page = self._more.pop(item, None)
+            if page is not None:
+                self.tree.delete(item)
+                self._insert_page(*page)
@@ -0,0 +1,309 @@
+import token_buffer
+from scanner import (
+    COMMENT_GROUP, IDENTIFIER_GROUP, OPERATOR_GROUP, PREPROCESSOR_GROUP,
+    STRING_GROUP
+)
+from token_buffer import KEYWORD_KIND as KEYWORD
+
+# Types whose declarations the semicolon check recognizes
+DECLARATION_TYPES = frozenset({'int', 'char', 'float', 'double', 'void'})
+
+# Keywords whose condition must be a parenthesized group
+CONDITION_KEYWORDS = frozenset({'if', 'for', 'while'})
+
+# Keywords that make a line a control structure rather than a statement
+CONTROL_KEYWORDS = frozenset({'if', 'for', 'while', 'do', 'switch'})
+
+# Keywords that open a line the semicolon check ignores
+LABEL_KEYWORDS = frozenset({'switch', 'case', 'default'})
+
+# Calls the semicolon check treats as statements
+STATEMENT_CALLS = frozenset({'printf', 'scanf'})
+
+# Operators a line may end with and still be a complete statement
+_CLOSING_OPERATORS = frozenset({')', ']', '++', '--'})
+
+# Distinct diagnostics collected before validation stops early
+DEFAULT_MAX_ERRORS = 100
+
+MISSING_MAIN = "Missing main function"
+UNEXPECTED_BRACE = "Unexpected closing brace '}'"
+UNEXPECTED_PARENTHESIS = "Unexpected closing parenthesis ')'"
+UNCLOSED_BRACE = "Unclosed brace '{'"
+
+# Messages one mistake repeats on the lines after it: a missing '{' or '('
+# makes every later closer unexpected, and a cut-off file leaves each
+# enclosing brace open. Only these fold; other repeats, such as a missing
+# semicolon on several lines, are independent errors and stay separate.
+CASCADING_MESSAGES = frozenset({UNEXPECTED_BRACE, UNEXPECTED_PARENTHESIS, UNCLOSED_BRACE})
+
+
+class Diagnostic:
+    """One syntax error: a message at a line and column, without source text
+
+    A run of one of the CASCADING_MESSAGES on consecutive lines is folded
+    into its first diagnostic; repeats counts the folded ones up to last_line.
+    """
+    __slots__ = ('line', 'position', 'message', 'repeats', 'last_line')
+
+    def __init__(self, line, position, message):
+        self.line = line
+        # 0-based column of the error within its line
+        self.position = position
+        self.message = message
+        self.repeats = 0
+        self.last_line = line
+
+    def __repr__(self):
+        return f"Diagnostic({self.line}, {self.position}, {self.message!r})"
+
+    def __str__(self):
+        text = f"Line {self.line}: {self.message}"
+        if self.repeats:
+            text += f" (and {self.repeats} more through line {self.last_line})"
+        return text
+
+    def as_dict(self, code=None):
+        """Return the diagnostic as a JSON-serializable dict, with its line if code is given"""
+        result = {
+            'line': self.line,
+            'position': self.position,
+            'message': self.message,
+            'repeats': self.repeats,
+            'last_line': self.last_line,
+        }
+        if code is not None:
+            result['code'] = next(snippets(code, [self]))[1]
+        return result
+
+
+class Diagnostics(list):
+    """Diagnostics of one source, sorted by position"""
+    # Cap the validation ran under, and whether it stopped there early
+    limit = None
+    truncated = False
+
+
+def snippets(code, diagnostics):
+    """Yield (diagnostic, source line) for diagnostics sorted by line
+
+    Lines are sliced on demand while walking forward through code once.
+    """
+    line, line_start = 1, 0
+    for diagnostic in diagnostics:
+        if diagnostic.line < line:
+            line, line_start = 1, 0
+        while line < diagnostic.line:
+            next_start = code.find('\n', line_start) + 1
+            if not next_start:
+                break
+            line += 1
+            line_start = next_start
+        line_end = code.find('\n', line_start)
+        yield diagnostic, code[line_start:] if line_end == -1 else code[line_start:line_end]
+
+
+def _string_closed(value):
+    """Check whether a STRING token ends with its own, unescaped quote"""
+    body = value.lstrip('LuU8')
+    if len(body) < 2 or body[-1] != body[0]:
+        return False
+    # The final quote is escaped if an odd number of backslashes precede it
+    backslashes = len(body) - 1 - len(body[:-1].rstrip('\\'))
+    return backslashes % 2 == 0
+
+
+class _Line:
+    """Facts about one source line collected while its tokens stream past"""
+    __slots__ = ('number', 'start', 'first', 'second', 'last', 'last_end',
+                 'control', 'assigns', 'parens')
+
+    def __init__(self, number, start):
+        self.number = number
+        self.start = start
+        # (kind code, value) of the first, second and last token
+        self.first = None
+        self.second = None
+        self.last = None
+        self.last_end = start
+        self.control = False
+        self.assigns = False
+        self.parens = 0
+
+
+def iter_diagnostics(code, tokens=None):
+    """Yield syntax errors as the token stream is scanned, in scan order
+
+    The scan only advances as far as the consumer reads, so stopping
+    early skips the rest of the file. Unclosed braces, parentheses and a
+    missing main function are only known, and yielded, at the end.
+    """
+    if tokens is None:
+        tokens = token_buffer.lex(code)
+    # Errors reported by the current token, handed out before the next one
+    found = []
+
+    def report(line, position, message):
+        found.append(Diagnostic(line.number, position - line.start, message))
+
+    def check_statement(line):
+        """Flag a statement line that does not end with a semicolon"""
+        first, second, last = line.first, line.second, line.last
+        if first is None or first[0] == PREPROCESSOR_GROUP:
+            return
+        if first[0] == KEYWORD and first[1] in LABEL_KEYWORDS:
+            return
+        if last[0] == OPERATOR_GROUP and last[1] not in _CLOSING_OPERATORS:
+            # Ends with ';', a brace, or an operator the next line continues
+            return
+        if line.control or line.parens != 0:
+            return
+        is_declaration = (first[0] == KEYWORD and first[1] in DECLARATION_TYPES
+                          and second is not None and second[0] == IDENTIFIER_GROUP)
+        if is_declaration and last[1] == ')' and not line.assigns:
+            # Function declaration or definition header
+            return
+        if is_declaration and line.assigns:
+            message = "Missing semicolon in variable declaration"
+        elif (is_declaration
+              or (first[0] == IDENTIFIER_GROUP and first[1] in STATEMENT_CALLS)
+              or first == (KEYWORD, 'return')
+              or second == (OPERATOR_GROUP, '=')):
+            message = "Missing semicolon ';'"
+        else:
+            return
+        report(line, line.last_end, message)
+
+    has_main = False
+    brace_stack = []
+    paren_stack = []
+    # Keyword still waiting for its '(', and the open condition group
+    pending_keyword = None
+    open_condition = None
+
+    line = _Line(1, 0)
+    # The two tokens before the current one
+    previous = before_previous = None
+
+    columns = zip(tokens.kinds, tokens.starts, tokens.lengths, tokens.lines, tokens.columns)
+    for group, start, length, number, column in columns:
+        if found:
+            yield from found
+            found.clear()
+        end = start + length
+        if number != line.number:
+            check_statement(line)
+            line = _Line(number, start - column)
+
+        if group == COMMENT_GROUP:
+            if code.startswith('/*', start) and (end - start < 4 or not code.startswith('*/', end - 2)):
+                report(line, start, "Unclosed comment '/*'")
+            continue
+
+        value = code[start:end]
+        token = (group, value)
+        if line.first is None:
+            line.first = token
+        elif line.second is None:
+            line.second = token
+        line.last = token
+        line.last_end = end
+
+        if pending_keyword is not None:
+            keyword, keyword_line, keyword_end = pending_keyword
+            pending_keyword = None
+            if token != (OPERATOR_GROUP, '('):
+                report(keyword_line, keyword_end, f"Invalid {keyword} statement syntax")
+
+        if group == OPERATOR_GROUP:
+            if value == '(':
+                paren_stack.append((line, start))
+                line.parens += 1
+                if previous is not None and previous[0] == KEYWORD:
+                    if previous[1] in CONDITION_KEYWORDS and open_condition is None:
+                        open_condition = (previous[1], len(paren_stack), line, start)
+                elif previous == (IDENTIFIER_GROUP, 'main') and before_previous == (KEYWORD, 'int'):
+                    has_main = True
+            elif value == ')':
+                line.parens -= 1
+                if not paren_stack:
+                    report(line, start, UNEXPECTED_PARENTHESIS)
+                else:
+                    if open_condition is not None and open_condition[1] == len(paren_stack):
+                        open_condition = None
+                    paren_stack.pop()
+            elif value == '{' or value == '}':
+                if open_condition is not None:
+                    keyword, _, keyword_line, keyword_start = open_condition
+                    report(keyword_line, keyword_start, f"Unbalanced parentheses in {keyword} statement")
+                    open_condition = None
+                if value == '{':
+                    brace_stack.append((line, start))
+                elif not brace_stack:
+                    report(line, start, UNEXPECTED_BRACE)
+                else:
+                    brace_stack.pop()
+            elif value == '=':
+                line.assigns = True
+            elif value[0] == '/' and previous == (OPERATOR_GROUP, '*') and code[start - 1] == '*':
+                report(line, start - 1, "Unexpected comment end '*/'")
+        elif group == KEYWORD:
+            if value in CONTROL_KEYWORDS:
+                line.control = True
+                if value in CONDITION_KEYWORDS:
+                    pending_keyword = (value, line, end)
+        elif group == STRING_GROUP and not _string_closed(value):
+            report(line, start, f"Unclosed string (started with {value.lstrip('LuU8')[0]})")
+
+        before_previous = previous
+        previous = token
+
+    check_statement(line)
+    if pending_keyword is not None:
+        keyword, keyword_line, keyword_end = pending_keyword
+        report(keyword_line, keyword_end, f"Invalid {keyword} statement syntax")
+
+    # Report unclosed braces and parentheses
+    for open_line, position in brace_stack:
+        report(open_line, position, UNCLOSED_BRACE)
+    for open_line, position in paren_stack:
+        report(open_line, position, "Unclosed parenthesis '('")
+
+    yield from found
+    if not has_main:
+        yield Diagnostic(1, 0, MISSING_MAIN)
+
+
+def validate(code, tokens=None, max_errors=DEFAULT_MAX_ERRORS):
+    """Validate basic C syntax and return Diagnostics sorted by position
+
+    Repeats of a cascading message on consecutive lines are folded into
+    one diagnostic. Once max_errors distinct diagnostics are collected the
+    scan stops, and the end-of-file checks are skipped as unreliable.
+    """
+    errors = Diagnostics()
+    errors.limit = max_errors
+    missing_main = None
+    # Cascading message -> its latest diagnostic, which a repeat on the
+    # next line extends
+    latest = {}
+    for diagnostic in iter_diagnostics(code, tokens):
+        if diagnostic.message == MISSING_MAIN:
+            missing_main = diagnostic
+            continue
+        previous = latest.get(diagnostic.message)
+        if previous is not None and previous.line <= diagnostic.line <= previous.last_line + 1:
+            previous.repeats += 1
+            previous.last_line = max(previous.last_line, diagnostic.line)
+            continue
+        if max_errors is not None and len(errors) >= max_errors:
+            errors.truncated = True
+            break
+        if diagnostic.message in CASCADING_MESSAGES:
+            latest[diagnostic.message] = diagnostic
+        errors.append(diagnostic)
+
+    errors.sort(key=lambda error: (error.line, error.position))
+    if missing_main is not None:
+        errors.insert(0, missing_main)
+    return errors
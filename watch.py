@@ -0,0 +1,303 @@
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+
+from batch import C_EXTENSIONS, collect_files, format_error, read_source
+from cache import AnalysisCache, content_key
+from engine import AnalysisEngine
+
+# Quiet time that ends a burst of saves before files are re-analyzed
+DEFAULT_DEBOUNCE = 0.05
+
+# How often the polling watcher rescans the tree
+DEFAULT_INTERVAL = 0.5
+
+# inotify event bits (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+               | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+
+# struct inotify_event header: wd, mask, cookie, len
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def _is_source(path):
+    return path.endswith(C_EXTENSIONS)
+
+
+class PollingWatcher:
+    """Finds changed sources by rescanning the tree's stat signatures"""
+
+    def __init__(self, root, interval=DEFAULT_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self._signatures = self._scan()
+
+    def _scan(self):
+        signatures = {}
+        for path in collect_files([self.root]):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            signatures[path] = (stat.st_mtime_ns, stat.st_size)
+        return signatures
+
+    def wait(self, timeout=None):
+        """Return the paths changed within timeout seconds (None: until any change)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = self.interval if deadline is None else min(self.interval, deadline - time.monotonic())
+            if remaining > 0:
+                time.sleep(remaining)
+            signatures = self._scan()
+            changed = {path for path in signatures.keys() | self._signatures.keys()
+                       if signatures.get(path) != self._signatures.get(path)}
+            self._signatures = signatures
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Finds changed sources from Linux inotify events on every directory of the tree"""
+
+    def __init__(self, root):
+        self.root = root
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # watch descriptor -> directory
+        self._directories = {}
+        self._add_tree(root)
+
+    def _add_tree(self, directory):
+        """Watch directory and its subdirectories; return the sources inside"""
+        sources = set()
+        for dirpath, _, filenames in os.walk(directory):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), _WATCH_MASK)
+            if wd >= 0:
+                self._directories[wd] = dirpath
+            sources.update(os.path.join(dirpath, name) for name in filenames if _is_source(name))
+        return sources
+
+    def _remove_tree(self, directory):
+        """Stop watching directory and the directories under it"""
+        prefix = os.path.join(directory, '')
+        for wd, path in list(self._directories.items()):
+            if path == directory or path.startswith(prefix):
+                del self._directories[wd]
+                # Fails harmlessly if the kernel already dropped the watch
+                self._libc.inotify_rm_watch(self._fd, wd)
+
+    def wait(self, timeout=None):
+        """Return the paths changed within timeout seconds (None: until any change)
+
+        A directory moved within the tree is watched again under its new
+        path; one moved out of the tree or deleted is no longer watched,
+        and it is reported so the sources known under it can be dropped.
+        """
+        changed = set()
+        while not changed:
+            ready, _, _ = select.select([self._fd], [], [], timeout)
+            if not ready:
+                return changed
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    # Events were dropped; report every source as changed
+                    changed.update(collect_files([self.root]))
+                    continue
+                directory = self._directories.get(wd)
+                if directory is None or mask & IN_IGNORED:
+                    continue
+                if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    # A directory moved within the tree was already watched
+                    # again under its new path by the IN_MOVED_TO event of
+                    # its parent; otherwise it left the tree or is gone
+                    if mask & IN_DELETE_SELF or not os.path.isdir(directory):
+                        self._remove_tree(directory)
+                        changed.add(directory)
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        changed.update(self._add_tree(path))
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        # A moved directory keeps its watches, which would
+                        # report it under this stale path
+                        self._remove_tree(path)
+                        # The tree expands a directory to the sources it held
+                        changed.add(path)
+                elif _is_source(name):
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def make_watcher(root, interval=DEFAULT_INTERVAL, use_inotify=True):
+    """Return an inotify watcher where available, else a polling one"""
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(root, interval)
+
+
+class SourceTree:
+    """Last known state and diagnostics of every source under a root"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        # path -> (mtime_ns, size, content digest, diagnostics)
+        self.files = {}
+
+    def expand(self, paths):
+        """Replace removed directories in paths by the known sources under them"""
+        expanded = set()
+        for path in paths:
+            if path in self.files or _is_source(path):
+                expanded.add(path)
+            else:
+                prefix = os.path.join(path, '')
+                expanded.update(known for known in self.files if known.startswith(prefix))
+        return expanded
+
+    def refresh(self, path):
+        """Re-analyze path if it changed and return its event dict, or None"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            if self.files.pop(path, None) is None:
+                return None
+            return {'path': path, 'event': 'removed'}
+
+        known = self.files.get(path)
+        if known is not None and known[:2] == (stat.st_mtime_ns, stat.st_size):
+            return None
+        started = time.perf_counter()
+        code = read_source(path)
+        digest = content_key(code)
+        if known is not None and known[2] == digest:
+            # Touched or saved without changes
+            self.files[path] = (stat.st_mtime_ns, stat.st_size, digest, known[3])
+            return None
+
+        errors = self.engine.diagnostics(code)
+        tokens = self.engine.token_buffer(code)
+        self.files[path] = (stat.st_mtime_ns, stat.st_size, digest, errors)
+        return {
+            'path': path,
+            'event': 'added' if known is None else 'changed',
+            'errors': [error.as_dict() for error in errors],
+            'tokens': len(tokens),
+            'elapsed_ms': (time.perf_counter() - started) * 1000,
+        }
+
+
+def format_event(event):
+    """Render one watch event as human-readable text"""
+    stamp = time.strftime('%H:%M:%S')
+    if event['event'] == 'removed':
+        return f"[{stamp}] {event['path']}: removed"
+    errors = event['errors']
+    timing = f"{event['tokens']} tokens, {event['elapsed_ms']:.1f} ms"
+    if not errors:
+        return f"[{stamp}] {event['path']}: OK ({timing})"
+    lines = [f"[{stamp}] {event['path']}: {len(errors)} syntax error(s) ({timing})"]
+    for error in errors:
+        lines.append(f"  {format_error(error)}")
+    return "\n".join(lines)
+
+
+def watch(root, emit, debounce=DEFAULT_DEBOUNCE, interval=DEFAULT_INTERVAL, use_inotify=True):
+    """Analyze every source under root, then re-analyze sources as they change"""
+    tree = SourceTree(AnalysisEngine(cache=AnalysisCache()))
+    watcher = make_watcher(root, interval, use_inotify)
+    try:
+        for path in collect_files([root]):
+            event = tree.refresh(path)
+            if event is not None:
+                emit(event)
+        while True:
+            changed = watcher.wait()
+            # Let a burst of saves settle before analyzing anything
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed |= more
+            for path in sorted(tree.expand(changed)):
+                event = tree.refresh(path)
+                if event is not None:
+                    emit(event)
+    finally:
+        watcher.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-analyze C sources in a tree as they change")
+    parser.add_argument('root', help="directory to watch")
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help="seconds of quiet that end a burst of saves")
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help="rescan interval of the polling fallback")
+    parser.add_argument('--poll', action='store_true',
+                        help="poll even where inotify is available")
+    parser.add_argument('--json', action='store_true',
+                        help="emit one JSON object per event")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.root):
+        print(f"Not a directory: {args.root}", file=sys.stderr)
+        return 2
+
+    def emit(event):
+        if args.json:
+            print(json.dumps(event), flush=True)
+        else:
+            print(format_event(event), flush=True)
+
+    try:
+        watch(args.root, emit, args.debounce, args.interval, not args.poll)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import queue
+import threading
+
+
+class Cancelled(Exception):
+    """Raised inside a job when its run has been superseded or cancelled"""
+
+
+class AnalysisRunner:
+    """Runs one analysis at a time on a worker thread and hands results back to Tk"""
+
+    def __init__(self):
+        # (generation, kind, payload) messages posted by worker threads
+        self._queue = queue.Queue()
+        self._generation = 0
+        self._cancel_event = None
+
+    @property
+    def running(self):
+        return self._cancel_event is not None
+
+    def start(self, job, *args):
+        """Cancel the current run and call job(*args, progress=...) on a worker thread"""
+        self.cancel()
+        generation = self._generation
+        cancel_event = threading.Event()
+        self._cancel_event = cancel_event
+
+        def progress(message):
+            # Doubles as the job's cancellation checkpoint
+            if cancel_event.is_set():
+                raise Cancelled()
+            self._queue.put((generation, 'progress', message))
+
+        def run():
+            try:
+                result = job(*args, progress=progress)
+            except Cancelled:
+                return
+            except Exception as e:
+                self._queue.put((generation, 'error', e))
+            else:
+                self._queue.put((generation, 'done', result))
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def cancel(self):
+        """Stop the current run; anything it still posts is discarded"""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+            self._cancel_event = None
+        self._generation += 1
+
+    def poll(self):
+        """Return the (kind, payload) messages of the current run posted so far"""
+        messages = []
+        while True:
+            try:
+                generation, kind, payload = self._queue.get_nowait()
+            except queue.Empty:
+                return messages
+            if generation != self._generation:
+                continue
+            if kind != 'progress':
+                self._cancel_event = None
+            messages.append((kind, payload))